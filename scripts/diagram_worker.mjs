@@ -0,0 +1,116 @@
+// Persistent Mermaid / KaTeX renderer for the diagram pre-render cache.
+//
+// Mermaid diagrams are rendered to SVG in one headless Chromium page that
+// stays open (launched on the first diagram); KaTeX formulas are rendered
+// in-process. The worker exits when its stdin closes.
+//
+// Usage: node scripts/diagram_worker.mjs
+//
+// Protocol (one JSON object per line on stdin / stdout):
+//   { id, type: 'mermaid', source, render_id, theme? } -> { id, ok: true, output: '<svg id="<render_id>" ...>' }
+//   { id, type: 'math', source, display? }    -> { id, ok: true, output: '<span class="katex-display">...' }
+// Failures answer { id, ok: false, kind, error }, where kind is 'syntax' for
+// errors in the diagram itself and 'internal' for everything else.
+
+import fs from 'node:fs'
+import path from 'node:path'
+import process from 'node:process'
+import readline from 'node:readline'
+
+const executablePath = process.env.PLAYWRIGHT_CHROMIUM_EXECUTABLE_PATH || undefined
+const mermaidScript = path.resolve(process.cwd(), 'node_modules', 'mermaid', 'dist', 'mermaid.min.js')
+
+class SyntaxFailure extends Error {}
+
+let pagePromise = null
+function mermaidPage() {
+  pagePromise ??= (async () => {
+    if (!fs.existsSync(mermaidScript))
+      throw new Error(`mermaid is not installed (${mermaidScript}); run npm install`)
+    const { chromium } = await import('playwright-chromium')
+    const browser = await chromium.launch({
+      executablePath,
+      args: ['--no-sandbox', '--disable-dev-shm-usage'],
+    })
+    const page = await browser.newPage()
+    await page.setContent('<!doctype html><html><body></body></html>')
+    await page.addScriptTag({ path: mermaidScript })
+    return page
+  })()
+  pagePromise.catch(() => (pagePromise = null))
+  return pagePromise
+}
+
+async function renderMermaid({ render_id: renderId, source, theme }) {
+  const page = await mermaidPage()
+  const result = await page.evaluate(async ({ renderId, source, theme }) => {
+    window.mermaid.initialize({ startOnLoad: false, theme: theme || 'default' })
+    try {
+      await window.mermaid.parse(source)
+    }
+    catch (err) {
+      return { syntax: String(err && err.message || err) }
+    }
+    try {
+      const { svg } = await window.mermaid.render(renderId, source)
+      return { svg }
+    }
+    finally {
+      document.querySelectorAll(`#${renderId}, #d${renderId}`).forEach(node => node.remove())
+    }
+  }, { renderId, source, theme })
+  if (result.syntax)
+    throw new SyntaxFailure(result.syntax)
+  return result.svg
+}
+
+let katex = null
+async function renderMath({ source, display }) {
+  katex ??= (await import('katex')).default
+  try {
+    return katex.renderToString(source, { displayMode: display !== false, throwOnError: true })
+  }
+  catch (err) {
+    if (err instanceof katex.ParseError)
+      throw new SyntaxFailure(err.message)
+    throw err
+  }
+}
+
+async function handle(request) {
+  try {
+    if (request.type === 'mermaid')
+      return { id: request.id, ok: true, output: await renderMermaid(request) }
+    if (request.type === 'math')
+      return { id: request.id, ok: true, output: await renderMath(request) }
+    return { id: request.id, ok: false, kind: 'internal', error: `unknown type: ${request.type}` }
+  }
+  catch (err) {
+    const kind = err instanceof SyntaxFailure ? 'syntax' : 'internal'
+    return { id: request.id, ok: false, kind, error: String(err && err.message || err) }
+  }
+}
+
+// Requests share one page, so they are handled one at a time.
+let queue = Promise.resolve()
+const lines = readline.createInterface({ input: process.stdin })
+lines.on('line', (line) => {
+  if (!line.trim())
+    return
+  queue = queue.then(async () => {
+    let response
+    try {
+      response = await handle(JSON.parse(line))
+    }
+    catch (err) {
+      response = { id: null, ok: false, kind: 'internal', error: String(err && err.message || err) }
+    }
+    process.stdout.write(`${JSON.stringify(response)}\n`)
+  })
+})
+lines.on('close', async () => {
+  await queue
+  if (pagePromise)
+    await (await pagePromise.catch(() => null))?.context().browser()?.close().catch(() => {})
+  process.exit(0)
+})
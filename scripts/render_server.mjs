@@ -0,0 +1,243 @@
+// Long-lived Slidev render server.
+//
+// Keeps one Vite/Slidev dev server and one headless Chromium warm so that
+// re-rendering a deck only costs page navigation + screenshots.
+//
+// The deck is served from an entry file next to it
+// (`<deck dir>/.slidev-render-<control port>.md`), so relative assets, `src:`
+// imports and the deck's own components/ and public/ resolve exactly as they
+// do for `slidev export`. Vite restarts only when the deck directory changes.
+//
+// Usage: node scripts/render_server.mjs --control-port 38211 --entry .slidev-render/slides.md
+//
+// Control API (JSON over HTTP on 127.0.0.1:<control-port>):
+//   GET  /health    -> { ok, pid, vitePort }
+//   POST /render    { markdown_path, output_dir, range?, timeout?, wait? } -> { files }
+//   POST /shutdown  -> { ok }
+
+import http from 'node:http'
+import fs from 'node:fs/promises'
+import path from 'node:path'
+import process from 'node:process'
+import { createServer, resolveOptions } from '@slidev/cli'
+import { chromium } from 'playwright-chromium'
+
+function parseArgs(argv) {
+  const args = {}
+  for (let i = 0; i < argv.length; i++) {
+    const key = argv[i]
+    if (key.startsWith('--'))
+      args[key.slice(2)] = argv[i + 1]
+  }
+  return args
+}
+
+const args = parseArgs(process.argv.slice(2))
+const controlPort = Number(args['control-port'] || 38211)
+const homeEntry = path.resolve(args.entry || '.slidev-render/slides.md')
+const stateFile = path.resolve(args['state-file'] || path.join(path.dirname(homeEntry), 'server.json'))
+const executablePath = process.env.PLAYWRIGHT_CHROMIUM_EXECUTABLE_PATH || undefined
+
+await fs.mkdir(path.dirname(homeEntry), { recursive: true })
+try {
+  await fs.access(homeEntry)
+}
+catch {
+  await fs.writeFile(homeEntry, '---\ntheme: default\n---\n\n# Slidev render server\n', 'utf-8')
+}
+
+let entry = null
+let vite = null
+let vitePort = null
+
+async function startVite(entryPath, port) {
+  const options = await resolveOptions({ entry: entryPath }, 'dev')
+  vite = await createServer(options, {
+    server: { port: port || undefined, strictPort: false, host: '127.0.0.1' },
+    logLevel: 'warn',
+    clearScreen: false,
+  })
+  await vite.listen()
+  vitePort = vite.config.server.port
+  entry = entryPath
+}
+
+function writeState() {
+  return fs.writeFile(stateFile, JSON.stringify({ pid: process.pid, controlPort, vitePort, entry }), 'utf-8')
+}
+
+await startVite(homeEntry, Number(args['vite-port'] || 0))
+
+const browser = await chromium.launch({
+  executablePath,
+  args: ['--no-sandbox', '--disable-dev-shm-usage'],
+})
+const context = await browser.newContext({
+  viewport: { width: 1920, height: 1080 },
+  deviceScaleFactor: 1,
+})
+
+// Renders share one entry file, so they are serialised through this chain.
+let queue = Promise.resolve()
+
+function waitForEntryChange(timeoutMs) {
+  return new Promise((resolve) => {
+    const timer = setTimeout(done, timeoutMs)
+    function done() {
+      clearTimeout(timer)
+      vite.watcher.off('change', onChange)
+      resolve()
+    }
+    function onChange(file) {
+      if (path.resolve(file) === entry)
+        done()
+    }
+    vite.watcher.on('change', onChange)
+  })
+}
+
+// Serve the deck from an entry file in its own directory, restarting Vite when that directory changes.
+async function useDeckDir(markdownPath, content) {
+  const target = path.join(path.dirname(markdownPath), `.slidev-render-${controlPort}.md`)
+  if (target === entry)
+    return
+  await fs.writeFile(target, content, 'utf-8')
+  const previous = entry
+  await vite.close().catch(() => {})
+  if (previous !== homeEntry)
+    await fs.rm(previous, { force: true })
+  await startVite(target, 0)
+  await writeState()
+}
+
+async function loadEntry(markdownPath) {
+  const next = await fs.readFile(markdownPath, 'utf-8')
+  await useDeckDir(path.resolve(markdownPath), next)
+  const current = await fs.readFile(entry, 'utf-8').catch(() => '')
+  if (next === current)
+    return
+  const changed = waitForEntryChange(3000)
+  await fs.writeFile(entry, next, 'utf-8')
+  await changed
+  // Give the Slidev plugin a moment to re-parse the deck before navigating.
+  await new Promise(r => setTimeout(r, 300))
+}
+
+async function screenshotPage(page, no, outputDir, digits, timeout, wait) {
+  await page.goto(`http://127.0.0.1:${vitePort}/${no}?print`, { waitUntil: 'networkidle', timeout })
+  await page.locator('#slide-content').waitFor({ timeout })
+  await page.waitForTimeout(wait)
+  const file = path.join(outputDir, `${String(no).padStart(digits, '0')}.png`)
+  await page.locator('#slide-content').screenshot({ path: file, timeout })
+  return file
+}
+
+async function render({ markdown_path, output_dir, range, timeout = 60000, wait = 500, concurrency = 1 }) {
+  await loadEntry(markdown_path)
+  await fs.mkdir(output_dir, { recursive: true })
+
+  const probe = await context.newPage()
+  let total
+  try {
+    await probe.goto(`http://127.0.0.1:${vitePort}/1?print`, { waitUntil: 'networkidle', timeout })
+    total = await probe.evaluate(() => window.__slidev__?.nav?.total ?? 0)
+  }
+  finally {
+    await probe.close()
+  }
+  if (!total)
+    throw new Error('Unable to determine slide count from the Slidev app')
+
+  const pages = (range && range.length ? range : Array.from({ length: total }, (_, i) => i + 1))
+    .filter(no => no >= 1 && no <= total)
+  const digits = String(total).length
+  const files = new Array(pages.length)
+  const failures = []
+
+  let cursor = 0
+  async function worker() {
+    const page = await context.newPage()
+    try {
+      while (cursor < pages.length) {
+        const index = cursor++
+        const no = pages[index]
+        try {
+          files[index] = await screenshotPage(page, no, output_dir, digits, timeout, wait)
+        }
+        catch (err) {
+          failures.push({ slide: no, error: String(err && err.message || err) })
+        }
+      }
+    }
+    finally {
+      await page.close()
+    }
+  }
+  const workers = Math.max(1, Math.min(Number(concurrency) || 1, pages.length))
+  await Promise.all(Array.from({ length: workers }, worker))
+
+  if (failures.length) {
+    const error = new Error(failures.map(f => `slide ${f.slide}: ${f.error}`).join('\n'))
+    error.failures = failures
+    throw error
+  }
+  return { files, total }
+}
+
+function readBody(req) {
+  return new Promise((resolve, reject) => {
+    let data = ''
+    req.setEncoding('utf-8')
+    req.on('data', chunk => (data += chunk))
+    req.on('end', () => resolve(data ? JSON.parse(data) : {}))
+    req.on('error', reject)
+  })
+}
+
+function send(res, status, payload) {
+  res.writeHead(status, { 'Content-Type': 'application/json' })
+  res.end(JSON.stringify(payload))
+}
+
+async function shutdown() {
+  await browser.close().catch(() => {})
+  await vite.close().catch(() => {})
+  if (entry !== homeEntry)
+    await fs.rm(entry, { force: true })
+  await fs.rm(stateFile, { force: true })
+  process.exit(0)
+}
+
+const control = http.createServer(async (req, res) => {
+  try {
+    if (req.method === 'GET' && req.url === '/health')
+      return send(res, 200, { ok: true, pid: process.pid, vitePort })
+    if (req.method === 'POST' && req.url === '/render') {
+      const body = await readBody(req)
+      const job = queue.then(() => render(body))
+      queue = job.catch(() => {})
+      try {
+        return send(res, 200, await job)
+      }
+      catch (err) {
+        return send(res, 500, { error: String(err && err.message || err), failures: err.failures || [] })
+      }
+    }
+    if (req.method === 'POST' && req.url === '/shutdown') {
+      send(res, 200, { ok: true })
+      return shutdown()
+    }
+    send(res, 404, { error: 'not found' })
+  }
+  catch (err) {
+    send(res, 500, { error: String(err && err.message || err) })
+  }
+})
+
+control.listen(controlPort, '127.0.0.1', async () => {
+  await writeState()
+  console.log(`render server ready on ${controlPort} (vite ${vitePort})`)
+})
+
+process.on('SIGTERM', shutdown)
+process.on('SIGINT', shutdown)
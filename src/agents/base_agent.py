@@ -1,7 +1,72 @@
+import asyncio
+import json
 import os
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from utils.llm_client import LLMClient, LLMResponse
+from utils.contact_sheet import ContactSheetLayout, build_contact_sheets
+from utils import tracing
+from utils.history import REVIEW, HistoryManager
+from utils.llm_client import LLMClient, LLMResponse, LLMStream
+from utils.tokens import estimate_tokens
+
+
+def review_windows(total: int, batch_size: int, pages: Optional[List[int]] = None) -> List[List[int]]:
+    """Split slides 1..total (or just `pages`) into review windows of `batch_size` body slides.
+
+    When the slides are split, every window also carries the title slide and
+    the ending slide so each subset is judged in the context of the whole deck.
+    """
+    selected = sorted({page for page in pages if 1 <= page <= total}) if pages is not None else list(range(1, total + 1))
+    if not selected:
+        return []
+    if batch_size <= 0 or len(selected) <= batch_size + 2:
+        return [selected]
+    body = [page for page in selected if page not in (1, total)]
+    return [[1] + body[start : start + batch_size] + [total] for start in range(0, len(body), batch_size)]
+
+
+def merge_window_feedback(
+    results: List[Tuple[List[int], List[Dict]]], total: int, pages: Optional[List[int]] = None
+) -> List[Dict]:
+    """Map window-local `page_index` values to global slide numbers and merge the feedback.
+
+    The title slide is judged by the first window and the ending slide by the
+    last, so the context copies in the other windows do not repeat issues.
+    With `pages`, feedback on context slides outside that selection is dropped.
+    """
+    merged: List[Dict] = []
+    seen = set()
+    last_window = len(results) - 1
+    for window_idx, (window, items) in enumerate(results):
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            local = item.get("page_index")
+            if isinstance(local, str) and local.strip().isdigit():
+                local = int(local)
+            item = dict(item)
+            if isinstance(local, int) and 1 <= local <= len(window):
+                page: Optional[int] = window[local - 1]
+                item["page_index"] = page
+            else:
+                page = None
+            if len(results) > 1 and page == 1 and window_idx != 0:
+                continue
+            if len(results) > 1 and page == total and window_idx != last_window:
+                continue
+            if pages is not None and page is not None and page not in pages:
+                continue
+            key = (
+                page,
+                str(item.get("category", "")).strip().lower(),
+                " ".join(str(item.get("issue", "")).lower().split()),
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(item)
+    merged.sort(key=lambda item: item["page_index"] if isinstance(item.get("page_index"), int) else total + 1)
+    return merged
 
 
 class BaseAgent:
@@ -12,33 +77,94 @@ class BaseAgent:
         base_url = os.getenv("LLM_BASE_URL")
         self.llm_client = LLMClient(provider=provider, base_url=base_url)
         self.system_prompt: str = ""
+        # Stable source material appended to the system prompt (see `set_context`).
+        self.context: str = ""
         self.history: List[Dict[str, Any]] = []
         self.last_response: Optional[str] = None
+        self.last_response_usage: Optional[Dict[str, Any]] = None
+        self.last_response_cached = False
+        self.last_response_ttft: Optional[float] = None
+        self.last_image_stats: Optional[Dict[str, int]] = None
+        self.last_prompt_stats: Optional[Dict[str, int]] = None
+        self.history_manager = HistoryManager()
+        # When set, review images are tiled into labeled contact sheets.
+        self.contact_sheet: Optional[ContactSheetLayout] = ContactSheetLayout.from_env()
 
     def set_system_prompt(self, prompt: str) -> None:
         self.system_prompt = prompt
 
+    def set_context(self, context: str) -> None:
+        """Attach source material that every request of this agent refers to.
+
+        It is sent right after the system prompt so that the system prompt,
+        rules and source form a byte-identical prefix across calls, which
+        providers with prompt caching bill and serve faster.
+        """
+        self.context = context
+
+    def _system_message(self) -> str:
+        if not self.context:
+            return self.system_prompt
+        return f"{self.system_prompt}\n\n## Source Content\n{self.context}"
+
     def reset_history(self) -> None:
         self.history = []
 
+    def export_state(self) -> Dict[str, Any]:
+        """Conversation state needed to continue this agent in another process (JSON-serializable)."""
+        return {
+            "context": self.context,
+            "history": self.history,
+            "last_response": self.last_response,
+            "last_response_usage": self.last_response_usage,
+            "last_response_cached": self.last_response_cached,
+            "last_response_ttft": self.last_response_ttft,
+            "last_image_stats": self.last_image_stats,
+            "last_prompt_stats": self.last_prompt_stats,
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        self.context = state.get("context", "")
+        self.history = list(state.get("history") or [])
+        self.last_response = state.get("last_response")
+        self.last_response_usage = state.get("last_response_usage")
+        self.last_response_cached = bool(state.get("last_response_cached"))
+        self.last_response_ttft = state.get("last_response_ttft")
+        self.last_image_stats = state.get("last_image_stats")
+        self.last_prompt_stats = state.get("last_prompt_stats")
+
     def _build_messages(
-        self, user_content: str, image_paths: Optional[List[str]] = None
+        self, user_content: str, image_paths: Optional[List[str]] = None, include_history: bool = True
     ) -> List[Dict[str, Any]]:
+        return self._build_request(user_content, image_paths=image_paths, include_history=include_history)[0]
+
+    def _build_request(
+        self, user_content: str, image_paths: Optional[List[str]] = None, include_history: bool = True
+    ) -> tuple[List[Dict[str, Any]], Optional[Dict[str, int]], Dict[str, int]]:
+        """Return the chat messages, the size of the attached images (None without
+        images) and the estimated prompt size."""
         messages: List[Dict[str, Any]] = []
-        if self.system_prompt:
-            messages.append({"role": "system", "content": self.system_prompt})
+        image_stats: Optional[Dict[str, int]] = None
+        # Stable prefix first (system prompt, rules, source), changing material last.
+        system_message = self._system_message()
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
 
-        # Previous conversation history
-        for item in self.history:
-            if "user" in item:
-                messages.append({"role": "user", "content": item["user"]})
-            if "assistant" in item:
-                messages.append({"role": "assistant", "content": item["assistant"]})
+        # Previous conversation history, trimmed by the history policy
+        history = self.history_manager.select(self.history) if include_history else []
+        history_tokens = 0
+        for item in history:
+            messages.append({"role": "user", "content": item["user"]})
+            messages.append({"role": "assistant", "content": item["assistant"]})
+            history_tokens += estimate_tokens(item["user"]) + estimate_tokens(item["assistant"])
 
         if image_paths and self.llm_client.supports_vision():
+            image_stats = {"images": 0, "bytes": 0, "tokens": 0}
             content: List[Dict[str, Any]] = [{"type": "text", "text": user_content}]
-            for path in image_paths:
-                content.append(self.llm_client.build_image_content(path))
+            with tracing.span("images.prepare") as prepare:
+                for path in image_paths:
+                    content.append(self.llm_client.build_image_content(path, stats=image_stats))
+                prepare.set(**image_stats)
             messages.append({"role": "user", "content": content})
         else:
             if image_paths:
@@ -49,16 +175,230 @@ class BaseAgent:
                 )
             messages.append({"role": "user", "content": user_content})
 
-        return messages
+        prompt_stats = {
+            "prompt_tokens_estimate": estimate_tokens(system_message)
+            + history_tokens
+            + estimate_tokens(user_content)
+            + (image_stats or {}).get("tokens", 0),
+            "history_tokens": history_tokens,
+            "history_turns": len(history),
+            "history_turns_recorded": len(self.history) if include_history else 0,
+        }
+        return messages, image_stats, prompt_stats
+
+    def _remember(
+        self, user_content: str, response: LLMResponse, kind: str = "", summary: Optional[str] = None
+    ) -> None:
+        """Append a turn. `kind` and `summary` let the history manager compact it later."""
+        turn: Dict[str, Any] = {"user": user_content, "assistant": response.content}
+        if kind:
+            turn["kind"] = kind
+        if summary:
+            turn["summary"] = summary
+        self.history.append(turn)
+        self.last_response = response.content
+        self.last_response_usage = response.usage
+        self.last_response_cached = response.cached
+        self.last_response_ttft = response.ttft
+        self.last_image_stats = response.image_stats
+        self.last_prompt_stats = response.prompt_stats
 
     def chat(
-        self, user_content: str, image_paths: Optional[List[str]] = None, json_mode: bool = False
+        self,
+        user_content: str,
+        image_paths: Optional[List[str]] = None,
+        json_mode: bool = False,
+        kind: str = "",
+        summary: Optional[str] = None,
     ) -> LLMResponse:
-        messages = self._build_messages(user_content, image_paths=image_paths)
+        messages, image_stats, prompt_stats = self._build_request(user_content, image_paths=image_paths)
         response = self.llm_client.chat_completion(
             messages=messages, model=self.model_name, json_mode=json_mode
         )
-        self.history.append({"user": user_content, "assistant": response.content})
-        self.last_response = response.content
-        self.last_response_usage = response.usage
-        return response
\ No newline at end of file
+        response.image_stats = image_stats
+        response.prompt_stats = prompt_stats
+        self._remember(user_content, response, kind=kind, summary=summary)
+        return response
+
+    def chat_stream(
+        self,
+        user_content: str,
+        image_paths: Optional[List[str]] = None,
+        json_mode: bool = False,
+        kind: str = "",
+        summary: Optional[str] = None,
+    ) -> LLMStream:
+        messages, image_stats, prompt_stats = self._build_request(user_content, image_paths=image_paths)
+        stream = self.llm_client.chat_completion_stream(
+            messages=messages, model=self.model_name, json_mode=json_mode
+        )
+
+        def remember(response: LLMResponse) -> None:
+            response.image_stats = image_stats
+            response.prompt_stats = prompt_stats
+            self._remember(user_content, response, kind=kind, summary=summary)
+
+        stream.on_complete(remember)
+        return stream
+
+    async def achat(
+        self,
+        user_content: str,
+        image_paths: Optional[List[str]] = None,
+        json_mode: bool = False,
+        remember: bool = True,
+        kind: str = "",
+        summary: Optional[str] = None,
+    ) -> LLMResponse:
+        """Async `chat`. With `remember=False` the call neither sees nor extends the
+        history, so independent requests can run concurrently."""
+        messages, image_stats, prompt_stats = self._build_request(
+            user_content, image_paths=image_paths, include_history=remember
+        )
+        response = await self.llm_client.achat_completion(
+            messages=messages, model=self.model_name, json_mode=json_mode
+        )
+        response.image_stats = image_stats
+        response.prompt_stats = prompt_stats
+        if remember:
+            self._remember(user_content, response, kind=kind, summary=summary)
+        return response
+
+    def _record_batch(
+        self,
+        user_content: str,
+        content: str,
+        responses: List[LLMResponse],
+        kind: str = "",
+        summary: Optional[str] = None,
+    ) -> None:
+        """Record several stateless calls as one history turn with summed usage."""
+        usage: Dict[str, Any] = {}
+        image_stats: Dict[str, int] = {}
+        prompt_stats: Dict[str, int] = {}
+        for response in responses:
+            for key, value in (response.usage or {}).items():
+                if isinstance(value, (int, float)):
+                    usage[key] = usage.get(key, 0) + value
+            for key, value in (response.image_stats or {}).items():
+                image_stats[key] = image_stats.get(key, 0) + value
+            for key, value in (response.prompt_stats or {}).items():
+                prompt_stats[key] = prompt_stats.get(key, 0) + value
+        combined = LLMResponse(
+            content=content,
+            usage=usage or None,
+            cached=bool(responses) and all(response.cached for response in responses),
+            image_stats=image_stats or None,
+            prompt_stats=prompt_stats or None,
+        )
+        self._remember(user_content, combined, kind=kind, summary=summary)
+
+    def _review_request(
+        self,
+        image_paths: List[str],
+        slides_md: Optional[str] = None,
+        page_numbers: Optional[List[int]] = None,
+        total_slides: Optional[int] = None,
+        note: str = "",
+    ) -> tuple[str, Optional[List[str]]]:
+        if image_paths and self.llm_client.supports_vision():
+            count = len(image_paths)
+            position = f"the image position (1 to {count})"
+            layout_note = ""
+            if self.contact_sheet:
+                with tracing.span("images.contact_sheet", slides=count) as sheets:
+                    image_paths = build_contact_sheets(image_paths, self.contact_sheet)
+                    sheets.set(sheets=len(image_paths))
+                position = "the tile label"
+                layout_note = " " + self.contact_sheet.describe(count, len(image_paths))
+            if not page_numbers:
+                return "Review the slides and provide feedback in JSON format." + layout_note, image_paths
+            mapping = ", ".join(f"{pos} = slide {page}" for pos, page in enumerate(page_numbers, start=1))
+            return (
+                f"Review these {count} slides from a {total_slides or count}-slide deck "
+                f"and provide feedback in JSON format.{note} "
+                f"Set page_index to {position}, not the slide number. ({mapping})" + layout_note,
+                image_paths,
+            )
+        prompt = (
+            "Review the slide markdown and provide feedback in JSON format. "
+            "Focus on clarity, structure, and potential layout issues.\n\n"
+        )
+        if slides_md:
+            prompt += f"Slides Markdown:\n{slides_md}\n"
+        return prompt, None
+
+    def _review_plan(
+        self, image_paths: List[str], pages: Optional[List[int]], batch_size: int
+    ) -> Optional[List[List[int]]]:
+        """Return review windows, or None to send every image in one request."""
+        if not image_paths or not self.llm_client.supports_vision():
+            return None
+        windows = review_windows(len(image_paths), batch_size, pages)
+        if pages is None and len(windows) <= 1:
+            return None
+        return windows
+
+    async def _areview_windows(
+        self,
+        image_paths: List[str],
+        slides_md: Optional[str],
+        windows: List[List[int]],
+        pages: Optional[List[int]] = None,
+    ) -> List[Dict]:
+        if not windows:
+            return []
+        total = len(image_paths)
+        note = ""
+        if len(windows) > 1:
+            note += " The first and last slides of the deck are included for context."
+        if pages is not None:
+            note += " Only slides that changed since the previous review are included."
+        requests = [
+            self._review_request(
+                [image_paths[page - 1] for page in window],
+                slides_md,
+                page_numbers=window,
+                total_slides=total,
+                note=note,
+            )
+            for window in windows
+        ]
+        responses = await asyncio.gather(
+            *(self.achat(prompt, image_paths=images, json_mode=True, remember=False) for prompt, images in requests)
+        )
+        feedback = merge_window_feedback(
+            [(window, self.parse_feedback(response.content)) for window, response in zip(windows, responses)],
+            total,
+            pages,
+        )
+        summaries = []
+        for response in responses:
+            payload = LLMClient.safe_json_loads(response.content)
+            if isinstance(payload, dict) and payload.get("summary"):
+                summaries.append(payload["summary"])
+        content = json.dumps({"feedback": feedback, "summary": {"windows": summaries}}, ensure_ascii=False, indent=2)
+        self._record_batch(
+            f"Review the slides in {len(windows)} windows {windows} and provide feedback in JSON format.",
+            content,
+            list(responses),
+            kind=REVIEW,
+        )
+        return feedback
+
+    @staticmethod
+    def parse_feedback(content: str) -> List[Dict]:
+        payload = LLMClient.safe_json_loads(content)
+        if isinstance(payload, dict) and "feedback" in payload:
+            return payload.get("feedback", [])
+        if isinstance(payload, list):
+            return payload
+        try:
+            parsed = json.loads(content)
+            if isinstance(parsed, dict) and "feedback" in parsed:
+                return parsed.get("feedback", [])
+            if isinstance(parsed, list):
+                return parsed
+        except json.JSONDecodeError:
+            return []
+        return []
@@ -1,9 +1,9 @@
-import json
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from agents.base_agent import BaseAgent
-from utils.llm_client import LLMClient
+from utils.history import REVIEW
+from utils.llm_client import run_async
 
 
 CRITIC_SYSTEM_PROMPT = """
@@ -46,30 +46,29 @@ class CriticAgent(BaseAgent):
         provider = provider or os.getenv("CRITIC_LLM_PROVIDER") or "moonshot"
         super().__init__(role="Critic", model_name=model_name, provider=provider)
         self.set_system_prompt(CRITIC_SYSTEM_PROMPT)
+        # Body slides per vision request; 0 reviews the whole deck in one request.
+        self.batch_size = int(os.getenv("CRITIC_BATCH_SIZE", "0") or 0)
+        self.last_review_windows: List[List[int]] = []
 
-    def review(self, image_paths: List[str], slides_md: str | None = None) -> List[Dict]:
-        if image_paths and self.llm_client.supports_vision():
-            prompt = "Review the slides and provide feedback in JSON format."
-            response = self.chat(prompt, image_paths=image_paths, json_mode=True)
-        else:
-            prompt = (
-                "Review the slide markdown and provide feedback in JSON format. "
-                "Focus on clarity, structure, and potential layout issues.\n\n"
-            )
-            if slides_md:
-                prompt += f"Slides Markdown:\n{slides_md}\n"
-            response = self.chat(prompt, json_mode=True)
-        payload = LLMClient.safe_json_loads(response.content)
-        if isinstance(payload, dict) and "feedback" in payload:
-            return payload.get("feedback", [])
-        if isinstance(payload, list):
-            return payload
-        try:
-            parsed = json.loads(response.content)
-            if isinstance(parsed, dict) and "feedback" in parsed:
-                return parsed.get("feedback", [])
-            if isinstance(parsed, list):
-                return parsed
-        except json.JSONDecodeError:
-            return []
-        return []
+    def review(
+        self, image_paths: List[str], slides_md: str | None = None, pages: Optional[List[int]] = None
+    ) -> List[Dict]:
+        """Review rendered slides; `pages` restricts the vision request to those slide numbers."""
+        windows = self._review_plan(image_paths, pages, self.batch_size)
+        if windows is not None:
+            return run_async(self.areview(image_paths, slides_md, pages))
+        self.last_review_windows = []
+        prompt, images = self._review_request(image_paths, slides_md)
+        response = self.chat(prompt, image_paths=images, json_mode=True, kind=REVIEW)
+        return self.parse_feedback(response.content)
+
+    async def areview(
+        self, image_paths: List[str], slides_md: str | None = None, pages: Optional[List[int]] = None
+    ) -> List[Dict]:
+        windows = self._review_plan(image_paths, pages, self.batch_size)
+        self.last_review_windows = windows or []
+        if windows is not None:
+            return await self._areview_windows(image_paths, slides_md, windows, pages)
+        prompt, images = self._review_request(image_paths, slides_md)
+        response = await self.achat(prompt, image_paths=images, json_mode=True, kind=REVIEW)
+        return self.parse_feedback(response.content)
@@ -1,9 +1,16 @@
+import asyncio
 import json
 import os
-from typing import Dict, List
+import re
+from typing import Callable, Dict, List, Optional
 
 from agents.base_agent import BaseAgent
-from utils.llm_client import LLMClient
+from utils.history import DECK, REVIEW, feedback_lines
+from utils.linter import LintIssue
+from utils.llm_client import run_async
+from utils.slide_stream import SlideStreamWriter
+from utils.slides import Slide, deck_headmatter, split_slides
+from utils.tokens import estimate_tokens
 
 
 
@@ -110,82 +117,256 @@ You are an expert Slidev Developer and Presentation Designer & Critic.
 
 
 
+_STRUCTURAL_FEEDBACK_RE = re.compile(
+    r"\b(add|insert|create|missing)\b[^.]*\b(slide|page)s?\b"
+    r"|\b(remove|delete|drop|merge|combine|reorder|move)\b[^.]*\b(slide|page)s?\b"
+    r"|\bduplicat|\bconsisten|\bacross (all|the) slides\b",
+    re.IGNORECASE,
+)
+
+
+def group_feedback_by_page(feedback: List[Dict], slide_count: int) -> Optional[Dict[int, List[Dict]]]:
+    """Group feedback by `page_index`, or return None when it needs a full-deck rewrite."""
+    groups: Dict[int, List[Dict]] = {}
+    for item in feedback:
+        page = item.get("page_index")
+        if isinstance(page, str) and page.strip().isdigit():
+            page = int(page)
+        if not isinstance(page, int) or not 1 <= page <= slide_count:
+            return None
+        text = " ".join(str(item.get(key, "")) for key in ("category", "issue", "suggestion"))
+        if _STRUCTURAL_FEEDBACK_RE.search(text):
+            return None
+        groups.setdefault(page, []).append(item)
+    return groups
+
+
+def _strip_fence(text: str) -> str:
+    stripped = text.strip()
+    lines = stripped.splitlines()
+    if len(lines) >= 2 and lines[0].startswith("```") and lines[-1].strip() == "```":
+        return "\n".join(lines[1:-1]).strip()
+    return stripped
+
+
+def _output_tokens(usage: Optional[Dict], content: str) -> int:
+    if usage:
+        if "output_tokens" in usage:
+            return usage.get("output_tokens", 0)
+        if "completion_tokens" in usage:
+            return usage.get("completion_tokens", 0)
+    return estimate_tokens(content)
+
+
 class EditorAgent(BaseAgent):
     def __init__(self, model_name: str = "gpt-5.1", provider: str | None = None):
         provider = provider or os.getenv("EDITOR_LLM_PROVIDER") or "deepseek"
         super().__init__(role="Editor", model_name=model_name, provider=provider)
         mode = os.getenv("MODE") or "dual"
         self.set_system_prompt(EDITOR_SYSTEM_PROMPT_DUAL if mode == "dual" else EDITOR_SYSTEM_PROMPT_SINGLE)
+        # When set, deck-producing calls stream and write completed slides to this path.
+        self.stream_path: Optional[str] = None
+        self.on_streamed_slide: Optional[Callable[[Slide, List[LintIssue]], None]] = None
+        self.last_stream_issues: List[LintIssue] = []
+        self.last_refine_stats: Dict = {}
 
-    def generate_outline(self, raw_content: str) -> str:
-        prompt = (
-            "Create a detailed presentation outline in Markdown. "
+    def _deck_chat(self, prompt: str, summary: str) -> str:
+        if not self.stream_path:
+            return self.chat(prompt, kind=DECK, summary=summary).content.strip()
+        writer = SlideStreamWriter(self.stream_path, on_slide=self.on_streamed_slide)
+        stream = self.chat_stream(prompt, kind=DECK, summary=summary)
+        for chunk in stream:
+            writer.feed(chunk)
+        writer.finish()
+        self.last_stream_issues = writer.issues
+        return stream.response.content.strip()
+
+    @staticmethod
+    def _outline_prompt() -> str:
+        return (
+            "Create a detailed presentation outline in Markdown for the Source Content. "
             "Include slide order, slide titles, key points (2-4 bullets each), "
             "suggested layout, and any recommended Mermaid diagrams. "
-            "Return the outline only.\n\n"
-            f"Content:\n{raw_content}\n"
+            "Return the outline only.\n"
         )
-        response = self.chat(prompt)
-        return response.content.strip()
 
-    def generate_draft(self, raw_content: str, outline: str | None = None) -> str:
+    @staticmethod
+    def _draft_prompt(outline: str | None = None) -> str:
         prompt = (
-            "Please convert the following content into Slidev markdown slides. "
+            "Please convert the Source Content into Slidev markdown slides. "
             "Ensure the deck is sufficiently detailed by using more slides rather than sparse text. "
-            "Return the full slides.md content only.\n\n"
+            "Return the full slides.md content only.\n"
         )
         if outline:
-            prompt += f"Outline:\n{outline}\n\n"
-        prompt += f"Content:\n{raw_content}\n"
-        response = self.chat(prompt)
-        return response.content.strip()
+            prompt += f"\nOutline:\n{outline}\n"
+        return prompt
 
-    def refine_slides(self, current_code: str, feedback: List[Dict]) -> str:
+    @staticmethod
+    def _refine_prompt(current_code: str, feedback: List[Dict]) -> str:
         feedback_text = json.dumps(feedback, ensure_ascii=False, indent=2)
-        prompt = (
+        return (
             "Please refine the Slidev markdown according to the feedback. "
             "Return the full revised slides.md content only.\n\n"
-            f"Current Slides:\n{current_code}\n\n"
-            f"Feedback (JSON):\n{feedback_text}\n"
+            f"Feedback (JSON):\n{feedback_text}\n\n"
+            f"Current Slides:\n{current_code}\n"
         )
-        response = self.chat(prompt)
-        return response.content.strip()
 
-    def fix_slides(self, current_code: str, render_error: str) -> str:
-        prompt = (
+    @staticmethod
+    def _fix_prompt(current_code: str, render_error: str) -> str:
+        return (
             "The Slidev render failed. Fix the Slidev markdown so it renders successfully. "
             "Only correct syntax, layout, or component usage errors and keep the content intact. "
             "Return the full corrected slides.md content only.\n\n"
             f"Render Error:\n{render_error}\n\n"
             f"Current Slides:\n{current_code}\n"
         )
-        response = self.chat(prompt)
+
+    @staticmethod
+    def _draft_summary() -> str:
+        return "Convert the content and outline into Slidev markdown slides."
+
+    @staticmethod
+    def _refine_summary(feedback: List[Dict]) -> str:
+        return "\n".join(["Refine the slides according to the feedback:"] + feedback_lines(feedback))
+
+    @staticmethod
+    def _fix_summary(render_error: str) -> str:
+        return f"Fix the slides so they render. Render error:\n{render_error.strip()[:300]}"
+
+    def generate_outline(self, raw_content: str) -> str:
+        self.set_context(raw_content)
+        return self.chat(self._outline_prompt()).content.strip()
+
+    async def agenerate_outline(self, raw_content: str) -> str:
+        self.set_context(raw_content)
+        return (await self.achat(self._outline_prompt())).content.strip()
+
+    def generate_draft(self, raw_content: str, outline: str | None = None) -> str:
+        self.set_context(raw_content)
+        return self._deck_chat(self._draft_prompt(outline), self._draft_summary())
+
+    async def agenerate_draft(self, raw_content: str, outline: str | None = None) -> str:
+        self.set_context(raw_content)
+        response = await self.achat(self._draft_prompt(outline), kind=DECK, summary=self._draft_summary())
+        return response.content.strip()
+
+    def refine_slides(self, current_code: str, feedback: List[Dict]) -> str:
+        return self._deck_chat(self._refine_prompt(current_code, feedback), self._refine_summary(feedback))
+
+    async def arefine_slides(self, current_code: str, feedback: List[Dict]) -> str:
+        response = await self.achat(
+            self._refine_prompt(current_code, feedback), kind=DECK, summary=self._refine_summary(feedback)
+        )
         return response.content.strip()
-    
-    def self_review(self, image_paths: List[str], slides_md: str | None = None) -> List[Dict]:
-        if image_paths and self.llm_client.supports_vision():
-            prompt = "Review the slides and provide feedback in JSON format."
-            response = self.chat(prompt, image_paths=image_paths, json_mode=True)
+
+    @staticmethod
+    def _page_prompt(slide: Slide, headmatter: str, feedback: List[Dict]) -> str:
+        feedback_text = json.dumps(feedback, ensure_ascii=False, indent=2)
+        if slide.index == 1:
+            shape = "This is the first slide: keep the deck headmatter block at the top unchanged."
         else:
-            prompt = (
-                "Review the slide markdown and provide feedback in JSON format. "
-                "Focus on clarity, structure, and potential layout issues.\n\n"
+            shape = "Start with the `---` slide separator (followed by the slide frontmatter, if any)."
+        return (
+            "Please revise one slide of the Slidev deck according to the feedback. "
+            "Return only the Slidev markdown for this slide. "
+            "Do not touch other slides. If the feedback asks to split this slide, return the "
+            "resulting slides separated by `---`.\n\n"
+            f"Deck Headmatter:\n{headmatter or '(none)'}\n\n"
+            f"Feedback (JSON):\n{feedback_text}\n\n"
+            f"{shape}\n\n"
+            f"Slide {slide.index}:\n{slide.raw.strip()}\n"
+        )
+
+    @staticmethod
+    def _normalize_page(slide: Slide, headmatter: str, text: str) -> str:
+        body = _strip_fence(text)
+        if slide.index == 1 and headmatter and not body.startswith("---"):
+            body = f"---\n{headmatter}\n---\n\n{body}"
+        elif slide.index > 1 and not body.startswith("---"):
+            first_line = body.split("\n", 1)[0]
+            if re.match(r"^[\w$.-]+\s*:", first_line):
+                body = "---\n" + body
+            else:
+                body = "---\n\n" + body
+        return body
+
+    def refine_pages(self, current_code: str, feedback: List[Dict]) -> str:
+        """Rewrite only the slides that received feedback; fall back to `refine_slides`
+        for structural feedback (adding, removing or reordering slides)."""
+        return run_async(self.arefine_pages(current_code, feedback))
+
+    async def arefine_pages(self, current_code: str, feedback: List[Dict]) -> str:
+        slides = split_slides(current_code)
+        groups = group_feedback_by_page(feedback, len(slides))
+        full_estimate = estimate_tokens(current_code)
+        if not groups:
+            revised = await self.arefine_slides(current_code, feedback)
+            self.last_refine_stats = {
+                "mode": "full",
+                "pages": [],
+                "output_tokens": _output_tokens(self.last_response_usage, revised),
+                "full_rewrite_estimate": full_estimate,
+            }
+            return revised
+
+        headmatter = deck_headmatter(slides)
+        pages = sorted(groups)
+        responses = await asyncio.gather(
+            *(
+                self.achat(self._page_prompt(slides[page - 1], headmatter, groups[page]), remember=False)
+                for page in pages
             )
-            if slides_md:
-                prompt += f"Slides Markdown:\n{slides_md}\n"
-            response = self.chat(prompt, json_mode=True)
-        payload = LLMClient.safe_json_loads(response.content)
-        if isinstance(payload, dict) and "feedback" in payload:
-            return payload.get("feedback", [])
-        if isinstance(payload, list):
-            return payload
-        try:
-            parsed = json.loads(response.content)
-            if isinstance(parsed, dict) and "feedback" in parsed:
-                return parsed.get("feedback", [])
-            if isinstance(parsed, list):
-                return parsed
-        except json.JSONDecodeError:
-            return []
-        return []
+        )
+        replacements = {
+            page: self._normalize_page(slides[page - 1], headmatter, response.content) for page, response in zip(pages, responses)
+        }
+        # A rewritten slide keeps the original's trailing blank lines, so every other slide is unchanged.
+        revised = "\n".join(
+            replacements[slide.index] + slide.raw[len(slide.raw.rstrip()) :] if slide.index in replacements else slide.raw
+            for slide in slides
+        )
+
+        output_tokens = sum(_output_tokens(response.usage, response.content) for response in responses)
+        self._record_batch(
+            self._refine_prompt(current_code, feedback) + f"\n(Revised pages {pages} individually.)",
+            revised,
+            list(responses),
+            kind=DECK,
+            summary=self._refine_summary(feedback),
+        )
+        self.last_refine_stats = {
+            "mode": "page",
+            "pages": pages,
+            "output_tokens": output_tokens,
+            "full_rewrite_estimate": full_estimate,
+            "output_tokens_saved": max(0, full_estimate - output_tokens),
+        }
+        return revised.strip()
+
+    def fix_slides(self, current_code: str, render_error: str) -> str:
+        return self._deck_chat(self._fix_prompt(current_code, render_error), self._fix_summary(render_error))
+
+    async def afix_slides(self, current_code: str, render_error: str) -> str:
+        response = await self.achat(
+            self._fix_prompt(current_code, render_error), kind=DECK, summary=self._fix_summary(render_error)
+        )
+        return response.content.strip()
+
+    def self_review(
+        self, image_paths: List[str], slides_md: str | None = None, pages: Optional[List[int]] = None
+    ) -> List[Dict]:
+        if self._review_plan(image_paths, pages, 0) is not None:
+            return run_async(self.aself_review(image_paths, slides_md, pages))
+        prompt, images = self._review_request(image_paths, slides_md)
+        response = self.chat(prompt, image_paths=images, json_mode=True, kind=REVIEW)
+        return self.parse_feedback(response.content)
 
+    async def aself_review(
+        self, image_paths: List[str], slides_md: str | None = None, pages: Optional[List[int]] = None
+    ) -> List[Dict]:
+        windows = self._review_plan(image_paths, pages, 0)
+        if windows is not None:
+            return await self._areview_windows(image_paths, slides_md, windows, pages)
+        prompt, images = self._review_request(image_paths, slides_md)
+        response = await self.achat(prompt, image_paths=images, json_mode=True, kind=REVIEW)
+        return self.parse_feedback(response.content)
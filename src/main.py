@@ -2,16 +2,33 @@ import json
 import os
 import shutil
 import time
+import uuid
 from pathlib import Path
-from typing import List
+from typing import Callable, List
 
 import typer
 from dotenv import load_dotenv
 
 from agents.editor import EditorAgent
 from agents.critic import CriticAgent
+from utils.image_prep import ImagePreparer
+from utils.batch import RenderPool, load_jobs, run_batch, write_batch_report
+from utils.benchmark import run_benchmark, write_benchmark
+from utils.blob_store import BlobStore, HistoryWriter, archive_iteration
+from utils.checkpoint import CHECKPOINT_FILE, RunCheckpoint, find_checkpoint
+from utils.linter import format_issues, lint_slides
+from utils.llm_cache import LLMCache
 from utils.llm_client import LLMClient
+from utils.profiling import StageProfiler, parse_profile_modes
+from utils.mock_llm_server import MockLLMServer
+from utils.render_server import RenderServer
+from utils.repair import auto_repair, repair_feedback
+from utils.run_db import DONE, FAILED, STOPPED, RunDB, RunRecorder
+from utils.service import PipelineService, make_server
+from utils.slides import split_slides
 from utils.slidev_runner import SlidevRunner, RenderError
+from utils.tracing import Span, Tracer
+from utils.visual_diff import carry_forward_feedback, diff_slides
 
 
 app = typer.Typer(add_completion=False)
@@ -45,32 +62,136 @@ def strip_code_fence(text: str) -> str:
             return "\n".join(lines[1:-1]).strip() + "\n"
     return text
 
+
+# Span name -> stage key in the timing breakdown. LLM time is summed over
+# concurrent calls, so it can exceed the wall time of the stage around it.
+STAGE_SPANS = {
+    "outline": "outline",
+    "editor": "editor",
+    "lint": "lint",
+    "render": "render",
+    "review": "review",
+    "archive": "archive",
+    "llm.call": "llm",
+    "images.prepare": "image_prep",
+}
+
+
+def stage_seconds(tracer: Tracer, parent: Span | None = None) -> dict:
+    totals = tracer.totals(parent, names=list(STAGE_SPANS))
+    return {stage: totals.get(name, 0.0) for name, stage in STAGE_SPANS.items() if name in totals}
+
+
+def timing_breakdown_lines(tracer: Tracer) -> List[str]:
+    """Run-level time per stage, LLM call counts and retries, from the trace spans."""
+    run_seconds = sum(item.duration for item in tracer.find("outline") + tracer.find("iteration"))
+    counts: dict = {}
+    for item in tracer.spans:
+        counts[item.name] = counts.get(item.name, 0) + 1
+    lines = ["## Timing Breakdown", "", "| Stage | Time (s) | Share | Spans |", "| --- | --- | --- | --- |"]
+    totals = tracer.totals(names=list(STAGE_SPANS))
+    for name, stage in STAGE_SPANS.items():
+        if name not in totals:
+            continue
+        total = totals[name]
+        lines.append(
+            f"| {stage} | {total:.2f} | {total / run_seconds if run_seconds else 0:.0%} | {counts.get(name, 0)} |"
+        )
+    calls = tracer.find("llm.call")
+    if calls:
+        cache_hits = sum(1 for item in calls if item.attributes.get("cache_hit"))
+        retries = sum(max(0, item.attributes.get("attempt", 1) - 1) for item in calls)
+        lines.append("")
+        lines.append(
+            f"- LLM Calls: {len(calls)} ({cache_hits} cache hits, {retries} retries); "
+            "LLM time is summed over concurrent calls"
+        )
+    lines.append("")
+    return lines
+
+
 def is_approved(feedback: List[dict]) -> bool:
     return not feedback
 
 
-def _read_json_file(path: str) -> dict:
-    if not os.path.exists(path):
-        return {}
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, OSError):
-        return {}
-
+def usage_breakdown(usage: dict) -> dict:
+    """Normalize a usage payload (chat or responses API) into tokens and cost."""
+    if "input_tokens" in usage:
+        input_tokens = usage.get("input_tokens", 0)
+    else:
+        input_tokens = usage.get("prompt_tokens", 0)
+    if "output_tokens" in usage:
+        output_tokens = usage.get("output_tokens", 0) + usage.get("reasoning_tokens", 0)
+    else:
+        output_tokens = usage.get("completion_tokens", 0)
+    cached_tokens = usage.get("cached_tokens", 0)
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cached_tokens": cached_tokens,
+        "cost": LLMClient.calculate_context_cost(input_tokens, output_tokens, cached_tokens),
+    }
+
+
+def merge_carried_feedback(feedback: List[dict], carried: List[dict]) -> List[dict]:
+    merged = list(feedback) + list(carried)
+    merged.sort(key=lambda item: item["page_index"] if isinstance(item.get("page_index"), int) else len(merged) + 1)
+    return merged
+
+
+def feedback_log_text(raw_response: str | None, feedback: List[dict]) -> str:
+    payload = LLMClient.safe_json_loads(raw_response or "")
+    if not isinstance(payload, dict):
+        payload = {}
+    payload["feedback"] = feedback
+    return json.dumps(payload, ensure_ascii=False, indent=2)
+
+
+def review_summary_of(raw_response: str | None):
+    """The `summary` object of a review response, if the model returned one."""
+    payload = LLMClient.safe_json_loads(raw_response or "")
+    return (payload.get("summary") or None) if isinstance(payload, dict) else None
+
+
+def llm_model_lines(model_stats: List[dict]) -> List[str]:
+    lines = [
+        "## LLM Calls by Model",
+        "",
+        "| Model | Calls | Cache Hits | Retries | Input Tokens | Output Tokens | Cost | p50 (s) | p95 (s) | Cost / Slide |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    for item in model_stats:
+        latency = item["latency"]
+        cost_per_slide = f"${item['cost_per_slide']:.4f}" if item["cost_per_slide"] is not None else "-"
+        lines.append(
+            f"| {item['model']} | {item['calls']} | {item['cache_hits']} | {item['retries']} | {item['input_tokens']} | "
+            f"{item['output_tokens']} | ${item['cost']:.4f} | {latency.get('p50', 0):.2f} | {latency.get('p95', 0):.2f} | "
+            f"{cost_per_slide} |"
+        )
+    lines.append("")
+    return lines
 
 
 def generate_iteration_summary_report(
     logs_dir: str,
     mode: str,
     run_stamp: str,
-    total_iterations: int,
-    iteration_metrics: List[dict],
-    total_input_tokens: int,
-    total_output_tokens: int,
-    total_cost: float,
+    run_db: RunDB,
+    run_id: str,
+    llm_cache_stats: dict | None = None,
+    tracer: Tracer | None = None,
+    profiler: StageProfiler | None = None,
+    history_store_stats: dict | None = None,
 ) -> str:
+    """Summary of one run, built from its records in the run database."""
     report_path = os.path.join(logs_dir, f"iteration_summary_{run_stamp}.md")
+    run = run_db.run(run_id) or {}
+    iteration_metrics = run_db.iteration_metrics(run_id)
+    total_iterations = len(iteration_metrics)
+    total_input_tokens = run.get("input_tokens", 0)
+    total_output_tokens = run.get("output_tokens", 0)
+    total_cached_tokens = run.get("cached_tokens", 0)
+    total_cost = run.get("cost", 0.0)
     lines: List[str] = []
     lines.append(f"# Iteration Summary Report ({mode} mode)")
     lines.append("")
@@ -78,37 +199,162 @@ def generate_iteration_summary_report(
     lines.append(f"- Total Iterations: {total_iterations}")
     lines.append(f"- Total Input Tokens: {total_input_tokens}")
     lines.append(f"- Total Output Tokens: {total_output_tokens}")
+    if total_cached_tokens:
+        lines.append(
+            f"- Cached Input Tokens: {total_cached_tokens} "
+            f"({total_cached_tokens / max(total_input_tokens, 1):.0%} of input, billed at the cached rate)"
+        )
     lines.append(f"- Estimated Cost: ${total_cost:.4f}")
     if iteration_metrics:
-        avg_iter_time = sum(item.get("duration_seconds", 0) for item in iteration_metrics) / len(
-            iteration_metrics
-        )
+        avg_iter_time = sum(item.get("duration_seconds", 0) for item in iteration_metrics) / len(iteration_metrics)
         lines.append(f"- Avg Iteration Time: {avg_iter_time:.2f}s")
+        prompt_sizes: dict = {}
+        for item in iteration_metrics:
+            for agent_name, usage in (item.get("agent_breakdown") or {}).items():
+                if usage.get("prompt_tokens_estimate"):
+                    prompt_sizes.setdefault(agent_name, []).append(usage["prompt_tokens_estimate"])
+        for agent_name, sizes in prompt_sizes.items():
+            lines.append(
+                f"- Avg Prompt Size ({agent_name}): ~{sum(sizes) / len(sizes):.0f} tokens per call (max {max(sizes)})"
+            )
+        cache_hits = (llm_cache_stats or {}).get("hits", 0)
+        cache_misses = (llm_cache_stats or {}).get("misses", 0)
+        if cache_hits or cache_misses:
+            lines.append(
+                f"- LLM Cache: {cache_hits} hits / {cache_misses} misses "
+                f"({cache_hits / (cache_hits + cache_misses):.0%} hit rate)"
+            )
+        repair_attempts = [item["repair"] for item in iteration_metrics if (item.get("repair") or {}).get("fixes")]
+        if repair_attempts:
+            repair_hits = sum(1 for item in repair_attempts if item.get("succeeded"))
+            lines.append(
+                f"- Local Repair Hit Rate: {repair_hits}/{len(repair_attempts)} "
+                f"({repair_hits / len(repair_attempts):.0%})"
+            )
+        page_refines = [
+            item["refine"] for item in iteration_metrics if (item.get("refine") or {}).get("mode") == "page"
+        ]
+        if page_refines:
+            saved_tokens = sum(item.get("output_tokens_saved", 0) for item in page_refines)
+            lines.append(
+                f"- Page-Level Refinements: {len(page_refines)} (~{saved_tokens} output tokens saved vs. full rewrites)"
+            )
+        diffs = [item["visual_diff"] for item in iteration_metrics if item.get("visual_diff")]
+        if diffs:
+            lines.append(
+                f"- Slides Skipped by Visual Diff: {sum(item.get('skipped', 0) for item in diffs)} "
+                f"(~{sum(item.get('image_tokens_saved', 0) for item in diffs)} image tokens saved)"
+            )
+        skipped = [item for item in iteration_metrics if item.get("render_skipped")]
+        if skipped:
+            render_times = [
+                item["render_seconds"]
+                for item in iteration_metrics
+                if item.get("render_seconds") and not item.get("render_skipped")
+            ]
+            if render_times:
+                saved = len(skipped) * sum(render_times) / len(render_times)
+                lines.append(f"- Renders Skipped by Linter: {len(skipped)} (~{saved:.1f}s of render time saved)")
+            else:
+                lines.append(f"- Renders Skipped by Linter: {len(skipped)}")
+    render_latency = run_db.render_latency([run_id])
+    if render_latency.get("count"):
+        lines.append(
+            f"- Render Latency: p50 {render_latency['p50']:.2f}s / p95 {render_latency['p95']:.2f}s over "
+            f"{render_latency['count']} render(s) ({render_latency['errors']} failed)"
+        )
+    if history_store_stats and (history_store_stats.get("stored") or history_store_stats.get("reused")):
+        lines.append(
+            f"- History Store: {history_store_stats['stored']} new blob(s) "
+            f"({history_store_stats['stored_bytes'] / 1024 / 1024:.1f} MiB), {history_store_stats['reused']} deduplicated "
+            f"({history_store_stats['reused_bytes'] / 1024 / 1024:.1f} MiB not copied)"
+        )
     lines.append("")
-
-    for idx in range(1, total_iterations + 1):
+    model_stats = run_db.llm_by_model([run_id])
+    if model_stats:
+        lines.extend(llm_model_lines(model_stats))
+    if tracer is not None:
+        lines.extend(timing_breakdown_lines(tracer))
+    if profiler is not None:
+        lines.extend(profiler.report_lines())
+
+    for iteration_metric in iteration_metrics:
+        idx = iteration_metric["iteration"]
         lines.append(f"## Iteration {idx}")
 
-        iteration_metric = (
-            iteration_metrics[idx - 1] if idx - 1 < len(iteration_metrics) else {}
-        )
         if iteration_metric:
             lines.append("### Iteration Metrics")
             lines.append(f"- Duration: {iteration_metric.get('duration_seconds', 0):.2f}s")
+            iteration_spans = tracer.find("iteration", iteration=idx) if tracer is not None else []
+            if iteration_spans:
+                timings = stage_seconds(tracer, iteration_spans[-1])
+                lines.append("- Timing: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
             lines.append(f"- Input Tokens: {iteration_metric.get('input_tokens', 0)}")
             lines.append(f"- Output Tokens: {iteration_metric.get('output_tokens', 0)}")
+            if iteration_metric.get("cached_tokens"):
+                lines.append(f"- Cached Input Tokens: {iteration_metric['cached_tokens']}")
+            if iteration_metric.get("render_skipped"):
+                lines.append(
+                    f"- Render: skipped, {iteration_metric.get('lint_errors', 0)} lint error(s) "
+                    f"found in {iteration_metric.get('lint_seconds', 0) * 1000:.1f}ms"
+                )
+            elif iteration_metric.get("render_seconds"):
+                lines.append(f"- Render Time: {iteration_metric['render_seconds']:.2f}s")
+            cache_metric = iteration_metric.get("llm_cache") or {}
+            if cache_metric:
+                lines.append(
+                    f"- LLM Cache: {cache_metric.get('hits', 0)} hits / {cache_metric.get('misses', 0)} misses"
+                )
+            repair_metric = iteration_metric.get("repair") or {}
+            if repair_metric.get("fixes"):
+                status = "succeeded" if repair_metric.get("succeeded") else "failed, sent to editor"
+                lines.append(f"- Local Repair: {', '.join(repair_metric['fixes'])} ({status})")
+            if repair_metric.get("feedback_fixes"):
+                lines.append(f"- Feedback Resolved Locally: {', '.join(repair_metric['feedback_fixes'])}")
+            refine_metric = iteration_metric.get("refine") or {}
+            if refine_metric.get("mode") == "page":
+                lines.append(
+                    f"- Page Refinement: pages {refine_metric.get('pages', [])}, "
+                    f"{refine_metric.get('output_tokens', 0)} output tokens "
+                    f"(~{refine_metric.get('output_tokens_saved', 0)} saved vs. full rewrite)"
+                )
+            elif refine_metric.get("mode") == "full":
+                lines.append("- Page Refinement: structural feedback, full deck rewritten")
+            diff_metric = iteration_metric.get("visual_diff") or {}
+            if diff_metric:
+                lines.append(
+                    f"- Visual Diff: {diff_metric.get('reviewed', 0)}/{diff_metric.get('slides', 0)} slides sent for review, "
+                    f"{diff_metric.get('skipped', 0)} unchanged (~{diff_metric.get('image_tokens_saved', 0)} image tokens saved, "
+                    f"{diff_metric.get('carried_feedback', 0)} feedback item(s) carried forward)"
+                )
+            render_stats = iteration_metric.get("render_stats") or {}
+            if render_stats:
+                lines.append(
+                    f"- Slides Rendered: {render_stats.get('rendered', 0)}/{render_stats.get('slides', 0)} "
+                    f"({render_stats.get('cached', 0)} reused from cache)"
+                )
             if iteration_metric.get("agent_breakdown"):
                 lines.append("- Agent Breakdown:")
                 for agent_name, usage in iteration_metric["agent_breakdown"].items():
+                    ttft_text = f", TTFT {usage['ttft_seconds']:.2f}s" if usage.get("ttft_seconds") is not None else ""
+                    image_text = (
+                        f", {usage.get('images', 0)} image(s) {usage['image_bytes'] / 1024:.0f} KB "
+                        f"(~{usage.get('image_tokens', 0)} tokens)"
+                        if usage.get("image_bytes")
+                        else ""
+                    )
+                    prompt_text = (
+                        f", prompt ~{usage['prompt_tokens_estimate']} tokens ({usage.get('history_turns', 0)} history turns)"
+                        if usage.get("prompt_tokens_estimate")
+                        else ""
+                    )
                     lines.append(
-                        f"  - {agent_name}: input {usage.get('input_tokens', 0)}, output {usage.get('output_tokens', 0)}, cost ${usage.get('cost', 0.0):.4f}"
+                        f"  - {agent_name}: input {usage.get('input_tokens', 0)} ({usage.get('cached_tokens', 0)} cached), output {usage.get('output_tokens', 0)}, cost ${usage.get('cost', 0.0):.4f}{ttft_text}{image_text}{prompt_text}"
                     )
             lines.append("")
 
-        critic_iter_log_path = os.path.join(logs_dir, f"iter_{idx}_critic.txt")
-        critic_payload = _read_json_file(critic_iter_log_path)
-        critic_feedback = critic_payload.get("feedback", []) if isinstance(critic_payload, dict) else []
-        critic_summary = critic_payload.get("summary", {}) if isinstance(critic_payload, dict) else {}
+        critic_feedback = run_db.iteration_feedback(run_id, idx)
+        critic_summary = run_db.review_summary(run_id, idx)
 
         lines.append("### Critic Feedback")
         if not critic_feedback:
@@ -121,9 +367,7 @@ def generate_iteration_summary_report(
                 suggestion = item.get("suggestion", "No suggestion")
                 category = item.get("category") or ""
                 category_text = f" ({category})" if category else ""
-                lines.append(
-                    f"- [Page {page_index}] **{severity}**{category_text}: {issue}"
-                )
+                lines.append(f"- [Page {page_index}] **{severity}**{category_text}: {issue}")
                 lines.append(f"  - Suggestion: {suggestion}")
 
         if critic_summary:
@@ -138,6 +382,7 @@ def generate_iteration_summary_report(
     write_text_file(report_path, "\n".join(lines).strip() + "\n")
     return report_path
 
+
 @app.command()
 def run(
     input_path: str = "data/paper_summary.txt",
@@ -145,11 +390,105 @@ def run(
     max_iterations: int = 5,
     model_name: str = "gpt-4o",
     mode: str = "",
+    render_server: bool = False,
+    render_shards: int = 0,
+    llm_cache: bool = False,
+    stream: bool = False,
+    refine_mode: str = "page",
+    critic_batch_size: int = 0,
+    vision_max_width: int = 0,
+    vision_format: str = "",
+    vision_quality: int = 0,
+    contact_sheet: str = "",
+    visual_diff: bool = True,
+    history_max_tokens: int = 0,
+    history_keep_turns: int = 0,
+    profile: str = "",
+    resume: str = "",
 ):
-    """Run the PPT-Agent pipeline."""
+    """Run the PPT-Agent pipeline. `--resume <run_dir>` continues an interrupted run from its checkpoint."""
     load_dotenv()
+    try:
+        parse_profile_modes(profile)
+    except ValueError as err:
+        raise typer.BadParameter(str(err), param_hint="--profile")
+    if llm_cache:
+        os.environ["LLM_CACHE"] = "1"
+    if vision_max_width > 0:
+        os.environ["VISION_MAX_WIDTH"] = str(vision_max_width)
+    if vision_format:
+        os.environ["VISION_IMAGE_FORMAT"] = vision_format
+    if vision_quality > 0:
+        os.environ["VISION_IMAGE_QUALITY"] = str(vision_quality)
+    if contact_sheet:
+        os.environ["VISION_CONTACT_SHEET"] = contact_sheet
+    if history_max_tokens > 0:
+        os.environ["HISTORY_MAX_TOKENS"] = str(history_max_tokens)
+    if history_keep_turns > 0:
+        os.environ["HISTORY_KEEP_TURNS"] = str(history_keep_turns)
+    run_pipeline(
+        input_path=input_path,
+        output_dir=output_dir,
+        max_iterations=max_iterations,
+        model_name=model_name,
+        mode=mode,
+        render_server=render_server,
+        render_shards=render_shards,
+        stream=stream,
+        refine_mode=refine_mode,
+        critic_batch_size=critic_batch_size,
+        visual_diff=visual_diff,
+        profile=profile,
+        resume=resume,
+    )
+
+
+def run_pipeline(
+    input_path: str,
+    output_dir: str,
+    max_iterations: int = 5,
+    model_name: str = "gpt-4o",
+    mode: str = "",
+    render_server: bool = False,
+    render_shards: int = 0,
+    stream: bool = False,
+    refine_mode: str = "page",
+    critic_batch_size: int = 0,
+    visual_diff: bool = True,
+    interactive: bool = True,
+    runner: SlidevRunner | None = None,
+    profile: str = "",
+    on_event: Callable[[str, dict], None] | None = None,
+    resume: str = "",
+) -> dict:
+    """Run outline -> draft -> render -> review iterations and return the run's metrics.
+
+    With `interactive=False` the outline confirmation prompt is skipped. A
+    prepared `runner` (anything with `render_slides` and `last_render_stats`)
+    replaces the default SlidevRunner. `profile` ("cpu", "mem" or both,
+    comma-separated) profiles each stage into the logs directory. `on_event`
+    receives every log line ("log") and a summary of each iteration ("iteration").
+
+    The loop state is checkpointed to `<run_dir>/checkpoint.json` after every
+    stage. `resume` (a run directory) reloads it and continues from the last
+    completed stage with the settings of the interrupted run, without
+    repeating its LLM calls or renders.
+    """
     start_time = time.time()
 
+    checkpoint: RunCheckpoint | None = None
+    if resume:
+        checkpoint = RunCheckpoint.load(find_checkpoint(resume))
+        settings = checkpoint.state["settings"]
+        input_path = settings["input_path"]
+        output_dir = settings["output_dir"]
+        max_iterations = settings["max_iterations"]
+        model_name = settings["model_name"]
+        mode = settings["mode"]
+        refine_mode = settings["refine_mode"]
+        critic_batch_size = settings["critic_batch_size"]
+        visual_diff = settings["visual_diff"]
+
     raw_content = read_text_file(input_path)
 
     default_model = model_name or "gpt-4o"
@@ -161,7 +500,7 @@ def run(
     critic_model = os.getenv("CRITIC_LLM_MODEL") or os.getenv("LLM_MODEL") or default_model
 
     mode = os.getenv("MODE") or mode or "dual"
-    
+
     if os.getenv("EDITOR_LLM_MODEL") is None and os.getenv("LLM_MODEL") is None:
         if editor_provider == "openai":
             editor_model = "gpt-4o"
@@ -180,7 +519,13 @@ def run(
     critic = None
     if mode == "dual":
         critic = CriticAgent(model_name=critic_model, provider=critic_provider)
-    runner = SlidevRunner(work_dir=str(Path(__file__).resolve().parents[1]))
+        if critic_batch_size > 0:
+            critic.batch_size = critic_batch_size
+    if runner is None:
+        work_dir = str(Path(__file__).resolve().parents[1])
+        runner = SlidevRunner(work_dir=work_dir, use_server=True) if render_server else SlidevRunner(work_dir=work_dir)
+        if render_shards > 0:
+            runner.shards = render_shards
 
     if mode == "dual":
         output_dir = os.path.join(output_dir, "dual_output")
@@ -191,10 +536,14 @@ def run(
     history_dir = os.path.join(output_dir, "history")
     logs_dir = os.path.join(output_dir, "logs")
     images_dir = os.path.join(current_dir, "images")
-    
+    slides_path = os.path.join(current_dir, "slides.md")
+
     ensure_dir(current_dir)
     ensure_dir(history_dir)
     ensure_dir(logs_dir)
+    # History is archived as links into a shared content-addressed store, on a
+    # background thread that overlaps with the next editor call.
+    blob_store = BlobStore.from_env(os.path.dirname(output_dir))
 
     feedback: List[dict] = []
     slides_md = ""
@@ -202,242 +551,900 @@ def run(
     last_success_md = ""
     last_render_error: str | None = None
     need_fix = False
+    last_reviewed_images: List[str] = []
+    last_review_feedback: List[dict] = []
     total_input_tokens = 0
     total_output_tokens = 0
+    total_cached_tokens = 0
     total_cost = 0.0
     iteration_metrics: List[dict] = []
+    outline_seconds = 0.0
+
+    if checkpoint is None:
+        checkpoint = RunCheckpoint(os.path.join(output_dir, CHECKPOINT_FILE))
+        checkpoint.state["settings"] = {
+            "input_path": input_path,
+            "output_dir": os.path.dirname(output_dir),
+            "max_iterations": max_iterations,
+            "model_name": model_name,
+            "mode": mode,
+            "refine_mode": refine_mode,
+            "critic_batch_size": critic_batch_size,
+            "visual_diff": visual_diff,
+        }
+    else:
+        state = checkpoint.state
+        outline_md = state["outline_md"]
+        slides_md = state.get("slides_md", "")
+        last_success_md = state.get("last_success_md", "")
+        last_render_error = state.get("last_render_error")
+        need_fix = state.get("need_fix", False)
+        feedback = state.get("feedback", [])
+        last_reviewed_images = state.get("last_reviewed_images", [])
+        last_review_feedback = state.get("last_review_feedback", [])
+        total_input_tokens = state.get("total_input_tokens", 0)
+        total_output_tokens = state.get("total_output_tokens", 0)
+        total_cached_tokens = state.get("total_cached_tokens", 0)
+        total_cost = state.get("total_cost", 0.0)
+        iteration_metrics = state.get("iteration_metrics", [])
+        outline_seconds = state.get("outline_seconds", 0.0)
+        agent_states = state.get("agents", {})
+        editor.load_state(agent_states.get("editor", {}))
+        if critic is not None and "critic" in agent_states:
+            critic.load_state(agent_states["critic"])
+
+    def save_checkpoint(stage: str, iteration: int = 0, **iteration_state) -> None:
+        """Record the run after a completed stage; `iteration_state` is the partial iteration."""
+        agents = {"editor": editor.export_state()}
+        if critic is not None:
+            agents["critic"] = critic.export_state()
+        checkpoint.save(
+            stage,
+            iteration,
+            iteration_state=iteration_state,
+            outline_md=outline_md,
+            outline_seconds=outline_seconds,
+            slides_md=slides_md,
+            last_success_md=last_success_md,
+            last_render_error=last_render_error,
+            need_fix=need_fix,
+            feedback=feedback,
+            last_reviewed_images=last_reviewed_images,
+            last_review_feedback=last_review_feedback,
+            total_input_tokens=total_input_tokens,
+            total_output_tokens=total_output_tokens,
+            total_cached_tokens=total_cached_tokens,
+            total_cost=total_cost,
+            iteration_metrics=iteration_metrics,
+            agents=agents,
+        )
 
     run_stamp = time.strftime("%Y%m%d_%H%M%S")
     run_log_path = os.path.join(logs_dir, f"run_{run_stamp}.log")
+    tracer = Tracer(event_log=os.path.join(logs_dir, f"trace_{run_stamp}.jsonl"))
+    tracer_token = tracer.activate()
+    profiler = None
+    profile_modes = parse_profile_modes(profile)
+    if profile_modes:
+        profiler = StageProfiler(profile_modes, logs_dir, run_stamp)
+        tracer.listeners.append(profiler)
+    # A resumed run keeps its id, so its iterations and calls stay together.
+    run_id = checkpoint.state.setdefault("run_id", f"{run_stamp}_{uuid.uuid4().hex[:8]}")
+    run_db = RunDB.from_env()
+    run_db.start_run(run_id, input_path, output_dir, mode, editor_model, critic_model if critic else None)
+    tracer.listeners.append(RunRecorder(run_db, run_id))
+    run_span = tracer.start("run", mode=mode, editor_model=editor_model, critic_model=critic_model if critic else None)
+    history_writer = HistoryWriter()
+    iteration_span: Span | None = None
+    trace_path: str | None = None
+
+    def finish_trace() -> str:
+        nonlocal trace_path
+        if trace_path is None:
+            tracer.end(run_span)
+            Tracer.deactivate(tracer_token)
+            trace_path = tracer.export_chrome(os.path.join(logs_dir, f"trace_{run_stamp}.chrome.json"))
+        return trace_path
+
+    try:
 
-    def append_run_log(message: str) -> None:
-        line = f"[{time.strftime('%H:%M:%S')}] {message}\n"
-        with open(run_log_path, "a", encoding="utf-8") as f:
-            f.write(line)
-        typer.echo(message)
-
-    # Outline
-    append_run_log("Editor: generating outline")
-    outline_md = editor.generate_outline(raw_content)
-    outline_log_path = os.path.join(logs_dir, f"outline_{run_stamp}.md")
-    outline_path = os.path.join(current_dir, "outline.md")
-    write_text_file(outline_log_path, outline_md)
-    write_text_file(outline_path, outline_md)
-    append_run_log(f"Outline saved to {outline_path}")
-
-    if not typer.confirm("Outline generated. Start iteration?", default=True):
-        append_run_log("User stopped after outline generation.")
-        typer.echo(f"Outline saved at {outline_path}")
-        return
-
-
-    # Editor: Slides
-    for iteration in range(1, max_iterations + 1):
-        
-        iteration_start = time.time()
-        # editor_adjustments: List[dict] = []
-        # editor_summary: dict = {}
-        iteration_input_tokens = 0
-        iteration_output_tokens = 0
-        iteration_cost = 0.0
-        agent_breakdown: dict = {}
-
-        append_run_log(f"\nIteration {iteration}/{max_iterations} started")
-
-        # slides.md
-        if iteration == 1:
-            append_run_log("Editor: generating draft")
-            slides_md = editor.generate_draft(raw_content, outline=outline_md)
-        elif need_fix:
-            append_run_log("Editor: fixing slides after render error")
-            slides_md = editor.fix_slides(slides_md, last_render_error or "")
+        def append_run_log(message: str) -> None:
+            line = f"[{time.strftime('%H:%M:%S')}] {message}\n"
+            with open(run_log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+            typer.echo(message)
+            if on_event is not None:
+                on_event("log", {"message": message.strip()})
+
+        def lint_and_render(markdown: str, candidate_path: str, attempt: int = 1) -> dict:
+            write_text_file(candidate_path, markdown)
+            with tracer.span("lint", attempt=attempt) as lint_span:
+                lint_issues = lint_slides(markdown)
+                lint_span.set(issues=len(lint_issues))
+            lint_seconds = lint_span.duration
+            lint_errors = [issue for issue in lint_issues if issue.severity == "ERROR"]
+            lint_warnings = [issue for issue in lint_issues if issue.severity != "ERROR"]
+            if lint_warnings:
+                append_run_log(f"Lint warnings:\n{format_issues(lint_warnings)}")
+
+            # The previous iteration's archive still reads the images about to be replaced.
+            history_writer.wait()
+            clear_dir(images_dir)
+            outcome = {
+                "image_paths": [],
+                "error": None,
+                "render_skipped": False,
+                "render_seconds": 0.0,
+                "lint_issues": lint_issues,
+                "lint_errors": lint_errors,
+                "lint_seconds": lint_seconds,
+            }
+            if lint_errors:
+                outcome["render_skipped"] = True
+                outcome["error"] = "Slidev lint errors (render skipped):\n" + format_issues(lint_errors)
+                append_run_log(
+                    f"Lint found {len(lint_errors)} error(s) in {lint_seconds * 1000:.1f}ms. Skipping render"
+                )
+                return outcome
+
+            append_run_log("Rendering slides to images")
+            with tracer.span("render", attempt=attempt) as render_span:
+                try:
+                    outcome["image_paths"] = runner.render_slides(candidate_path, images_dir)
+                    render_span.set(**runner.last_render_stats)
+                except RenderError as e:
+                    outcome["error"] = str(e)
+                    render_span.set(error=str(e)[:200], error_kind=e.kind, failed_slides=len(e.slides) or None)
+            outcome["render_seconds"] = render_span.duration
+            return outcome
+
+        if stream or os.getenv("LLM_STREAM", "").strip().lower() in {"1", "true", "yes", "on"}:
+            editor.stream_path = os.path.join(current_dir, "slides_candidate.md")
+
+            def log_streamed_slide(slide, issues) -> None:
+                errors = [issue for issue in issues if issue.severity == "ERROR"]
+                if errors:
+                    append_run_log(f"Streamed slide {slide.index} has lint errors:\n{format_issues(errors)}")
+
+            editor.on_streamed_slide = log_streamed_slide
+
+        # Outline
+        outline_path = os.path.join(current_dir, "outline.md")
+        if checkpoint.completed("outline"):
+            stage, stage_iteration = checkpoint.resumed_from
+            if stage == "outline":
+                resume_point = "after the outline"
+            elif stage == "iteration":
+                resume_point = f"after iteration {stage_iteration}"
+            else:
+                resume_point = f"in iteration {stage_iteration}, after {stage}"
+            append_run_log(f"Resuming {output_dir} {resume_point}")
+            approved_before = stage == "iteration" and is_approved(feedback)
+            if checkpoint.finished or approved_before or checkpoint.next_iteration > max_iterations:
+                append_run_log("Run already finished. Nothing to resume.")
+                if profiler is not None:
+                    profiler.finish()
+                run_db.finish_run(
+                    run_id, DONE, approved=is_approved(feedback), slides=len(split_slides(last_success_md or slides_md))
+                )
+                return {"output_dir": output_dir, "stopped": True, "iterations": len(iteration_metrics)}
         else:
-            append_run_log("Editor: refining slides")
-            slides_md = editor.refine_slides(slides_md, feedback)
-            
+            append_run_log("Editor: generating outline")
+            with tracer.span("outline", model=editor_model) as outline_span:
+                outline_md = editor.generate_outline(raw_content)
+            outline_seconds = outline_span.duration
+            outline_log_path = os.path.join(logs_dir, f"outline_{run_stamp}.md")
+            write_text_file(outline_log_path, outline_md)
+            write_text_file(outline_path, outline_md)
+            append_run_log(f"Outline saved to {outline_path}")
+            save_checkpoint("outline")
+
+        if (
+            interactive
+            and not checkpoint.resumed_from
+            and not typer.confirm("Outline generated. Start iteration?", default=True)
+        ):
+            append_run_log("User stopped after outline generation.")
+            typer.echo(f"Outline saved at {outline_path}")
+            if profiler is not None:
+                profiler.finish()
+            run_db.finish_run(run_id, STOPPED)
+            return {"output_dir": output_dir, "outline_path": outline_path, "stopped": True, "iterations": 0}
+
+        # Editor: Slides
+        last_iteration = checkpoint.next_iteration - 1
+        for iteration in range(checkpoint.next_iteration, max_iterations + 1):
+            last_iteration = iteration
+            iteration_span = tracer.start("iteration", iteration=iteration)
+            # editor_adjustments: List[dict] = []
+            # editor_summary: dict = {}
+            iteration_input_tokens = 0
+            iteration_output_tokens = 0
+            iteration_cached_tokens = 0
+            iteration_cost = 0.0
+            agent_breakdown: dict = {}
+            repair_metrics: dict = {}
+            refine_stats: dict = {}
+            visual_diff_metrics: dict = {}
+            review_summary = None
+            editor_called = True
+            response_cache = LLMCache.shared()
+            cache_stats_start = response_cache.stats() if response_cache else {}
+
+            append_run_log(f"\nIteration {iteration}/{max_iterations} started")
+
+            # Partial results of this iteration, restored when resuming inside it.
+            progress = checkpoint.iteration_state(iteration)
+            if progress:
+                agent_breakdown = progress["agent_breakdown"]
+                repair_metrics = progress["repair_metrics"]
+                refine_stats = progress["refine_stats"]
+                editor_called = progress["editor_called"]
+
+            # slides.md
+            if checkpoint.completed("editor", iteration):
+                append_run_log("Editor output restored from checkpoint")
+            else:
+                with tracer.span("editor", model=editor_model) as editor_span:
+                    if iteration == 1:
+                        append_run_log("Editor: generating draft")
+                        editor_span.set(action="draft")
+                        slides_md = editor.generate_draft(raw_content, outline=outline_md)
+                    elif need_fix:
+                        append_run_log("Editor: fixing slides after render error")
+                        editor_span.set(action="fix")
+                        slides_md = editor.fix_slides(slides_md, last_render_error or "")
+                    else:
+                        editor_span.set(action="refine", feedback=len(feedback))
+                        feedback_repair = repair_feedback(slides_md, feedback)
+                        if feedback_repair.changed:
+                            slides_md = feedback_repair.markdown
+                            repair_metrics["feedback_fixes"] = list(feedback_repair.applied)
+                            append_run_log(f"Local repair resolved feedback: {', '.join(feedback_repair.applied)}")
+                        if feedback_repair.remaining_feedback:
+                            if refine_mode == "page":
+                                append_run_log("Editor: refining slides with feedback")
+                                slides_md = editor.refine_pages(slides_md, feedback_repair.remaining_feedback)
+                                refine_stats = dict(editor.last_refine_stats)
+                                if refine_stats.get("mode") == "page":
+                                    append_run_log(
+                                        f"Refined pages {refine_stats['pages']} individually "
+                                        f"(~{refine_stats['output_tokens_saved']} output tokens saved)"
+                                    )
+                                else:
+                                    append_run_log("Feedback is structural. Rewrote the full deck")
+                            else:
+                                append_run_log("Editor: refining slides")
+                                slides_md = editor.refine_slides(slides_md, feedback_repair.remaining_feedback)
+                        else:
+                            editor_called = False
+                            append_run_log("All feedback resolved locally. Skipping editor call")
+
+                    slides_md = strip_code_fence(slides_md)
+                    editor_span.set(called=editor_called, slides=len(split_slides(slides_md)))
+
+                if editor_called:
+                    editor_log_path = os.path.join(logs_dir, f"iter_{iteration}_editor.txt")
+                    editor_output = editor.last_response or slides_md
+                    write_text_file(editor_log_path, editor_output)
+                    append_run_log(f"Editor output saved to {editor_log_path}")
+
+                if editor_called and editor.last_response_usage:
+                    agent_breakdown["Editor"] = usage_breakdown(editor.last_response_usage)
+                    if editor.last_prompt_stats:
+                        agent_breakdown["Editor"]["prompt_tokens_estimate"] = editor.last_prompt_stats.get(
+                            "prompt_tokens_estimate", 0
+                        )
+                        agent_breakdown["Editor"]["history_turns"] = editor.last_prompt_stats.get("history_turns", 0)
+                    if editor.last_response_ttft is not None:
+                        agent_breakdown["Editor"]["ttft_seconds"] = editor.last_response_ttft
+
+                progress.update(
+                    agent_breakdown=agent_breakdown,
+                    repair_metrics=repair_metrics,
+                    refine_stats=refine_stats,
+                    editor_called=editor_called,
+                )
+                save_checkpoint("editor", iteration, **progress)
+
+            # Render
+            candidate_path = os.path.join(current_dir, "slides_candidate.md")
+            rendered_log_path = os.path.join(logs_dir, f"iter_{iteration}_rendered.md")
+            write_text_file(rendered_log_path, slides_md)
+            append_run_log(f"Rendered markdown saved to {rendered_log_path}")
+
+            if checkpoint.completed("render", iteration) and all(
+                os.path.exists(path) for path in progress["image_paths"]
+            ):
+                append_run_log("Render result restored from checkpoint")
+                image_paths = progress["image_paths"]
+                render_error = progress["render_error"]
+                render_seconds = progress["render_seconds"]
+                render_skipped = progress["render_skipped"]
+                render_stats = progress["render_stats"]
+                lint_error_count = progress["lint_errors"]
+                lint_seconds = progress["lint_seconds"]
+                lint_blocked = progress["lint_blocked"]
+            else:
+                outcome = lint_and_render(slides_md, candidate_path)
+                render_skipped = outcome["render_skipped"]
+                if outcome["error"]:
+                    with tracer.span("repair") as repair_span:
+                        repair = auto_repair(slides_md, outcome["lint_issues"], outcome["error"])
+                        repair_span.set(error_class=repair.error_class, fixes=len(repair.applied))
+                    repair_metrics["error_class"] = repair.error_class
+                    if repair.changed:
+                        append_run_log(f"Local auto-repair applied: {', '.join(repair.applied)}")
+                        repaired = lint_and_render(repair.markdown, candidate_path, attempt=2)
+                        repair_metrics["fixes"] = list(repair.applied)
+                        repair_metrics["succeeded"] = not repaired["error"]
+                        repaired["render_seconds"] += outcome["render_seconds"]
+                        slides_md = repair.markdown
+                        outcome = repaired
+                        write_text_file(rendered_log_path, slides_md)
+                        if repaired["error"]:
+                            append_run_log("Local repair did not resolve the error")
+                        else:
+                            append_run_log("Local repair succeeded. Skipping LLM fix")
+
+                image_paths = outcome["image_paths"]
+                render_error = outcome["error"]
+                render_seconds = outcome["render_seconds"]
+                lint_error_count = len(outcome["lint_errors"])
+                lint_seconds = outcome["lint_seconds"]
+                lint_blocked = outcome["render_skipped"]
+                render_stats = dict(runner.last_render_stats) if not render_error else {}
+                progress.update(
+                    repair_metrics=repair_metrics,
+                    image_paths=image_paths,
+                    render_error=render_error,
+                    render_seconds=render_seconds,
+                    render_skipped=render_skipped,
+                    render_stats=render_stats,
+                    lint_errors=lint_error_count,
+                    lint_seconds=lint_seconds,
+                    lint_blocked=lint_blocked,
+                )
+                save_checkpoint("render", iteration, **progress)
+
+            if render_error and not lint_blocked:
+                append_run_log("Render failed. Sending error back to editor for fixes")
+
+            if render_error:
+                need_fix = True
+                last_render_error = render_error
+                feedback = [
+                    {
+                        "issue": "Lint Error" if lint_blocked else "Render Error",
+                        "details": render_error,
+                        "severity": "CRITICAL",
+                    }
+                ]
+                critic_log_path = os.path.join(logs_dir, f"iter_{iteration}_critic.txt")
+                write_text_file(critic_log_path, json.dumps(feedback, ensure_ascii=False, indent=2))
+                append_run_log(f"Render error logged to {critic_log_path}")
+            else:
+                need_fix = False
+                last_render_error = None
+                last_success_md = slides_md
+                write_text_file(slides_path, slides_md)
+                append_run_log(
+                    f"Rendered {len(image_paths)} slide images "
+                    f"({render_stats.get('rendered', len(image_paths))} rendered, {render_stats.get('cached', 0)} from cache)"
+                )
 
-        slides_md = strip_code_fence(slides_md)
+                if checkpoint.completed("review", iteration):
+                    append_run_log("Review feedback restored from checkpoint")
+                    visual_diff_metrics = progress["visual_diff_metrics"]
+                    review_summary = progress.get("review_summary")
+                else:
+                    reviewer = critic if mode == "dual" else editor
+                    review_pages = None
+                    carried_feedback: List[dict] = []
+                    if (
+                        visual_diff
+                        and last_reviewed_images
+                        and all(os.path.exists(path) for path in last_reviewed_images)
+                        and reviewer.llm_client.supports_vision()
+                    ):
+                        slide_diff = diff_slides(image_paths, last_reviewed_images)
+                        review_pages = slide_diff.changed
+                        carried_feedback = carry_forward_feedback(last_review_feedback, slide_diff.unchanged)
+                        preparer = ImagePreparer.shared()
+                        visual_diff_metrics = {
+                            "slides": len(image_paths),
+                            "reviewed": len(slide_diff.changed),
+                            "skipped": len(slide_diff.unchanged),
+                            "carried_feedback": len(carried_feedback),
+                            "image_tokens_saved": sum(
+                                preparer.estimate_tokens(image_paths[page - 1]) for page in slide_diff.unchanged
+                            ),
+                        }
+                        append_run_log(
+                            f"Visual diff: {len(slide_diff.changed)} changed, {len(slide_diff.unchanged)} unchanged "
+                            f"({len(carried_feedback)} earlier feedback item(s) carried forward)"
+                        )
+
+                    with tracer.span(
+                        "review",
+                        reviewer="critic" if mode == "dual" else "editor",
+                        slides=len(image_paths),
+                        pages=len(review_pages) if review_pages is not None else len(image_paths),
+                    ) as review_span:
+                        if review_pages == []:
+                            append_run_log("No slide changed visually since the last review. Skipping review")
+                            feedback = carried_feedback
+                            critic_log_path = os.path.join(logs_dir, f"iter_{iteration}_critic.txt")
+                            write_text_file(critic_log_path, feedback_log_text(None, feedback))
+                        elif mode == "dual":
+                            append_run_log("Critic: reviewing slides")
+                            feedback = critic.review(image_paths, slides_md=slides_md, pages=review_pages)
+                            if len(critic.last_review_windows) > 1:
+                                append_run_log(
+                                    f"Critic reviewed {len(critic.last_review_windows)} slide windows concurrently"
+                                )
+                            critic_log_path = os.path.join(logs_dir, f"iter_{iteration}_critic.txt")
+                            critic_output = critic.last_response or json.dumps(feedback, ensure_ascii=False, indent=2)
+                            review_summary = review_summary_of(critic.last_response)
+                            if carried_feedback:
+                                feedback = merge_carried_feedback(feedback, carried_feedback)
+                                critic_output = feedback_log_text(critic.last_response, feedback)
+                            write_text_file(critic_log_path, critic_output)
+                            append_run_log(f"Critic output saved to {critic_log_path}")
+
+                            if critic.last_response_usage:
+                                agent_breakdown["Critic"] = usage_breakdown(critic.last_response_usage)
+                                if critic.last_prompt_stats:
+                                    agent_breakdown["Critic"]["prompt_tokens_estimate"] = critic.last_prompt_stats.get(
+                                        "prompt_tokens_estimate", 0
+                                    )
+                                    agent_breakdown["Critic"]["history_turns"] = critic.last_prompt_stats.get(
+                                        "history_turns", 0
+                                    )
+                                if critic.last_image_stats:
+                                    agent_breakdown["Critic"]["images"] = critic.last_image_stats.get("images", 0)
+                                    agent_breakdown["Critic"]["image_bytes"] = critic.last_image_stats.get("bytes", 0)
+                                    agent_breakdown["Critic"]["image_tokens"] = critic.last_image_stats.get("tokens", 0)
+                        else:
+                            append_run_log("Editor: self-reviewing slides")
+                            feedback = editor.self_review(image_paths, slides_md=slides_md, pages=review_pages)
+                            critic_log_path = os.path.join(logs_dir, f"iter_{iteration}_critic.txt")
+                            critic_output = editor.last_response or json.dumps(feedback, ensure_ascii=False, indent=2)
+                            review_summary = review_summary_of(editor.last_response)
+                            if carried_feedback:
+                                feedback = merge_carried_feedback(feedback, carried_feedback)
+                                critic_output = feedback_log_text(editor.last_response, feedback)
+                            write_text_file(critic_log_path, critic_output)
+                            append_run_log(f"Self-review output saved to {critic_log_path}")
+
+                            if editor.last_response_usage:
+                                agent_breakdown["Editor(Self-Review)"] = usage_breakdown(editor.last_response_usage)
+                                if editor.last_prompt_stats:
+                                    agent_breakdown["Editor(Self-Review)"]["prompt_tokens_estimate"] = (
+                                        editor.last_prompt_stats.get("prompt_tokens_estimate", 0)
+                                    )
+                                    agent_breakdown["Editor(Self-Review)"]["history_turns"] = (
+                                        editor.last_prompt_stats.get("history_turns", 0)
+                                    )
+                                if editor.last_image_stats:
+                                    agent_breakdown["Editor(Self-Review)"]["images"] = editor.last_image_stats.get(
+                                        "images", 0
+                                    )
+                                    agent_breakdown["Editor(Self-Review)"]["image_bytes"] = editor.last_image_stats.get(
+                                        "bytes", 0
+                                    )
+                                    agent_breakdown["Editor(Self-Review)"]["image_tokens"] = (
+                                        editor.last_image_stats.get("tokens", 0)
+                                    )
+                        review_span.set(feedback=len(feedback))
+                    progress.update(
+                        agent_breakdown=agent_breakdown,
+                        visual_diff_metrics=visual_diff_metrics,
+                        review_summary=review_summary,
+                    )
+                    save_checkpoint("review", iteration, **progress)
+
+            with tracer.span("archive", images=len(image_paths)):
+                iter_dir = os.path.join(history_dir, f"iter_{iteration}")
+                ensure_dir(iter_dir)
+                source_slides_path = slides_path if Path(slides_path).exists() else candidate_path
+                archived_slides = read_text_file(source_slides_path)
+                history_writer.submit(
+                    archive_iteration,
+                    blob_store,
+                    iter_dir,
+                    archived_slides,
+                    list(image_paths),
+                    list(feedback),
+                    slides_links=[rendered_log_path] if archived_slides == slides_md else [],
+                )
+                if image_paths and not render_error:
+                    images_history = os.path.join(iter_dir, "images")
+                    last_reviewed_images = [os.path.join(images_history, os.path.basename(img)) for img in image_paths]
+                    last_review_feedback = list(feedback)
+
+            for usage in agent_breakdown.values():
+                iteration_input_tokens += usage["input_tokens"]
+                iteration_output_tokens += usage["output_tokens"]
+                iteration_cached_tokens += usage["cached_tokens"]
+                iteration_cost += usage["cost"]
+            total_input_tokens += iteration_input_tokens
+            total_output_tokens += iteration_output_tokens
+            total_cached_tokens += iteration_cached_tokens
+            total_cost += iteration_cost
+
+            tracer.end(
+                iteration_span.set(
+                    input_tokens=iteration_input_tokens,
+                    output_tokens=iteration_output_tokens,
+                    cached_tokens=iteration_cached_tokens,
+                    feedback=len(feedback),
+                    render_error=bool(render_error),
+                )
+            )
+            iteration_duration = iteration_span.duration
+            iteration_metrics.append(
+                {
+                    "iteration": iteration,
+                    "duration_seconds": iteration_duration,
+                    "input_tokens": iteration_input_tokens,
+                    "output_tokens": iteration_output_tokens,
+                    "cached_tokens": iteration_cached_tokens,
+                    "cost": iteration_cost,
+                    "agent_breakdown": agent_breakdown,
+                    "render_stats": render_stats,
+                    "render_seconds": render_seconds,
+                    "stage_seconds": stage_seconds(tracer, iteration_span),
+                    "render_skipped": render_skipped,
+                    "lint_errors": lint_error_count,
+                    "lint_seconds": lint_seconds,
+                    "repair": repair_metrics,
+                    "refine": refine_stats,
+                    "visual_diff": visual_diff_metrics,
+                    "llm_cache": {
+                        key: value - cache_stats_start.get(key, 0) for key, value in response_cache.stats().items()
+                    }
+                    if response_cache
+                    else {},
+                }
+            )
+            run_db.record_iteration(
+                run_id,
+                iteration_metrics[-1],
+                slides=len(image_paths),
+                render_error=render_error,
+                approved=is_approved(feedback),
+                feedback=feedback,
+                review_summary=review_summary,
+            )
+            save_checkpoint("iteration", iteration)
+
+            if on_event is not None:
+                on_event(
+                    "iteration",
+                    {
+                        "iteration": iteration,
+                        "duration_seconds": iteration_duration,
+                        "input_tokens": iteration_input_tokens,
+                        "output_tokens": iteration_output_tokens,
+                        "cost": iteration_cost,
+                        "slides": len(image_paths),
+                        "feedback": len(feedback),
+                        "render_error": bool(render_error),
+                        "approved": is_approved(feedback),
+                    },
+                )
+            if is_approved(feedback):
+                append_run_log("Approved. Stopping iterations.")
+                break
+            append_run_log("Not approved. Continuing to next iteration.")
+
+        history_writer.close()
+        checkpoint.state["finished"] = True
+        save_checkpoint("iteration", last_iteration)
+        final_md = last_success_md or slides_md
+        write_text_file(slides_path, final_md)
+        run_db.finish_run(run_id, DONE, approved=is_approved(feedback), slides=len(split_slides(final_md)))
+        elapsed = time.time() - start_time
+        typer.echo(f"Done. Final slides at {current_dir}/slides.md")
+        typer.echo(f"Elapsed: {elapsed:.2f}s")
+
+        if profiler is not None:
+            profiler.finish()
+            append_run_log(f"Profiles written to {logs_dir}")
+        with tracer.span("report"):
+            summary_report_path = generate_iteration_summary_report(
+                logs_dir=logs_dir,
+                mode=mode,
+                run_stamp=run_stamp,
+                run_db=run_db,
+                run_id=run_id,
+                llm_cache_stats=LLMCache.shared().stats() if LLMCache.shared() else None,
+                tracer=tracer,
+                profiler=profiler,
+                history_store_stats=blob_store.stats,
+            )
+        typer.echo(f"Iteration summary generated at {summary_report_path}")
+        trace_path = finish_trace()
+        typer.echo(f"Trace written to {trace_path} (open in https://ui.perfetto.dev)")
+        return {
+            "run_id": run_id,
+            "output_dir": output_dir,
+            "slides_path": slides_path,
+            "summary_report_path": summary_report_path,
+            "trace_path": trace_path,
+            "stopped": False,
+            "approved": is_approved(feedback),
+            "iterations": last_iteration,
+            "iteration_metrics": iteration_metrics,
+            "outline_seconds": outline_seconds,
+            "elapsed_seconds": elapsed,
+            "total_input_tokens": total_input_tokens,
+            "total_output_tokens": total_output_tokens,
+            "total_cached_tokens": total_cached_tokens,
+            "total_cost": total_cost,
+        }
+    except BaseException as err:
+        # LLM retries exhausted, an unexpected renderer error, Ctrl-C: the run row must not stay "running".
+        if iteration_span is not None:
+            tracer.end(iteration_span, error=err)
+        tracer.end(run_span, error=err)
+        run_db.finish_run(run_id, FAILED, slides=len(split_slides(last_success_md or slides_md)))
+        raise
+    finally:
+        try:
+            history_writer.close()
+        finally:
+            finish_trace()
+            run_db.close()
 
-        editor_log_path = os.path.join(logs_dir, f"iter_{iteration}_editor.txt")
-        editor_output = editor.last_response or slides_md
-        write_text_file(editor_log_path, editor_output)
-        append_run_log(f"Editor output saved to {editor_log_path}")
 
-        if editor.last_response_usage:
-            editor_usage = editor.last_response_usage
-            if "input_tokens" in editor_usage:
-                editor_input = editor_usage.get("input_tokens", 0)
-            else:
-                editor_input = editor_usage.get("prompt_tokens", 0)
-            if "output_tokens" in editor_usage:
-                editor_output = editor_usage.get("output_tokens", 0) + editor_usage.get("reasoning_tokens", 0)
-            else:
-                editor_output = editor_usage.get("completion_tokens", 0)
-            editor_cost = LLMClient.calculate_context_cost(editor_input, editor_output)
-            total_input_tokens += editor_input
-            total_output_tokens += editor_output
-            total_cost += editor_cost
-            iteration_input_tokens += editor_input
-            iteration_output_tokens += editor_output
-            iteration_cost += editor_cost
-            agent_breakdown["Editor"] = {
-                "input_tokens": editor_input,
-                "output_tokens": editor_output,
-                "cost": editor_cost,
-            }
+POOL_SERVER_DIR = ".slidev-render/pool"
 
 
-        # Render
-        slides_path = os.path.join(current_dir, "slides.md")
-        candidate_path = os.path.join(current_dir, "slides_candidate.md")
-        write_text_file(candidate_path, slides_md)
-        rendered_log_path = os.path.join(logs_dir, f"iter_{iteration}_rendered.md")
-        write_text_file(rendered_log_path, slides_md)
-        append_run_log(f"Rendered markdown saved to {rendered_log_path}")
+def pooled_runner_factory(work_dir: str, render_server: bool, render_shards: int) -> Callable[[int], SlidevRunner]:
+    """Runner factory for a RenderPool. With `render_server`, each slot gets its own server
+    (state dir, ports and entry file): one server renders one deck at a time."""
 
-        append_run_log("Rendering slides to images")
-        clear_dir(images_dir)
-        image_paths = []
-        render_error = None
-        try:
-            image_paths = runner.render_slides(candidate_path, images_dir)
-        except RenderError as e:
-            render_error = str(e)
-            append_run_log("Render failed. Sending error back to editor for fixes")
-
-        if render_error:
-            need_fix = True
-            last_render_error = render_error
-            feedback = [
-                {
-                    "issue": "Render Error",
-                    "details": render_error,
-                    "severity": "CRITICAL",
-                }
-            ]
-            critic_log_path = os.path.join(logs_dir, f"iter_{iteration}_critic.txt")
-            write_text_file(critic_log_path, json.dumps(feedback, ensure_ascii=False, indent=2))
-            append_run_log(f"Render error logged to {critic_log_path}")
+    def make_runner(slot: int) -> SlidevRunner:
+        if render_server:
+            server = RenderServer(work_dir=work_dir, state_dir=f"{POOL_SERVER_DIR}/{slot}")
+            runner = SlidevRunner(work_dir=work_dir, use_server=True, server=server)
         else:
-            need_fix = False
-            last_render_error = None
-            last_success_md = slides_md
-            write_text_file(slides_path, slides_md)
-            append_run_log(f"Rendered {len(image_paths)} slide images")
-
-            if mode == "dual":
-                append_run_log("Critic: reviewing slides")
-                feedback = critic.review(image_paths, slides_md=slides_md)
-                critic_log_path = os.path.join(logs_dir, f"iter_{iteration}_critic.txt")
-                critic_output = critic.last_response or json.dumps(feedback, ensure_ascii=False, indent=2)
-                write_text_file(critic_log_path, critic_output)
-                append_run_log(f"Critic output saved to {critic_log_path}")
-
-                if critic.last_response_usage:
-                    critic_usage = critic.last_response_usage
-                    if "input_tokens" in critic_usage:
-                        critic_input = critic_usage.get("input_tokens", 0)
-                    else:
-                        critic_input = critic_usage.get("prompt_tokens", 0)
-                    if "output_tokens" in critic_usage:
-                        critic_output_tokens = critic_usage.get("output_tokens", 0) + critic_usage.get("reasoning_tokens", 0)
-                    else:
-                        critic_output_tokens = critic_usage.get("completion_tokens", 0)
-                    critic_cost = LLMClient.calculate_context_cost(critic_input, critic_output_tokens)
-                    total_input_tokens += critic_input
-                    total_output_tokens += critic_output_tokens
-                    total_cost += critic_cost
-                    iteration_input_tokens += critic_input
-                    iteration_output_tokens += critic_output_tokens
-                    iteration_cost += critic_cost
-                    agent_breakdown["Critic"] = {
-                        "input_tokens": critic_input,
-                        "output_tokens": critic_output_tokens,
-                        "cost": critic_cost,
-                    }
-            else:
-                append_run_log("Editor: self-reviewing slides")
-                feedback = editor.self_review(image_paths, slides_md=slides_md)
-                critic_log_path = os.path.join(logs_dir, f"iter_{iteration}_critic.txt")
-                critic_output = editor.last_response or json.dumps(feedback, ensure_ascii=False, indent=2)
-                write_text_file(critic_log_path, critic_output)
-                append_run_log(f"Self-review output saved to {critic_log_path}")
-
-                if editor.last_response_usage:
-                    review_usage = editor.last_response_usage
-                    if "input_tokens" in review_usage:
-                        review_input = review_usage.get("input_tokens", 0)
-                    else:
-                        review_input = review_usage.get("prompt_tokens", 0)
-                    if "output_tokens" in review_usage:
-                        review_output = review_usage.get("output_tokens", 0) + review_usage.get("reasoning_tokens", 0)
-                    else:
-                        review_output = review_usage.get("completion_tokens", 0)
-                    review_cost = LLMClient.calculate_context_cost(review_input, review_output)
-                    total_input_tokens += review_input
-                    total_output_tokens += review_output
-                    total_cost += review_cost
-                    iteration_input_tokens += review_input
-                    iteration_output_tokens += review_output
-                    iteration_cost += review_cost
-                    agent_breakdown["Editor(Self-Review)"] = {
-                        "input_tokens": review_input,
-                        "output_tokens": review_output,
-                        "cost": review_cost,
-                    }
+            runner = SlidevRunner(work_dir=work_dir)
+        if render_shards > 0:
+            runner.shards = render_shards
+        return runner
 
+    return make_runner
 
-        iter_dir = os.path.join(history_dir, f"iter_{iteration}")
-        ensure_dir(iter_dir)
-        source_slides_path = slides_path if Path(slides_path).exists() else candidate_path
-        shutil.copy(source_slides_path, os.path.join(iter_dir, "slides.md"))
-        if image_paths:
-            images_history = os.path.join(iter_dir, "images")
-            clear_dir(images_history)
-            for img in image_paths:
-                shutil.copy(img, images_history)
-
-        critique_path = os.path.join(iter_dir, "critique.json")
-        with open(critique_path, "w", encoding="utf-8") as f:
-            json.dump(feedback, f, ensure_ascii=False, indent=2)
-
-        iteration_duration = time.time() - iteration_start
-        iteration_metrics.append(
-            {
-                "iteration": iteration,
-                "duration_seconds": iteration_duration,
-                "input_tokens": iteration_input_tokens,
-                "output_tokens": iteration_output_tokens,
-                "agent_breakdown": agent_breakdown,
-            }
+
+@app.command()
+def batch(
+    source: str,
+    output_dir: str = "outputs/batch",
+    max_iterations: int = 5,
+    model_name: str = "gpt-4o",
+    mode: str = "",
+    llm_concurrency: int = 4,
+    render_concurrency: int = 2,
+    render_server: bool = False,
+    render_shards: int = 0,
+    refine_mode: str = "page",
+    critic_batch_size: int = 0,
+    visual_diff: bool = True,
+):
+    """Run every input in a directory or manifest (.json/.jsonl/.csv) without prompts."""
+    load_dotenv()
+    try:
+        jobs = load_jobs(source, output_dir)
+    except (OSError, ValueError) as err:
+        typer.echo(f"Cannot load batch: {err}")
+        raise typer.Exit(code=1)
+    if not jobs:
+        typer.echo(f"No inputs found in {source}")
+        raise typer.Exit(code=1)
+    work_dir = str(Path(__file__).resolve().parents[1])
+
+    typer.echo(
+        f"Batch: {len(jobs)} job(s), {llm_concurrency} concurrent LLM request(s), {render_concurrency} concurrent render(s)"
+    )
+
+    def log_result(result) -> None:
+        status = "done" if result.ok else f"failed: {result.error}"
+        typer.echo(f"[batch] {result.name}: {status} ({result.seconds:.1f}s, ${result.cost:.4f})")
+
+    report = run_batch(
+        jobs,
+        run_pipeline,
+        RenderPool(
+            pooled_runner_factory(work_dir, render_server, render_shards),
+            render_concurrency,
+            backend="server" if render_server else "cli",
+        ),
+        llm_concurrency=llm_concurrency,
+        on_result=log_result,
+        max_iterations=max_iterations,
+        model_name=model_name,
+        mode=mode,
+        refine_mode=refine_mode,
+        critic_batch_size=critic_batch_size,
+        visual_diff=visual_diff,
+    )
+    markdown_path, json_path = write_batch_report(report, output_dir)
+    typer.echo(
+        f"Batch finished: {len(report.succeeded)}/{len(report.results)} succeeded, "
+        f"{report.decks_per_hour:.1f} decks/hour. Report at {markdown_path} ({json_path})"
+    )
+    if report.failed:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8700,
+    root: str = "outputs/service",
+    max_iterations: int = 5,
+    model_name: str = "gpt-4o",
+    mode: str = "",
+    llm_concurrency: int = 4,
+    render_concurrency: int = 2,
+    render_server: bool = True,
+    render_shards: int = 0,
+    refine_mode: str = "page",
+    critic_batch_size: int = 0,
+    visual_diff: bool = True,
+):
+    """Serve the pipeline as a local job queue over HTTP (jobs persist in <root>/queue.sqlite3)."""
+    load_dotenv()
+    work_dir = str(Path(__file__).resolve().parents[1])
+
+    service = PipelineService(
+        root,
+        run_pipeline,
+        RenderPool(
+            pooled_runner_factory(work_dir, render_server, render_shards),
+            render_concurrency,
+            backend="server" if render_server else "cli",
+        ),
+        llm_concurrency=llm_concurrency,
+        defaults={
+            "max_iterations": max_iterations,
+            "model_name": model_name,
+            "mode": mode,
+            "refine_mode": refine_mode,
+            "critic_batch_size": critic_batch_size,
+            "visual_diff": visual_diff,
+        },
+    )
+    recovered = service.start()
+    if recovered:
+        typer.echo(f"Requeued {recovered} job(s) interrupted by the last shutdown")
+    server = make_server(service, host=host, port=port)
+    typer.echo(
+        f"Pipeline service at http://{host}:{port} ({llm_concurrency} concurrent LLM request(s), "
+        f"{render_concurrency} concurrent render(s))"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+@app.command()
+def stats(db: str = "", last: int = 100):
+    """Render latency, LLM latency and cost per slide by model over the last runs in the run database."""
+    db = db or RunDB.default_path()
+    if not os.path.exists(db):
+        typer.echo(f"No run database at {db}")
+        raise typer.Exit(code=1)
+    run_db = RunDB(db)
+    run_ids = run_db.recent_run_ids(last)
+    if not run_ids:
+        typer.echo(f"No finished runs in {db}")
+        raise typer.Exit(code=1)
+    summary = run_db.run_summary(run_ids)
+    lines = [
+        f"# Run Stats (last {len(run_ids)} run(s))",
+        "",
+        f"- Period: {time.strftime('%Y-%m-%d %H:%M', time.localtime(summary['first']))} - "
+        f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(summary['last']))}",
+        f"- Approved: {summary['approved'] or 0}/{summary['runs']}, avg {summary['avg_iterations'] or 0:.1f} iterations",
+        f"- Total Cost: ${summary['cost'] or 0:.4f} for {summary['slides'] or 0} final slide(s)",
+    ]
+    render_latency = run_db.render_latency(run_ids)
+    if render_latency.get("count"):
+        lines.append(
+            f"- Render Latency: p50 {render_latency['p50']:.2f}s / p95 {render_latency['p95']:.2f}s / "
+            f"max {render_latency['max']:.2f}s over {render_latency['count']} render(s) "
+            f"({render_latency['errors']} of {render_latency['renders']} failed)"
         )
+    lines.append("")
+    model_stats = run_db.llm_by_model(run_ids)
+    if model_stats:
+        lines.extend(llm_model_lines(model_stats))
+    run_db.close()
+    typer.echo("\n".join(lines))
 
-        if is_approved(feedback):
-            append_run_log("Approved. Stopping iterations.")
-            break
-        append_run_log("Not approved. Continuing to next iteration.")
 
-    if last_success_md:
-        write_text_file(slides_path, last_success_md)
-    else:
-        write_text_file(slides_path, slides_md)
-    elapsed = time.time() - start_time
-    typer.echo(f"Done. Final slides at {current_dir}/slides.md")
-    typer.echo(f"Elapsed: {elapsed:.2f}s")
+@app.command()
+def mock_llm_server(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    recordings: str = "",
+    record: bool = False,
+    upstream_url: str = "",
+    latency_ms: float = 0.0,
+    tokens_per_second: float = 0.0,
+    deck_slides: int = 12,
+):
+    """Serve an OpenAI-compatible mock API (point OPENAI_BASE_URL at it)."""
+    load_dotenv()
+    upstream = None
+    if record:
+        upstream = upstream_url or os.getenv("OPENAI_UPSTREAM_URL") or "https://api.openai.com/v1"
+        if not recordings:
+            typer.echo("--record needs --recordings to write to.")
+            raise typer.Exit(code=1)
+    server = MockLLMServer(
+        host=host,
+        port=port,
+        recordings=recordings or None,
+        upstream_url=upstream,
+        upstream_api_key=os.getenv("OPENAI_API_KEY"),
+        latency_ms=latency_ms,
+        tokens_per_second=tokens_per_second,
+        deck_slides=deck_slides,
+    )
+    typer.echo(f"Mock LLM server at http://{host}:{port}/v1 ({'recording' if upstream else 'replay'} mode)")
+    server.serve_forever()
 
 
-    summary_report_path = generate_iteration_summary_report(
-        logs_dir=logs_dir,
+@app.command()
+def benchmark(
+    fixtures: str = "paper_summary,synthetic_10,synthetic_40,synthetic_100",
+    repeat: int = 3,
+    max_iterations: int = 3,
+    model_name: str = "gpt-4o",
+    mode: str = "dual",
+    latency_ms: float = 0.0,
+    tokens_per_second: float = 0.0,
+    recordings: str = "",
+    slidev: bool = False,
+    work_dir: str = "outputs/benchmark",
+    output: str = "outputs/benchmark/benchmark.json",
+):
+    """Benchmark outline -> draft -> render -> review on fixture decks against the mock LLM server."""
+    result = run_benchmark(
+        run_pipeline,
+        fixtures=[name.strip() for name in fixtures.split(",") if name.strip()],
+        repeat=repeat,
+        max_iterations=max_iterations,
+        model_name=model_name,
         mode=mode,
-        run_stamp=run_stamp,
-        total_iterations=iteration,
-        iteration_metrics=iteration_metrics,
-        total_input_tokens=total_input_tokens,
-        total_output_tokens=total_output_tokens,
-        total_cost=total_cost,
+        latency_ms=latency_ms,
+        tokens_per_second=tokens_per_second,
+        recordings=recordings or None,
+        use_slidev=slidev,
+        work_dir=work_dir,
     )
-    typer.echo(f"Iteration summary generated at {summary_report_path}")
+    typer.echo(f"Benchmark results written to {write_benchmark(result, output)}")
+
 
+@app.command()
+def stop_render_server():
+    """Stop the background Slidev render servers, if any are running."""
+    work_dir = Path(__file__).resolve().parents[1]
+    runner = SlidevRunner(work_dir=str(work_dir), use_server=True)
+    runner.shutdown_server()
+    # Servers started for the slots of a batch / service render pool.
+    for state_file in sorted((work_dir / POOL_SERVER_DIR).glob("*/server.json")):
+        RenderServer(work_dir=str(work_dir), state_dir=str(state_file.parent.relative_to(work_dir))).shutdown()
+    typer.echo("Render server stopped.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,308 @@
+import csv
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.llm_client import set_request_limit
+
+
+INPUT_SUFFIXES = {".txt", ".md"}
+
+
+@dataclass
+class BatchJob:
+    name: str
+    input_path: str
+    output_dir: str
+    max_iterations: Optional[int] = None
+    mode: str = ""
+
+
+@dataclass
+class JobResult:
+    name: str
+    input_path: str
+    output_dir: str
+    ok: bool
+    seconds: float
+    iterations: int = 0
+    approved: bool = False
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    slides_path: str = ""
+    error: str = ""
+
+
+def _job_name(path: str, used: set) -> str:
+    base = re.sub(r"[^A-Za-z0-9_.-]+", "_", Path(path).stem) or "job"
+    name = base
+    suffix = 2
+    while name in used:
+        name = f"{base}_{suffix}"
+        suffix += 1
+    used.add(name)
+    return name
+
+
+def load_jobs(source: str, output_root: str) -> List[BatchJob]:
+    """Jobs from a directory of .txt/.md inputs or a manifest.
+
+    A manifest is JSON (a list), JSONL or CSV with an `input` field and
+    optional `name`, `max_iterations` and `mode`. Relative inputs resolve
+    against the manifest's directory.
+    """
+    root = Path(source)
+    entries: List[Dict[str, Any]]
+    if root.is_dir():
+        entries = [
+            {"input": str(path)} for path in sorted(root.iterdir()) if path.is_file() and path.suffix in INPUT_SUFFIXES
+        ]
+    elif root.suffix == ".json":
+        entries = json.loads(root.read_text(encoding="utf-8"))
+    elif root.suffix == ".jsonl":
+        entries = [json.loads(line) for line in root.read_text(encoding="utf-8").splitlines() if line.strip()]
+    elif root.suffix == ".csv":
+        with open(root, newline="", encoding="utf-8") as f:
+            entries = list(csv.DictReader(f))
+    else:
+        raise ValueError(f"Batch source must be a directory or a .json/.jsonl/.csv manifest: {source}")
+
+    base_dir = root if root.is_dir() else root.parent
+    used: set = set()
+    jobs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"input": entry}
+        input_path = entry.get("input") or entry.get("input_path")
+        if not input_path:
+            raise ValueError(f"Manifest entry without an input: {entry}")
+        if not os.path.isabs(input_path):
+            input_path = str(base_dir / input_path)
+        name = _job_name(entry.get("name") or input_path, used)
+        max_iterations = entry.get("max_iterations")
+        jobs.append(
+            BatchJob(
+                name=name,
+                input_path=input_path,
+                output_dir=os.path.join(output_root, name),
+                max_iterations=int(max_iterations) if max_iterations not in (None, "") else None,
+                mode=entry.get("mode") or "",
+            )
+        )
+    return jobs
+
+
+class RenderPool:
+    """A fixed set of renderers shared by every job; `size` renders run at once.
+
+    Each job gets a `PooledRenderer`, which borrows a renderer for the
+    duration of one `render_slides` call and keeps its own `last_render_stats`.
+    `factory(slot)` builds the renderer for each slot; renderers must not
+    share a backend that serialises renders (such as one render server).
+    """
+
+    def __init__(self, factory: Callable[[int], Any], size: int, backend: str = "cli"):
+        self.size = max(1, size)
+        # "cli" (one Slidev export per render) or "server" (one render server per slot).
+        self.backend = backend
+        self._idle: "queue.Queue[Any]" = queue.Queue()
+        for slot in range(self.size):
+            self._idle.put(factory(slot))
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def renderer(self) -> "PooledRenderer":
+        return PooledRenderer(self)
+
+    def render(self, md_file_path: str, output_dir: str) -> tuple:
+        waited = time.time()
+        runner = self._idle.get()
+        with self._lock:
+            self.wait_seconds += time.time() - waited
+        try:
+            files = runner.render_slides(md_file_path, output_dir)
+            return files, dict(runner.last_render_stats)
+        finally:
+            self._idle.put(runner)
+
+
+class PooledRenderer:
+    def __init__(self, pool: RenderPool):
+        self.pool = pool
+        self.last_render_stats: Dict[str, int] = {}
+
+    def render_slides(self, md_file_path: str, output_dir: str) -> List[str]:
+        files, self.last_render_stats = self.pool.render(md_file_path, output_dir)
+        return files
+
+
+@dataclass
+class BatchReport:
+    started: float
+    seconds: float
+    llm_concurrency: int
+    render_concurrency: int
+    results: List[JobResult] = field(default_factory=list)
+    render_wait_seconds: float = 0.0
+    render_backend: str = "cli"
+
+    @property
+    def succeeded(self) -> List[JobResult]:
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self) -> List[JobResult]:
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def decks_per_hour(self) -> float:
+        return len(self.succeeded) * 3600 / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        costs = [result.cost for result in self.succeeded]
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "seconds": self.seconds,
+            "jobs": len(self.results),
+            "succeeded": len(self.succeeded),
+            "failed": len(self.failed),
+            "decks_per_hour": self.decks_per_hour,
+            "total_cost": sum(result.cost for result in self.results),
+            "avg_cost_per_deck": sum(costs) / len(costs) if costs else 0.0,
+            "llm_concurrency": self.llm_concurrency,
+            "render_concurrency": self.render_concurrency,
+            "render_backend": self.render_backend,
+            "render_wait_seconds": self.render_wait_seconds,
+            "results": [asdict(result) for result in self.results],
+        }
+
+    def markdown(self) -> str:
+        summary = self.to_dict()
+        lines = [
+            "# Batch Report",
+            "",
+            f"- Started: {summary['started']}",
+            f"- Jobs: {summary['jobs']} ({summary['succeeded']} succeeded, {summary['failed']} failed)",
+            f"- Wall Time: {self.seconds:.1f}s",
+            f"- Throughput: {self.decks_per_hour:.1f} decks/hour",
+            f"- Total Cost: ${summary['total_cost']:.4f} (avg ${summary['avg_cost_per_deck']:.4f} per deck)",
+            f"- Concurrency: {self.llm_concurrency} LLM requests, {self.render_concurrency} renders "
+            f"via {'one render server each' if self.render_backend == 'server' else 'the Slidev CLI'} "
+            f"({self.render_wait_seconds:.1f}s spent waiting for a renderer)",
+            "",
+            "## Decks",
+            "",
+            "| Deck | Status | Iterations | Approved | Time (s) | Input Tokens | Output Tokens | Cost |",
+            "| --- | --- | --- | --- | --- | --- | --- | --- |",
+        ]
+        for result in self.results:
+            lines.append(
+                f"| {result.name} | {'ok' if result.ok else 'failed'} | {result.iterations} | "
+                f"{'yes' if result.approved else 'no'} | {result.seconds:.1f} | {result.input_tokens} | "
+                f"{result.output_tokens} | ${result.cost:.4f} |"
+            )
+        if self.failed:
+            lines += ["", "## Failures", ""]
+            for result in self.failed:
+                lines.append(f"- {result.name} ({result.input_path}): {result.error}")
+        return "\n".join(lines) + "\n"
+
+
+def run_batch(
+    jobs: List[BatchJob],
+    pipeline: Callable[..., dict],
+    render_pool: RenderPool,
+    llm_concurrency: int = 4,
+    on_result: Optional[Callable[[JobResult], None]] = None,
+    **pipeline_options: Any,
+) -> BatchReport:
+    """Run every job through `pipeline` (main.run_pipeline) non-interactively.
+
+    Up to `llm_concurrency + render_pool.size` jobs are in flight, so jobs
+    waiting for a renderer do not hold back LLM work. LLM requests across
+    all jobs are capped at `llm_concurrency`.
+    """
+    set_request_limit(llm_concurrency)
+    started = time.time()
+    results: List[JobResult] = []
+
+    def run_job(job: BatchJob) -> JobResult:
+        job_start = time.time()
+        options = dict(pipeline_options)
+        if job.max_iterations is not None:
+            options["max_iterations"] = job.max_iterations
+        if job.mode:
+            options["mode"] = job.mode
+        try:
+            outcome = pipeline(
+                input_path=job.input_path,
+                output_dir=job.output_dir,
+                interactive=False,
+                runner=render_pool.renderer(),
+                **options,
+            )
+        except (Exception, SystemExit) as err:
+            return JobResult(
+                name=job.name,
+                input_path=job.input_path,
+                output_dir=job.output_dir,
+                ok=False,
+                seconds=time.time() - job_start,
+                error=f"{type(err).__name__}: {err}",
+            )
+        return JobResult(
+            name=job.name,
+            input_path=job.input_path,
+            output_dir=outcome.get("output_dir", job.output_dir),
+            ok=True,
+            seconds=time.time() - job_start,
+            iterations=outcome.get("iterations", 0),
+            approved=outcome.get("approved", False),
+            input_tokens=outcome.get("total_input_tokens", 0),
+            output_tokens=outcome.get("total_output_tokens", 0),
+            cost=outcome.get("total_cost", 0.0),
+            slides_path=outcome.get("slides_path", ""),
+        )
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, llm_concurrency) + render_pool.size) as pool:
+            futures = [pool.submit(run_job, job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+    finally:
+        set_request_limit(0)
+
+    order = {job.name: idx for idx, job in enumerate(jobs)}
+    results.sort(key=lambda result: order.get(result.name, 0))
+    return BatchReport(
+        started=started,
+        seconds=time.time() - started,
+        llm_concurrency=llm_concurrency,
+        render_concurrency=render_pool.size,
+        results=results,
+        render_wait_seconds=render_pool.wait_seconds,
+        render_backend=render_pool.backend,
+    )
+
+
+def write_batch_report(report: BatchReport, output_root: str) -> tuple:
+    stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(report.started))
+    Path(output_root).mkdir(parents=True, exist_ok=True)
+    markdown_path = os.path.join(output_root, f"batch_report_{stamp}.md")
+    json_path = os.path.join(output_root, f"batch_report_{stamp}.json")
+    with open(markdown_path, "w", encoding="utf-8") as f:
+        f.write(report.markdown())
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+    return markdown_path, json_path
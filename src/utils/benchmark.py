@@ -0,0 +1,264 @@
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image, ImageDraw
+
+from utils.image_prep import ImagePreparer
+from utils.llm_cache import LLMCache
+from utils.mock_llm_server import MockLLMServer
+from utils.slides import split_slides
+
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+STAGES = ["outline", "editor", "lint", "render", "review", "archive", "llm", "image_prep", "iteration", "total"]
+
+
+@dataclass
+class Fixture:
+    name: str
+    input_path: str
+    slides: int
+
+
+def _synthetic_source(path: Path, slides: int) -> str:
+    sections = []
+    for idx in range(1, slides + 1):
+        sections.append(
+            f"### {idx}. Section {idx}\n\n"
+            f"Section {idx} describes one step of the method, the data it uses and the result it reports. "
+            "The baseline is compared with the proposed approach on latency, cost and accuracy.\n"
+        )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"**Title:** Synthetic Benchmark ({slides} slides)\n\n" + "\n".join(sections), encoding="utf-8")
+    return str(path)
+
+
+def default_fixtures(work_dir: str) -> Dict[str, Fixture]:
+    """data/paper_summary.txt plus synthetic sources that produce 10, 40 and 100 slide decks."""
+    fixtures = {"paper_summary": Fixture("paper_summary", str(REPO_ROOT / "data" / "paper_summary.txt"), 12)}
+    for slides in (10, 40, 100):
+        name = f"synthetic_{slides}"
+        fixtures[name] = Fixture(name, _synthetic_source(Path(work_dir) / "fixtures" / f"{name}.txt", slides), slides)
+    return fixtures
+
+
+class PlaceholderRunner:
+    """Stands in for SlidevRunner when Slidev is not installed: one PNG per slide with its title."""
+
+    def __init__(self, size: tuple = (1280, 720)):
+        self.size = size
+        self.last_render_stats: Dict[str, int] = {}
+
+    def render_slides(self, md_file_path: str, output_dir: str) -> List[str]:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        slides = split_slides(Path(md_file_path).read_text(encoding="utf-8"))
+        paths = []
+        for slide in slides:
+            image = Image.new("RGB", self.size, "white")
+            draw = ImageDraw.Draw(image)
+            for line_no, line in enumerate(slide.content.strip().splitlines()[:12]):
+                draw.text((60, 60 + line_no * 40), line, fill="black")
+            path = os.path.join(output_dir, f"{slide.index:03d}.png")
+            image.save(path)
+            paths.append(path)
+        self.last_render_stats = {"slides": len(paths), "rendered": len(paths), "cached": 0}
+        return paths
+
+
+def slidev_available() -> bool:
+    return (REPO_ROOT / "node_modules" / ".bin" / "slidev").exists()
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p95": pick(0.95),
+        "max": ordered[-1],
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def _stage_samples(result: dict) -> Dict[str, List[float]]:
+    samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    samples["outline"].append(result.get("outline_seconds", 0.0))
+    samples["total"].append(result.get("elapsed_seconds", 0.0))
+    for metric in result.get("iteration_metrics", []):
+        samples["iteration"].append(metric.get("duration_seconds", 0.0))
+        for stage, seconds in (metric.get("stage_seconds") or {}).items():
+            samples.setdefault(stage, []).append(seconds)
+    return samples
+
+
+def _git_head() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmark(
+    pipeline: Callable[..., dict],
+    fixtures: Optional[List[str]] = None,
+    repeat: int = 3,
+    max_iterations: int = 3,
+    model_name: str = "gpt-4o",
+    mode: str = "dual",
+    latency_ms: float = 0.0,
+    tokens_per_second: float = 0.0,
+    recordings: Optional[str] = None,
+    use_slidev: Optional[bool] = None,
+    work_dir: str = "outputs/benchmark",
+) -> dict:
+    """Run the pipeline on each fixture against the mock LLM server and aggregate the timings.
+
+    `pipeline` is `main.run_pipeline`; it is passed in so this module does not
+    import the CLI. Environment variables changed here are restored afterwards.
+    """
+    available = default_fixtures(work_dir)
+    names = fixtures or list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown fixture(s): {', '.join(unknown)}. Available: {', '.join(available)}")
+    if use_slidev is None:
+        use_slidev = slidev_available()
+
+    env_overrides = {
+        "OPENAI_API_KEY": "mock",
+        "LLM_PROVIDER": "openai",
+        "EDITOR_LLM_PROVIDER": "openai",
+        "CRITIC_LLM_PROVIDER": "openai",
+        "LLM_MODEL": model_name,
+        "EDITOR_LLM_MODEL": model_name,
+        "CRITIC_LLM_MODEL": model_name,
+        "LLM_SUPPORTS_VISION": "1",
+        "MODE": mode,
+        # On-disk render caches would turn repetitions 2..N (and later benchmarks) into cache hits.
+        "SLIDE_CACHE": "0",
+        "DIAGRAM_CACHE": "0",
+        "RENDER_HISTORY": "0",
+    }
+    saved_env = {key: os.environ.get(key) for key in [*env_overrides, "OPENAI_BASE_URL", "LLM_CACHE"]}
+    results: Dict[str, dict] = {}
+    try:
+        os.environ.update(env_overrides)
+        os.environ.pop("LLM_CACHE", None)
+        for name in names:
+            fixture = available[name]
+            server = MockLLMServer(
+                recordings=recordings,
+                latency_ms=latency_ms,
+                tokens_per_second=tokens_per_second,
+                deck_slides=fixture.slides,
+            )
+            os.environ["OPENAI_BASE_URL"] = server.start()
+            samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+            runs = []
+
+            def run_once(run_name: str) -> dict:
+                # Fresh process-wide caches so every repetition does the same work.
+                LLMCache._shared = None
+                ImagePreparer._shared = None
+                return pipeline(
+                    input_path=fixture.input_path,
+                    output_dir=os.path.join(work_dir, name, run_name),
+                    max_iterations=max_iterations,
+                    model_name=model_name,
+                    mode=mode,
+                    interactive=False,
+                    runner=None if use_slidev else PlaceholderRunner(),
+                )
+
+            try:
+                for attempt in range(repeat):
+                    result = run_once(f"run_{attempt + 1}")
+                    for stage, values in _stage_samples(result).items():
+                        samples[stage].extend(values)
+                    runs.append(
+                        {
+                            "iterations": result.get("iterations", 0),
+                            "approved": result.get("approved", False),
+                            "elapsed_seconds": result.get("elapsed_seconds", 0.0),
+                            "input_tokens": result.get("total_input_tokens", 0),
+                            "output_tokens": result.get("total_output_tokens", 0),
+                            "cached_tokens": result.get("total_cached_tokens", 0),
+                            "cost": result.get("total_cost", 0.0),
+                        }
+                    )
+                server_stats = dict(server.stats)
+                # Peak memory comes from a separate pass: tracemalloc slows every allocation,
+                # so its timings are not mixed into the latency samples above.
+                tracemalloc.start()
+                try:
+                    run_once("memory_run")
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+            finally:
+                server.stop()
+            results[name] = {
+                "input_path": fixture.input_path,
+                "slides": fixture.slides,
+                "stages": {stage: percentiles(values) for stage, values in samples.items() if values},
+                "tokens": {
+                    key: statistics.fmean(run[key] for run in runs)
+                    for key in ("input_tokens", "output_tokens", "cached_tokens")
+                },
+                "cost": statistics.fmean(run["cost"] for run in runs),
+                "peak_python_memory_bytes": peak,
+                "mock_server": server_stats,
+                "runs": runs,
+            }
+    finally:
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        LLMCache._shared = None
+        ImagePreparer._shared = None
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_head": _git_head(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "renderer": "slidev" if use_slidev else "placeholder",
+            "model": model_name,
+            "mode": mode,
+            "repeat": repeat,
+            "max_iterations": max_iterations,
+            "latency_ms": latency_ms,
+            "tokens_per_second": tokens_per_second,
+            # ru_maxrss is KiB on Linux and bytes on macOS.
+            "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        "fixtures": results,
+    }
+
+
+def write_benchmark(result: dict, output_path: str) -> str:
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return output_path
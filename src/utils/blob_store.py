@@ -0,0 +1,145 @@
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from utils import tracing
+
+
+class BlobStore:
+    """Content-addressed files stored once under `<root>/<key[:2]>/<key><suffix>`.
+
+    History directories hold hardlinks to the blobs (a copy where hardlinks
+    are not available) plus a `manifest.json` of the keys, so an unchanged
+    slide PNG or deck is stored once no matter how many iterations or runs
+    archive it. Blobs are shared and must not be modified in place.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.stats = {"stored": 0, "stored_bytes": 0, "reused": 0, "reused_bytes": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, output_root: str) -> "BlobStore":
+        return cls(os.getenv("BLOB_STORE_DIR") or os.path.join(output_root, "blobs"))
+
+    def path(self, key: str) -> str:
+        digest, _, suffix = key.partition(".")
+        return str(Path(self.root) / digest[:2] / (f"{digest}.{suffix}" if suffix else digest))
+
+    def _store(self, key: str, size: int, write: Callable[[str], None]) -> str:
+        path = Path(self.path(key))
+        with self._lock:
+            exists = path.exists()
+            self.stats["reused" if exists else "stored"] += 1
+            self.stats["reused_bytes" if exists else "stored_bytes"] += size
+        if not exists:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            write(str(tmp_path))
+            os.replace(tmp_path, path)
+        return key
+
+    def put(self, source_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(source_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        key = digest.hexdigest() + Path(source_path).suffix
+        return self._store(key, os.path.getsize(source_path), lambda tmp: shutil.copyfile(source_path, tmp))
+
+    def put_bytes(self, data: bytes, suffix: str = "") -> str:
+        key = hashlib.sha256(data).hexdigest() + suffix
+
+        def write(tmp: str) -> None:
+            with open(tmp, "wb") as f:
+                f.write(data)
+
+        return self._store(key, len(data), write)
+
+    def link(self, key: str, dest: str) -> str:
+        """Place blob `key` at `dest`, replacing whatever is there."""
+        dest_path = Path(dest)
+        blob_path = self.path(key)
+        if dest_path.exists() and os.path.samefile(blob_path, dest_path):
+            return dest
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest_path.with_name(f".{dest_path.name}.{threading.get_ident()}.tmp")
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError:
+            shutil.copyfile(blob_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+        return dest
+
+
+def archive_iteration(
+    store: BlobStore,
+    iter_dir: str,
+    slides_text: str,
+    image_paths: List[str],
+    feedback: List[dict],
+    slides_links: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Archive one iteration into `iter_dir` as blob links plus `manifest.json`.
+
+    `slides_links` are further paths (e.g. the rendered-markdown log) that
+    should point at the same deck blob instead of holding their own copy.
+    """
+    with tracing.span("archive.write", images=len(image_paths)) as write_span:
+        slides_key = store.put_bytes(slides_text.encode("utf-8"), ".md")
+        store.link(slides_key, os.path.join(iter_dir, "slides.md"))
+        for path in slides_links or []:
+            store.link(slides_key, path)
+        images: Dict[str, str] = {}
+        images_dir = os.path.join(iter_dir, "images")
+        if image_paths:
+            if Path(images_dir).exists():
+                shutil.rmtree(images_dir)
+            for image_path in image_paths:
+                name = os.path.basename(image_path)
+                images[name] = store.put(image_path)
+                store.link(images[name], os.path.join(images_dir, name))
+        critique_key = store.put_bytes(json.dumps(feedback, ensure_ascii=False, indent=2).encode("utf-8"), ".json")
+        store.link(critique_key, os.path.join(iter_dir, "critique.json"))
+        manifest = {"slides.md": slides_key, "critique.json": critique_key, "images": images}
+        with open(os.path.join(iter_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        write_span.set(blobs=len(images) + 2)
+    return manifest
+
+
+class HistoryWriter:
+    """Runs archive jobs in order on one background thread.
+
+    `wait` blocks until everything submitted so far is written and re-raises
+    the first failure; call it before the files an archive job reads are
+    overwritten.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-writer")
+        self._pending: List[Future] = []
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, fn, *args, **kwargs)
+        self._pending.append(future)
+        return future
+
+    def wait(self) -> None:
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self) -> None:
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
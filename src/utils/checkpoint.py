@@ -0,0 +1,102 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_VERSION = 1
+# Checkpointed stages of one iteration, in order. "iteration" means the
+# iteration finished (archived and counted in the totals).
+ITERATION_STAGES = ("editor", "render", "review", "iteration")
+
+
+def find_checkpoint(run_dir: str) -> str:
+    """Checkpoint path for a run directory (`<output>/dual_output`) or its parent (`<output>`)."""
+    for candidate in (
+        os.path.join(run_dir, CHECKPOINT_FILE),
+        os.path.join(run_dir, "dual_output", CHECKPOINT_FILE),
+        os.path.join(run_dir, "single_output", CHECKPOINT_FILE),
+    ):
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f"No {CHECKPOINT_FILE} found in {run_dir}")
+
+
+class RunCheckpoint:
+    """Loop state of one run, rewritten atomically after every completed stage.
+
+    `state` holds the run-level state (outline, decks, feedback, agent
+    histories, totals); `iteration_state` the partial results of the
+    iteration in progress. A checkpoint loaded with `load` remembers where
+    the previous process stopped, and `completed` tells the pipeline which
+    stages to restore instead of running them again.
+    """
+
+    def __init__(self, path: str, state: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.state: Dict[str, Any] = state or {}
+        self.resumed_from: Optional[Tuple[str, int]] = None
+        if self.state.get("stage"):
+            self.resumed_from = (self.state["stage"], int(self.state.get("iteration", 0)))
+
+    @classmethod
+    def load(cls, path: str) -> "RunCheckpoint":
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version in {path}: {state.get('version')}")
+        return cls(path, state)
+
+    @property
+    def finished(self) -> bool:
+        return bool(self.state.get("finished"))
+
+    @property
+    def next_iteration(self) -> int:
+        """First iteration the resumed loop has to (re)enter."""
+        if self.resumed_from is None:
+            return 1
+        stage, iteration = self.resumed_from
+        if stage == "outline":
+            return 1
+        return iteration + 1 if stage == "iteration" else iteration
+
+    def completed(self, stage: str, iteration: int = 0) -> bool:
+        """Whether the previous process already finished `stage` of `iteration`."""
+        if self.resumed_from is None:
+            return False
+        last_stage, last_iteration = self.resumed_from
+        if stage == "outline":
+            return True
+        if last_stage == "outline" or iteration > last_iteration:
+            return False
+        if iteration < last_iteration:
+            return True
+        return ITERATION_STAGES.index(stage) <= ITERATION_STAGES.index(last_stage)
+
+    def iteration_state(self, iteration: int) -> Dict[str, Any]:
+        """Partial results saved for `iteration` if the previous process stopped inside it."""
+        if self.resumed_from is None or self.resumed_from[1] != iteration or self.resumed_from[0] == "iteration":
+            return {}
+        return dict(self.state.get("iteration_state") or {})
+
+    def save(
+        self, stage: str, iteration: int = 0, iteration_state: Optional[Dict[str, Any]] = None, **state: Any
+    ) -> None:
+        self.state.update(state)
+        self.state.update(
+            {
+                "version": CHECKPOINT_VERSION,
+                "stage": stage,
+                "iteration": iteration,
+                "iteration_state": iteration_state or {},
+                "saved_at": time.time(),
+            }
+        )
+        path = Path(self.path)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
@@ -0,0 +1,100 @@
+import hashlib
+import math
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+@dataclass
+class ContactSheetLayout:
+    columns: int = 3
+    rows: int = 3
+    tile_width: int = 640
+    gap: int = 8
+
+    @property
+    def per_sheet(self) -> int:
+        return self.columns * self.rows
+
+    @classmethod
+    def from_env(cls) -> Optional["ContactSheetLayout"]:
+        """Read VISION_CONTACT_SHEET (e.g. `1` or `3x3`) and CONTACT_SHEET_TILE_WIDTH; None when disabled."""
+        value = os.getenv("VISION_CONTACT_SHEET", "").strip().lower()
+        if value in {"", "0", "false", "no", "off"}:
+            return None
+        layout = cls(tile_width=int(os.getenv("CONTACT_SHEET_TILE_WIDTH", "640") or 640))
+        if "x" in value:
+            columns, _, rows = value.partition("x")
+            layout.columns, layout.rows = max(1, int(columns)), max(1, int(rows))
+        return layout
+
+    def describe(self, slide_count: int, sheet_count: int) -> str:
+        return (
+            f"The {slide_count} slides are tiled into {sheet_count} contact sheet image(s). Each sheet is a "
+            f"{self.columns}x{self.rows} grid read left to right, top to bottom, and every tile is labeled with "
+            f"its number (1 to {slide_count}) in the top-left corner. Use that number as page_index."
+        )
+
+
+def _label_font(size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 has a single fixed-size bitmap font.
+        return ImageFont.load_default()
+
+
+def build_contact_sheets(
+    image_paths: List[str], layout: ContactSheetLayout, output_dir: Optional[str] = None
+) -> List[str]:
+    """Tile slide images into labeled grid images and return the sheet paths.
+
+    Tiles are labeled 1..len(image_paths) in order. Sheets default to a
+    `<images dir>_sheets` directory next to the slide images.
+    """
+    if not image_paths:
+        return []
+    if output_dir is None:
+        images_dir = Path(image_paths[0]).parent
+        output_dir = str(images_dir.with_name(f"{images_dir.name}_sheets"))
+    os.makedirs(output_dir, exist_ok=True)
+
+    with Image.open(image_paths[0]) as first:
+        tile_height = max(1, round(layout.tile_width * first.height / first.width))
+    font = _label_font(max(14, layout.tile_width // 18))
+    digest = hashlib.sha1("\n".join(image_paths).encode("utf-8")).hexdigest()[:8]
+
+    sheet_paths: List[str] = []
+    sheet_count = math.ceil(len(image_paths) / layout.per_sheet)
+    for sheet_idx in range(sheet_count):
+        chunk = image_paths[sheet_idx * layout.per_sheet : (sheet_idx + 1) * layout.per_sheet]
+        columns = min(layout.columns, len(chunk))
+        rows = math.ceil(len(chunk) / layout.columns)
+        sheet = Image.new(
+            "RGB",
+            (
+                columns * layout.tile_width + (columns + 1) * layout.gap,
+                rows * tile_height + (rows + 1) * layout.gap,
+            ),
+            "#808080",
+        )
+        draw = ImageDraw.Draw(sheet)
+        for pos, path in enumerate(chunk):
+            number = sheet_idx * layout.per_sheet + pos + 1
+            x = layout.gap + (pos % layout.columns) * (layout.tile_width + layout.gap)
+            y = layout.gap + (pos // layout.columns) * (tile_height + layout.gap)
+            with Image.open(path) as image:
+                tile = image.convert("RGB").resize((layout.tile_width, tile_height), Image.LANCZOS)
+            sheet.paste(tile, (x, y))
+            label = str(number)
+            left, top, right, bottom = draw.textbbox((0, 0), label, font=font)
+            pad = max(4, (bottom - top) // 4)
+            draw.rectangle((x, y, x + right - left + 2 * pad, y + bottom - top + 2 * pad), fill="#d00000")
+            draw.text((x + pad - left, y + pad - top), label, fill="white", font=font)
+        sheet_path = os.path.join(output_dir, f"sheet_{digest}_{sheet_idx + 1:02d}.png")
+        sheet.save(sheet_path)
+        sheet_paths.append(sheet_path)
+    return sheet_paths
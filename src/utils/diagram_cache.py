@@ -0,0 +1,368 @@
+import hashlib
+import itertools
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils import tracing
+from utils.slides import Slide, join_slides, split_slides
+
+
+# Bump when the worker's output changes, so stale SVG/HTML is not reused.
+RENDERER_VERSION = "2"
+
+_FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})\s*([\w-]*)(.*)$")
+_OPTION_RE = re.compile(r"(\w+)\s*:\s*['\"]?([\w.-]+)['\"]?")
+# Fence options we can reproduce on pre-rendered output; anything else is left to Slidev.
+_MERMAID_OPTIONS = {"theme", "scale"}
+
+
+class DiagramWorkerError(RuntimeError):
+    pass
+
+
+@dataclass
+class DiagramBlock:
+    kind: str  # "mermaid" or "math"
+    slide: int
+    # 1-based deck line of the opening fence / `$$`.
+    line: int
+    source: str
+    options: Dict[str, str] = field(default_factory=dict)
+    # Line span inside the slide's raw text, inclusive.
+    first: int = 0
+    last: int = 0
+
+
+@dataclass
+class DiagramError:
+    kind: str
+    slide: int
+    line: int
+    message: str
+
+    def __str__(self) -> str:
+        label = "mermaid diagram" if self.kind == "mermaid" else "math block (KaTeX)"
+        return f"slide {self.slide}: {label} at line {self.line}: {self.message}"
+
+
+@dataclass
+class PrerenderResult:
+    markdown: str
+    errors: List[DiagramError] = field(default_factory=list)
+    stats: Dict[str, int] = field(default_factory=dict)
+
+
+def extract_blocks(slide: Slide) -> List[DiagramBlock]:
+    """Mermaid fences and `$$` math blocks of one slide, outside other code fences."""
+    lines = slide.raw.split("\n")
+    blocks: List[DiagramBlock] = []
+    # The frontmatter (and its delimiters) precedes the content lines.
+    offset = slide.content_line - slide.start_line if slide.content_line else 0
+    index = offset
+    while index < len(lines):
+        line = lines[index]
+        fence = _FENCE_RE.match(line)
+        if fence:
+            marker, lang, info = fence.group(1), fence.group(2), fence.group(3).strip()
+            end = index + 1
+            while end < len(lines) and not (
+                lines[end].strip().startswith(marker) and not lines[end].strip()[len(marker) :].strip()
+            ):
+                end += 1
+            if end >= len(lines):
+                break
+            options = dict(_OPTION_RE.findall(info))
+            if lang == "mermaid" and set(options) <= _MERMAID_OPTIONS:
+                blocks.append(
+                    DiagramBlock(
+                        kind="mermaid",
+                        slide=slide.index,
+                        line=slide.start_line + index,
+                        source="\n".join(lines[index + 1 : end]),
+                        options=options,
+                        first=index,
+                        last=end,
+                    )
+                )
+            index = end + 1
+            continue
+        stripped = line.strip()
+        if stripped.startswith("$$"):
+            # `$$ {1|3}` line highlighting is rendered by Slidev itself.
+            opener = stripped[2:].strip()
+            if opener.endswith("$$") and len(stripped) > 4:
+                source, end = opener[:-2].strip(), index
+            else:
+                end = index + 1
+                while end < len(lines) and not lines[end].strip().endswith("$$"):
+                    end += 1
+                if end >= len(lines):
+                    break
+                body = lines[index + 1 : end] + [lines[end].strip()[:-2]]
+                source = "\n".join(body).strip()
+            if source and not opener.startswith("{"):
+                blocks.append(
+                    DiagramBlock(
+                        kind="math",
+                        slide=slide.index,
+                        line=slide.start_line + index,
+                        source=source,
+                        first=index,
+                        last=end,
+                    )
+                )
+            index = end + 1
+            continue
+        index += 1
+    return blocks
+
+
+def _inline_html(block: DiagramBlock, output: str) -> str:
+    # One line, so markdown keeps it as a single HTML block; v-pre keeps Vue away from `{{`.
+    body = " ".join(output.split("\n"))
+    if block.kind == "math":
+        return f'<div class="katex-prerendered" v-pre>{body}</div>'
+    scale = block.options.get("scale")
+    style = f' style="zoom: {scale}"' if scale and re.fullmatch(r"[\d.]+", scale) else ""
+    return f'<div class="mermaid-prerendered" v-pre{style}>{body}</div>'
+
+
+@dataclass
+class DiagramCache:
+    """Content-addressed cache of rendered diagrams, shared by every run.
+
+    A key covers the block kind, its source and the options that change the
+    output. Outputs are stored as `.svg` (Mermaid) or `.html` (KaTeX); syntax
+    errors are stored as `.err`, so a broken diagram is not re-rendered until
+    it changes.
+    """
+
+    root: str
+
+    @classmethod
+    def from_env(cls, work_dir: str) -> Optional["DiagramCache"]:
+        if os.getenv("DIAGRAM_CACHE", "1").strip().lower() in {"0", "false", "no", "off"}:
+            return None
+        return cls(root=os.getenv("DIAGRAM_CACHE_DIR") or os.path.join(work_dir, ".cache", "diagrams"))
+
+    @staticmethod
+    def key(block: DiagramBlock) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{RENDERER_VERSION}\0{block.kind}\0".encode("utf-8"))
+        digest.update(json.dumps(block.options, sort_keys=True).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(block.source.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return Path(self.root) / key[:2] / f"{key}{suffix}"
+
+    def get(self, key: str, kind: str) -> Optional[Tuple[bool, str]]:
+        """(True, output) or (False, syntax error) for a cached block, else None."""
+        for ok, suffix in ((True, ".svg" if kind == "mermaid" else ".html"), (False, ".err")):
+            path = self._path(key, suffix)
+            if path.exists():
+                return ok, path.read_text(encoding="utf-8")
+        return None
+
+    def put(self, key: str, kind: str, ok: bool, text: str) -> None:
+        path = self._path(key, (".svg" if kind == "mermaid" else ".html") if ok else ".err")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+class DiagramWorker:
+    """Client for the `scripts/diagram_worker.mjs` process (JSON lines over stdin/stdout).
+
+    One worker per work dir is shared by every runner in the process and
+    started on first use; it exits when its stdin closes. If it cannot be
+    started, later requests fail fast instead of spawning it again.
+    """
+
+    _shared: Dict[str, "DiagramWorker"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, work_dir: str, timeout: float = 60.0):
+        self.work_dir = work_dir
+        self.timeout = timeout
+        self.unavailable = ""
+        self._process: Optional[subprocess.Popen] = None
+        self._responses: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, work_dir: str) -> "DiagramWorker":
+        key = str(Path(work_dir).resolve())
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(work_dir)
+            return cls._shared[key]
+
+    def _ensure_running(self) -> subprocess.Popen:
+        if self.unavailable:
+            raise DiagramWorkerError(self.unavailable)
+        if self._process is not None and self._process.poll() is None:
+            return self._process
+        script = Path(self.work_dir) / "scripts" / "diagram_worker.mjs"
+        log_path = Path(self.work_dir) / ".cache" / "diagram_worker.log"
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        env = os.environ.copy()
+        env.setdefault("PLAYWRIGHT_DISABLE_SANDBOX", "1")
+        env.setdefault("PLAYWRIGHT_SKIP_VALIDATE_HOST_REQUIREMENTS", "1")
+        try:
+            with open(log_path, "a", encoding="utf-8") as log_file:
+                self._process = subprocess.Popen(
+                    ["node", str(script)],
+                    cwd=self.work_dir,
+                    env=env,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=log_file,
+                    text=True,
+                    encoding="utf-8",
+                    bufsize=1,
+                )
+        except OSError as err:
+            self.unavailable = f"Cannot start diagram worker: {err}"
+            raise DiagramWorkerError(self.unavailable) from err
+        self._responses = queue.Queue()
+        threading.Thread(
+            target=self._read_responses, args=(self._process, self._responses), name="diagram-worker", daemon=True
+        ).start()
+        return self._process
+
+    @staticmethod
+    def _read_responses(process: subprocess.Popen, responses: "queue.Queue[Optional[dict]]") -> None:
+        for line in process.stdout:
+            try:
+                responses.put(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        responses.put(None)
+
+    def render(self, block: DiagramBlock, render_id: str) -> Tuple[bool, str]:
+        """(True, output) or (False, syntax error); raises DiagramWorkerError for anything else.
+
+        `render_id` becomes the SVG's element id, which Mermaid also uses to
+        scope its styles and markers; it must be unique per diagram content.
+        """
+        with self._lock:
+            process = self._ensure_running()
+            request_id = next(self._ids)
+            request = {"id": request_id, "type": block.kind, "source": block.source, "render_id": render_id}
+            if block.kind == "mermaid" and block.options.get("theme"):
+                request["theme"] = block.options["theme"]
+            try:
+                process.stdin.write(json.dumps(request, ensure_ascii=False) + "\n")
+                process.stdin.flush()
+            except OSError as err:
+                raise DiagramWorkerError(f"Diagram worker exited: {err}") from err
+            while True:
+                try:
+                    response = self._responses.get(timeout=self.timeout)
+                except queue.Empty:
+                    process.kill()
+                    raise DiagramWorkerError(f"Diagram worker did not answer within {self.timeout:.0f}s")
+                if response is None:
+                    self.unavailable = (
+                        f"Diagram worker exited with code {process.wait()}; "
+                        f"see {Path(self.work_dir) / '.cache' / 'diagram_worker.log'}"
+                    )
+                    raise DiagramWorkerError(self.unavailable)
+                if response.get("id") == request_id:
+                    break
+        if response.get("ok"):
+            return True, response.get("output", "")
+        if response.get("kind") == "syntax":
+            return False, response.get("error", "")
+        raise DiagramWorkerError(response.get("error", "diagram render failed"))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.stdin.close()
+                try:
+                    self._process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+            self._process = None
+
+
+@dataclass
+class DiagramPrerenderer:
+    """Renders a deck's Mermaid and `$$` math blocks once and inlines the result.
+
+    Blocks are looked up in the cache first; misses go to the worker. Syntax
+    errors are collected per block, so a broken diagram is reported before
+    the full deck export. Blocks the worker cannot handle are left in place
+    for Slidev to render as before.
+    """
+
+    cache: DiagramCache
+    worker: DiagramWorker
+
+    @classmethod
+    def from_env(cls, work_dir: str) -> Optional["DiagramPrerenderer"]:
+        cache = DiagramCache.from_env(work_dir)
+        if cache is None:
+            return None
+        return cls(cache=cache, worker=DiagramWorker.shared(work_dir))
+
+    def prerender(self, markdown: str) -> PrerenderResult:
+        slides = split_slides(markdown)
+        blocks = [block for slide in slides for block in extract_blocks(slide)]
+        result = PrerenderResult(markdown=markdown, stats={"diagrams": len(blocks)})
+        if not blocks:
+            return result
+        with tracing.span("render.diagrams", blocks=len(blocks)) as diagrams_span:
+            outputs: Dict[int, str] = {}
+            cached = rendered = 0
+            worker_failed = False
+            for position, block in enumerate(blocks):
+                key = self.cache.key(block)
+                entry = self.cache.get(key, block.kind)
+                if entry is None:
+                    if worker_failed or self.worker.unavailable:
+                        continue
+                    try:
+                        # Cached SVGs end up side by side in one deck, so their ids come from the content.
+                        entry = self.worker.render(block, render_id=f"d-{key[:12]}")
+                    except DiagramWorkerError as err:
+                        # Leave this deck's remaining misses to Slidev rather than fail on each one.
+                        worker_failed = True
+                        diagrams_span.set(worker_error=str(err)[:200])
+                        continue
+                    self.cache.put(key, block.kind, *entry)
+                    rendered += 1
+                else:
+                    cached += 1
+                ok, text = entry
+                if ok:
+                    outputs[position] = text
+                else:
+                    result.errors.append(DiagramError(block.kind, block.slide, block.line, text.strip()))
+            result.stats.update(diagrams_cached=cached, diagrams_rendered=rendered, diagram_errors=len(result.errors))
+            diagrams_span.set(cached=cached, rendered=rendered, errors=len(result.errors))
+
+        if outputs and not result.errors:
+            by_slide: Dict[int, List[Tuple[DiagramBlock, str]]] = {}
+            for position, output in outputs.items():
+                by_slide.setdefault(blocks[position].slide, []).append((blocks[position], output))
+            for slide in slides:
+                lines = slide.raw.split("\n")
+                # Replace from the bottom so earlier line spans stay valid.
+                for block, output in sorted(by_slide.get(slide.index, []), key=lambda item: -item[0].first):
+                    lines[block.first : block.last + 1] = ["", _inline_html(block, output), ""]
+                slide.raw = "\n".join(lines)
+            result.markdown = join_slides(slides)
+        return result
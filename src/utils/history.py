@@ -0,0 +1,100 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from utils.tokens import estimate_tokens
+
+
+# Turn kinds recorded by the agents. Untagged turns are replayed unchanged.
+DECK = "deck"
+REVIEW = "review"
+
+
+@dataclass
+class HistoryPolicy:
+    # Token budget for replayed history (0 = unlimited); oldest turns go first.
+    max_tokens: int = 0
+    # Replay at most this many of the most recent turns (0 = all).
+    keep_last: int = 0
+    # Replace every deck version but the latest with a short placeholder.
+    drop_superseded_decks: bool = True
+    # Collapse all but the latest review into one line per feedback item.
+    compact_feedback: bool = True
+
+    @classmethod
+    def from_env(cls) -> "HistoryPolicy":
+        def flag(name: str, default: str) -> bool:
+            return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+        return cls(
+            max_tokens=int(os.getenv("HISTORY_MAX_TOKENS", "0") or 0),
+            keep_last=int(os.getenv("HISTORY_KEEP_TURNS", "0") or 0),
+            drop_superseded_decks=flag("HISTORY_DROP_SUPERSEDED", "1"),
+            compact_feedback=flag("HISTORY_COMPACT_FEEDBACK", "1"),
+        )
+
+
+def feedback_lines(items: List[Any], max_chars: int = 160) -> List[str]:
+    """One short line per feedback item: page, severity and issue."""
+    lines = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        page = item.get("page_index", "-")
+        severity = item.get("severity", "")
+        issue = " ".join(str(item.get("issue", "")).split())
+        lines.append(f"- p{page} {severity}: {issue}"[:max_chars])
+    return lines
+
+
+def compact_feedback(content: str, max_chars: int = 160) -> str:
+    """Summarize a feedback JSON response as one line per item."""
+    try:
+        payload = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return content[:max_chars]
+    items = payload.get("feedback", []) if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return content[:max_chars]
+    if not items:
+        return "Earlier review: no issues."
+    return "\n".join(["Earlier review (summarized):"] + feedback_lines(items, max_chars))
+
+
+def _turn_tokens(turn: Dict[str, Any]) -> int:
+    return estimate_tokens(turn.get("user", "")) + estimate_tokens(turn.get("assistant", ""))
+
+
+class HistoryManager:
+    """Chooses which recorded turns are replayed to the model, without mutating the history."""
+
+    def __init__(self, policy: Optional[HistoryPolicy] = None):
+        self.policy = policy or HistoryPolicy.from_env()
+
+    def select(self, history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        policy = self.policy
+        last_deck = max((idx for idx, turn in enumerate(history) if turn.get("kind") == DECK), default=-1)
+        last_review = max((idx for idx, turn in enumerate(history) if turn.get("kind") == REVIEW), default=-1)
+        turns: List[Dict[str, str]] = []
+        for idx, turn in enumerate(history):
+            user = turn.get("user", "")
+            assistant = turn.get("assistant", "")
+            kind = turn.get("kind")
+            if kind == DECK and policy.drop_superseded_decks:
+                # The request embeds the previous deck, so only its summary is replayed.
+                user = turn.get("summary") or user
+                if idx != last_deck:
+                    assistant = "[Superseded deck version omitted.]"
+            elif kind == REVIEW and policy.compact_feedback and idx != last_review:
+                user = turn.get("summary") or user
+                assistant = compact_feedback(assistant)
+            turns.append({"user": user, "assistant": assistant})
+
+        if policy.keep_last > 0:
+            turns = turns[-policy.keep_last :]
+        if policy.max_tokens > 0:
+            total = sum(_turn_tokens(turn) for turn in turns)
+            while turns and total > policy.max_tokens:
+                total -= _turn_tokens(turns.pop(0))
+        return turns
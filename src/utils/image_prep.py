@@ -0,0 +1,151 @@
+import base64
+import hashlib
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from PIL import Image
+
+
+_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+@dataclass
+class PreparedImage:
+    url: str
+    bytes: int
+    width: int
+    height: int
+    tokens: int
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Estimate vision tokens with OpenAI's high-detail tiling rule (85 + 170 per 512px tile)."""
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+class ImagePreparer:
+    """Downscales and re-encodes slide images before they are sent to a vision model.
+
+    Encoded data URLs are cached in memory by file content hash (plus the
+    encoding settings), so unchanged slides are never decoded or encoded again.
+    """
+
+    _shared: Optional["ImagePreparer"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        max_width: int = 0,
+        max_height: int = 0,
+        image_format: str = "png",
+        quality: int = 85,
+        max_entries: int = 512,
+    ):
+        if image_format.lower() not in _FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.max_width = max_width
+        self.max_height = max_height
+        self.image_format = image_format.lower()
+        self.quality = quality
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, PreparedImage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ImagePreparer":
+        return cls(
+            max_width=int(os.getenv("VISION_MAX_WIDTH", "0") or 0),
+            max_height=int(os.getenv("VISION_MAX_HEIGHT", "0") or 0),
+            image_format=os.getenv("VISION_IMAGE_FORMAT", "png") or "png",
+            quality=int(os.getenv("VISION_IMAGE_QUALITY", "85") or 85),
+        )
+
+    @classmethod
+    def shared(cls) -> "ImagePreparer":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls.from_env()
+            return cls._shared
+
+    def _key(self, data: bytes) -> str:
+        settings = f"{self.max_width}x{self.max_height}:{self.image_format}:{self.quality}"
+        return hashlib.sha256(data).hexdigest() + ":" + settings
+
+    def prepare(self, image_path: str) -> PreparedImage:
+        with open(image_path, "rb") as f:
+            data = f.read()
+        key = self._key(data)
+        with self._lock:
+            prepared = self._entries.get(key)
+            if prepared is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return prepared
+            self.misses += 1
+        prepared = self._encode(data)
+        with self._lock:
+            self._entries[key] = prepared
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return prepared
+
+    def estimate_tokens(self, image_path: str) -> int:
+        """Vision tokens the image would cost once prepared, without encoding it."""
+        with Image.open(image_path) as image:
+            width, height = image.size
+        bounds = (self.max_width or width, self.max_height or height)
+        scale = min(1.0, bounds[0] / width, bounds[1] / height)
+        return estimate_image_tokens(round(width * scale), round(height * scale))
+
+    def _encode(self, data: bytes) -> PreparedImage:
+        pil_format, mime = _FORMATS[self.image_format]
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            source_format = image.format
+            bounds = (self.max_width or width, self.max_height or height)
+            resize = width > bounds[0] or height > bounds[1]
+            if not resize and source_format == pil_format:
+                payload = data
+            else:
+                image = image.copy()
+                if resize:
+                    image.thumbnail(bounds, Image.LANCZOS)
+                    width, height = image.size
+                if pil_format == "JPEG" and image.mode not in {"RGB", "L"}:
+                    image = image.convert("RGB")
+                buffer = io.BytesIO()
+                if pil_format == "PNG":
+                    image.save(buffer, format=pil_format, optimize=True)
+                else:
+                    image.save(buffer, format=pil_format, quality=self.quality)
+                payload = buffer.getvalue()
+        b64 = base64.b64encode(payload).decode("utf-8")
+        return PreparedImage(
+            url=f"data:{mime};base64,{b64}",
+            bytes=len(payload),
+            width=width,
+            height=height,
+            tokens=estimate_image_tokens(width, height),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
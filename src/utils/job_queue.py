@@ -0,0 +1,181 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = {DONE, FAILED}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class JobQueue:
+    """Jobs and their event streams in SQLite, so the queue survives restarts.
+
+    Jobs that were running when the process stopped are put back in the
+    queue by `recover()`.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def recover(self) -> int:
+        """Requeue jobs left running by a previous process."""
+        with self._lock, self._transaction() as conn:
+            count = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING)
+            ).rowcount
+            self._available.notify_all()
+        return count
+
+    def submit(
+        self,
+        name: str,
+        input_path: str,
+        output_dir: str,
+        options: Optional[Dict[str, Any]] = None,
+        job_id: Optional[str] = None,
+    ) -> str:
+        job_id = job_id or new_job_id()
+        with self._lock, self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, name, status, input_path, output_dir, options, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, name, QUEUED, input_path, output_dir, json.dumps(options or {}), time.time()),
+            )
+            self._add_event(conn, job_id, "status", {"status": QUEUED})
+            self._available.notify()
+        return job_id
+
+    def claim(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued job and mark it running; None after `timeout`."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while True:
+                with self._transaction() as conn:
+                    row = conn.execute(
+                        "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                    ).fetchone()
+                    if row is not None:
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                            (RUNNING, time.time(), row["id"]),
+                        )
+                        self._add_event(conn, row["id"], "status", {"status": RUNNING})
+                if row is not None:
+                    return self._get(row["id"])
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._available.wait(remaining)
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: str = "") -> None:
+        status = FAILED if error else DONE
+        with self._lock, self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error or None, time.time(), job_id),
+            )
+            self._add_event(conn, job_id, "status", {"status": status, "error": error or None})
+
+    def add_event(self, job_id: str, event_type: str, data: Dict[str, Any]) -> None:
+        with self._lock, self._transaction() as conn:
+            self._add_event(conn, job_id, event_type, data)
+
+    @staticmethod
+    def _add_event(conn: sqlite3.Connection, job_id: str, event_type: str, data: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT INTO events (job_id, seq, ts, type, data) "
+            "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE job_id = ?), ?, ?, ?)",
+            (job_id, job_id, time.time(), event_type, json.dumps(data, ensure_ascii=False, default=str)),
+        )
+
+    def events(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, ts, type, data FROM events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [{"seq": row["seq"], "ts": row["ts"], "type": row["type"], "data": json.loads(row["data"])} for row in rows]
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._get(job_id)
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            if status:
+                rows = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+            return [self._get(row["id"]) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
@@ -0,0 +1,356 @@
+import bisect
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from utils.slides import Slide, split_slides
+
+
+ERROR = "ERROR"
+WARNING = "WARNING"
+
+_FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})\s*([\w-]*)")
+_FRONTMATTER_LINE_RE = re.compile(r"^\s*(#.*|-\s.*|-|[\w$.\-\"']+\s*:.*|\s+.*)?$")
+_FRONTMATTER_KEY_RE = re.compile(
+    r"^(layout|class|background|transition|clicks|level|hideInToc|theme|title|image|src)\s*:\s*\S"
+)
+_TAG_RE = re.compile(r"<(/?)([A-Za-z][\w.-]*)((?:\s[^<>]*?)?)(/?)>")
+_INLINE_CODE_RE = re.compile(r"`[^`\n]*`")
+_SLOT_RE = re.compile(r"^::([\w-]+)::\s*$")
+
+_VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr",
+}
+# Lowercase names without a dash are only HTML when they are real elements; `x<y>z` is prose.
+# Vue components (`<Tweet>`, `<v-click>`, `<carbon-logo>`) are recognised by their shape.
+_HTML_TAGS = _VOID_TAGS | {
+    "a", "abbr", "address", "article", "aside", "audio", "b", "bdi", "bdo", "blockquote", "button", "canvas",
+    "caption", "center", "cite", "code", "colgroup", "data", "datalist", "dd", "del", "details", "dfn", "dialog",
+    "div", "dl", "dt", "em", "fieldset", "figcaption", "figure", "font", "footer", "form", "h1", "h2", "h3", "h4",
+    "h5", "h6", "header", "hgroup", "i", "iframe", "ins", "kbd", "label", "legend", "li", "main", "map", "mark",
+    "menu", "meter", "nav", "noscript", "object", "ol", "optgroup", "option", "output", "p", "picture", "pre",
+    "progress", "q", "rp", "rt", "ruby", "s", "samp", "script", "section", "select", "slot", "small", "span",
+    "strike", "strong", "style", "sub", "summary", "sup", "table", "tbody", "td", "template", "textarea", "tfoot",
+    "th", "thead", "time", "tr", "u", "ul", "var", "video", "svg", "g", "defs", "text", "tspan", "path", "rect",
+    "circle", "ellipse", "line", "polyline", "polygon", "marker", "symbol", "use", "foreignobject", "math",
+}
+_SLOT_LAYOUTS = {
+    "two-cols": {"left", "right", "default"},
+    "two-cols-header": {"left", "right", "default"},
+}
+_MERMAID_TYPES = (
+    "graph", "flowchart", "sequenceDiagram", "classDiagram", "stateDiagram", "stateDiagram-v2",
+    "erDiagram", "gantt", "pie", "journey", "gitGraph", "mindmap", "timeline", "quadrantChart",
+    "requirementDiagram", "C4Context", "C4Container", "C4Component", "C4Dynamic", "C4Deployment",
+    "xychart-beta", "sankey-beta", "block-beta", "packet-beta", "architecture-beta",
+)
+_MERMAID_PAIRS = {"[": "]", "(": ")", "{": "}"}
+
+
+@dataclass
+class LintIssue:
+    slide: int
+    line: int
+    rule: str
+    message: str
+    severity: str = ERROR
+
+    def format(self) -> str:
+        return f"[{self.severity}] slide {self.slide}, line {self.line} ({self.rule}): {self.message}"
+
+
+def format_issues(issues: List[LintIssue]) -> str:
+    return "\n".join(issue.format() for issue in issues)
+
+
+def has_errors(issues: List[LintIssue]) -> bool:
+    return any(issue.severity == ERROR for issue in issues)
+
+
+def lint_slides(markdown: str) -> List[LintIssue]:
+    if not markdown.strip():
+        return [LintIssue(slide=0, line=1, rule="empty-deck", message="The deck is empty.")]
+    issues: List[LintIssue] = []
+    slides = split_slides(markdown)
+    for slide in slides:
+        issues.extend(lint_slide(slide))
+    issues.sort(key=lambda issue: (issue.slide, issue.line))
+    return issues
+
+
+def lint_slide(slide: Slide) -> List[LintIssue]:
+    issues: List[LintIssue] = []
+    issues.extend(_check_frontmatter(slide))
+    content_lines = slide.content.split("\n") if slide.content else []
+    if not "".join(content_lines).strip() and not slide.frontmatter:
+        issues.append(
+            LintIssue(
+                slide=slide.index,
+                line=slide.start_line,
+                rule="empty-slide",
+                message="Empty slide; usually caused by a doubled `---` separator.",
+                severity=WARNING,
+            )
+        )
+    prose, fence_issues, mermaid_blocks = _scan_fences(slide, content_lines)
+    issues.extend(fence_issues)
+    issues.extend(_check_frontmatter_in_content(slide, prose))
+    issues.extend(_check_slots(slide, prose))
+    issues.extend(_check_html(slide, prose))
+    for start_line, body in mermaid_blocks:
+        issues.extend(_check_mermaid(slide, start_line, body))
+    return issues
+
+
+def _check_frontmatter(slide: Slide) -> List[LintIssue]:
+    if not slide.frontmatter and slide.frontmatter_closed:
+        return []
+    issues: List[LintIssue] = []
+    if not slide.frontmatter_closed:
+        issues.append(
+            LintIssue(
+                slide=slide.index,
+                line=slide.start_line,
+                rule="frontmatter-unclosed",
+                message="Frontmatter block opened with `---` is never closed.",
+            )
+        )
+    for offset, line in enumerate(slide.frontmatter.split("\n"), start=1):
+        stripped = line.strip()
+        if re.match(r"^#{1,6}\s", stripped) or not _FRONTMATTER_LINE_RE.match(line):
+            issues.append(
+                LintIssue(
+                    slide=slide.index,
+                    line=slide.start_line + offset,
+                    rule="frontmatter-invalid",
+                    message=(
+                        f"`{stripped[:60]}` is inside a frontmatter block. Add a blank line after `---` "
+                        "for slide content, or close the frontmatter with `---`."
+                    ),
+                )
+            )
+            break
+    return issues
+
+
+def _scan_fences(
+    slide: Slide, content_lines: List[str]
+) -> Tuple[List[Tuple[int, str]], List[LintIssue], List[Tuple[int, str]]]:
+    """Return (prose lines outside code fences, fence issues, mermaid blocks)."""
+    prose: List[Tuple[int, str]] = []
+    issues: List[LintIssue] = []
+    mermaid_blocks: List[Tuple[int, str]] = []
+    fence: Optional[str] = None
+    fence_lang = ""
+    fence_line = 0
+    body: List[str] = []
+    for offset, line in enumerate(content_lines):
+        line_no = slide.content_line + offset
+        if fence is None:
+            match = _FENCE_RE.match(line)
+            if match:
+                fence, fence_lang, fence_line, body = match.group(1), match.group(2), line_no, []
+                continue
+            prose.append((line_no, line))
+            continue
+        if line.strip().startswith(fence) and not line.strip()[len(fence):].strip():
+            if fence_lang == "mermaid":
+                mermaid_blocks.append((fence_line, "\n".join(body)))
+            fence = None
+            continue
+        body.append(line)
+    if fence is not None:
+        issues.append(
+            LintIssue(
+                slide=slide.index,
+                line=fence_line,
+                rule="unclosed-code-fence",
+                message=f"Code fence `{fence}{fence_lang}` is never closed; it swallows the following slides.",
+            )
+        )
+    return prose, issues, mermaid_blocks
+
+
+def _check_frontmatter_in_content(slide: Slide, prose: List[Tuple[int, str]]) -> List[LintIssue]:
+    issues: List[LintIssue] = []
+    first = next(((line_no, line) for line_no, line in prose if line.strip()), None)
+    if first and _FRONTMATTER_KEY_RE.match(first[1]):
+        issues.append(
+            LintIssue(
+                slide=slide.index,
+                line=first[0],
+                rule="frontmatter-blank-line",
+                message=(
+                    f"`{first[1].strip()}` is rendered as text. Remove blank lines between `---` and the "
+                    "frontmatter keys."
+                ),
+            )
+        )
+    for line_no, line in prose:
+        if first and line_no == first[0]:
+            continue
+        if re.match(r"^layout\s*:\s*\S", line):
+            issues.append(
+                LintIssue(
+                    slide=slide.index,
+                    line=line_no,
+                    rule="multiple-layouts",
+                    message="`layout:` inside slide content; declare one layout per slide and start a new slide instead.",
+                )
+            )
+    return issues
+
+
+def _check_slots(slide: Slide, prose: List[Tuple[int, str]]) -> List[LintIssue]:
+    issues: List[LintIssue] = []
+    layout = slide.layout or ""
+    allowed = _SLOT_LAYOUTS.get(layout)
+    for line_no, line in prose:
+        match = _SLOT_RE.match(line.strip())
+        if not match:
+            continue
+        slot = match.group(1)
+        if allowed is None:
+            issues.append(
+                LintIssue(
+                    slide=slide.index,
+                    line=line_no,
+                    rule="stray-slot",
+                    message=f"`::{slot}::` used without a two-column layout (layout: {layout or 'default'}).",
+                )
+            )
+        elif slot not in allowed:
+            issues.append(
+                LintIssue(
+                    slide=slide.index,
+                    line=line_no,
+                    rule="unknown-slot",
+                    message=f"Layout `{layout}` has no `{slot}` slot.",
+                )
+            )
+    return issues
+
+
+def _check_html(slide: Slide, prose: List[Tuple[int, str]]) -> List[LintIssue]:
+    issues: List[LintIssue] = []
+    stack: List[Tuple[str, int]] = []
+    # Match against the joined prose so an opening tag split over several lines is one tag.
+    line_starts: List[int] = []
+    parts: List[str] = []
+    offset = 0
+    for _line_no, line in prose:
+        text = _INLINE_CODE_RE.sub("", line)
+        line_starts.append(offset)
+        parts.append(text)
+        offset += len(text) + 1
+    for match in _TAG_RE.finditer("\n".join(parts)):
+        closing, name, _attrs, self_closing = match.groups()
+        if not _is_markup_tag(name):
+            continue
+        line_no = prose[bisect.bisect_right(line_starts, match.start()) - 1][0]
+        lowered = name.lower()
+        if self_closing or lowered in _VOID_TAGS:
+            continue
+        if not closing:
+            stack.append((name, line_no))
+            continue
+        if stack and stack[-1][0] == name:
+            stack.pop()
+            continue
+        if any(open_name == name for open_name, _ in stack):
+            while stack and stack[-1][0] != name:
+                open_name, open_line = stack.pop()
+                issues.append(_unclosed_tag(slide, open_name, open_line))
+            stack.pop()
+            continue
+        issues.append(
+            LintIssue(
+                slide=slide.index,
+                line=line_no,
+                rule="unbalanced-html",
+                message=f"Closing `</{name}>` has no matching opening tag.",
+            )
+        )
+    for open_name, open_line in stack:
+        issues.append(_unclosed_tag(slide, open_name, open_line))
+    return issues
+
+
+def _is_markup_tag(name: str) -> bool:
+    return name.lower() in _HTML_TAGS or name[0].isupper() or "-" in name or "." in name
+
+
+def _unclosed_tag(slide: Slide, name: str, line_no: int) -> LintIssue:
+    return LintIssue(
+        slide=slide.index,
+        line=line_no,
+        rule="unbalanced-html",
+        message=f"`<{name}>` is never closed within this slide.",
+    )
+
+
+def _check_mermaid(slide: Slide, start_line: int, body: str) -> List[LintIssue]:
+    lines = body.split("\n")
+    meaningful = [(offset, line) for offset, line in enumerate(lines, start=1) if line.strip()]
+    if not meaningful:
+        return [
+            LintIssue(slide=slide.index, line=start_line, rule="mermaid-empty", message="Mermaid block is empty.")
+        ]
+    issues: List[LintIssue] = []
+    first_offset, first = meaningful[0]
+    if first.strip().startswith("%%"):
+        meaningful = [item for item in meaningful if not item[1].strip().startswith("%%")] or meaningful
+        first_offset, first = meaningful[0]
+    diagram_type = first.strip().split()[0]
+    if diagram_type not in _MERMAID_TYPES:
+        issues.append(
+            LintIssue(
+                slide=slide.index,
+                line=start_line + first_offset,
+                rule="mermaid-type",
+                message=f"Unknown Mermaid diagram type `{diagram_type}`.",
+            )
+        )
+        return issues
+    if diagram_type not in {"graph", "flowchart"}:
+        return issues
+    for offset, line in meaningful[1:]:
+        problem = _mermaid_line_problem(line)
+        if problem:
+            message, severity = problem
+            issues.append(
+                LintIssue(
+                    slide=slide.index,
+                    line=start_line + offset,
+                    rule="mermaid-syntax",
+                    message=f"{message}: `{line.strip()[:80]}`",
+                    severity=severity,
+                )
+            )
+    return issues
+
+
+def _mermaid_line_problem(line: str) -> Optional[Tuple[str, str]]:
+    if line.count('"') % 2:
+        return "Unbalanced quote in Mermaid node label", ERROR
+    # Bracket balance is a heuristic (node shapes are varied), so it only warns and never blocks a render.
+    stack: List[str] = []
+    in_quote = False
+    previous = ""
+    for char in line:
+        if char == '"':
+            in_quote = not in_quote
+        elif in_quote:
+            pass
+        elif char in _MERMAID_PAIRS:
+            stack.append(_MERMAID_PAIRS[char])
+        elif char == ">" and (previous.isalnum() or previous == "_"):
+            # Asymmetric node shape `A>label]`; arrows (`-->`, `==>`) follow `-`, `=` or `.`.
+            stack.append("]")
+        elif char in _MERMAID_PAIRS.values():
+            if not stack or stack.pop() != char:
+                return "Unbalanced bracket in Mermaid node", WARNING
+        previous = char
+    if stack:
+        return "Unclosed bracket in Mermaid node", WARNING
+    return None
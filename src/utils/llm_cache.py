@@ -0,0 +1,149 @@
+import base64
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+_DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[2] / ".cache" / "llm"
+
+
+class LLMCache:
+    """Persistent response cache keyed on the full chat request.
+
+    Entries live as one JSON file per key. Least-recently-used entries are
+    evicted once the directory exceeds `max_bytes`, and entries older than
+    `ttl_seconds` count as misses.
+    """
+
+    _shared: Optional["LLMCache"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, root: str, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 7 * 24 * 3600):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMCache"]:
+        enabled = os.getenv("LLM_CACHE", "").strip().lower() in {"1", "true", "yes", "on"}
+        if not enabled:
+            return None
+        root = os.getenv("LLM_CACHE_DIR") or str(_DEFAULT_CACHE_DIR)
+        max_mb = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+        ttl_hours = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+        return cls(root=root, max_bytes=int(max_mb * 1024 * 1024), ttl_seconds=ttl_hours * 3600)
+
+    @classmethod
+    def shared(cls) -> Optional["LLMCache"]:
+        """Process-wide cache so every agent's client reports into the same counters."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls.from_env()
+            return cls._shared
+
+    @staticmethod
+    def _canonical_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        canonical = copy.deepcopy(messages)
+        for message in canonical:
+            content = message.get("content")
+            if not isinstance(content, list):
+                continue
+            for part in content:
+                if not isinstance(part, dict):
+                    continue
+                image = part.get("image_url")
+                url = image.get("url", "") if isinstance(image, dict) else part.get("image_url", "")
+                if not isinstance(url, str) or not url.startswith("data:"):
+                    continue
+                _header, _, b64 = url.partition(",")
+                try:
+                    digest = hashlib.sha256(base64.b64decode(b64)).hexdigest()
+                except (ValueError, TypeError):
+                    digest = hashlib.sha256(b64.encode("utf-8")).hexdigest()
+                if isinstance(image, dict):
+                    image["url"] = f"sha256:{digest}"
+                else:
+                    part["image_url"] = f"sha256:{digest}"
+        return canonical
+
+    @classmethod
+    def make_key(
+        cls,
+        provider: str,
+        model: str,
+        temperature: float,
+        json_mode: bool,
+        reasoning_effort: Optional[str],
+        messages: List[Dict[str, Any]],
+    ) -> str:
+        payload = {
+            "provider": provider,
+            "model": model,
+            "temperature": temperature,
+            "json_mode": json_mode,
+            "reasoning_effort": reasoning_effort,
+            "messages": cls._canonical_messages(messages),
+        }
+        text = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        entry = None
+        if path.exists():
+            try:
+                entry = json.loads(path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, OSError):
+                entry = None
+        if entry is not None and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            path.unlink(missing_ok=True)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        os.utime(path)
+        return entry
+
+    def put(self, key: str, content: str, usage: Optional[Dict[str, Any]]) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"created_at": time.time(), "content": content, "usage": usage}
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        files = []
+        total = 0
+        for path in self.root.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
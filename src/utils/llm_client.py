@@ -1,17 +1,204 @@
+import asyncio
 import base64
 import json
 import os
+import threading
 import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, OpenAI
 from openai import APIConnectionError, APITimeoutError, RateLimitError, APIStatusError
 
+from utils import tracing
+from utils.image_prep import ImagePreparer
+from utils.llm_cache import LLMCache
+
+T = TypeVar("T")
+
+_RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, APIStatusError)
+
+# One pooled HTTP transport shared by every client and provider. Async
+# transports and semaphores are bound to the event loop that uses them.
+_pool_lock = threading.Lock()
+_sync_http_client: Optional[httpx.Client] = None
+_request_slots: Optional[threading.BoundedSemaphore] = None
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_provider_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _pool_limits() -> httpx.Limits:
+    max_connections = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+def _shared_http_client() -> httpx.Client:
+    global _sync_http_client
+    with _pool_lock:
+        if _sync_http_client is None:
+            _sync_http_client = httpx.Client(limits=_pool_limits(), timeout=httpx.Timeout(600.0, connect=10.0))
+        return _sync_http_client
+
+
+def _shared_async_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        client = _async_http_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=_pool_limits(), timeout=httpx.Timeout(600.0, connect=10.0))
+            _async_http_clients[loop] = client
+        return client
+
+
+def provider_concurrency(provider: str) -> int:
+    value = os.getenv(f"LLM_MAX_CONCURRENCY_{provider.upper()}") or os.getenv("LLM_MAX_CONCURRENCY") or "4"
+    return max(1, int(value))
+
+
+def _provider_semaphore(provider: str) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        semaphores = _provider_semaphores.setdefault(loop, {})
+        if provider not in semaphores:
+            semaphores[provider] = asyncio.Semaphore(provider_concurrency(provider))
+        return semaphores[provider]
+
+
+def set_request_limit(limit: int) -> None:
+    """Cap in-flight LLM requests across all threads and event loops (0 = no cap).
+
+    The per-provider semaphores only bound one event loop; batch and service
+    modes run several pipelines in threads and share this limit instead.
+    """
+    global _request_slots
+    _request_slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+
+
+@contextmanager
+def request_slot() -> Iterator[None]:
+    slots = _request_slots
+    if slots is None:
+        yield
+        return
+    slots.acquire()
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+@asynccontextmanager
+async def arequest_slot() -> AsyncIterator[None]:
+    slots = _request_slots
+    if slots is None:
+        yield
+        return
+    # Poll instead of blocking the event loop thread on the semaphore.
+    while not slots.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+async def _close_loop_transport() -> None:
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        client = _async_http_clients.pop(loop, None)
+        _provider_semaphores.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+def run_async(coro: Awaitable[T]) -> T:
+    """Run a coroutine from synchronous code and close the loop's pooled transport afterwards."""
+
+    async def runner() -> T:
+        try:
+            return await coro
+        finally:
+            await _close_loop_transport()
+
+    return asyncio.run(runner())
+
+
+def normalize_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Add a provider-independent `cached_tokens` count to a usage payload.
+
+    OpenAI chat reports `prompt_tokens_details.cached_tokens`, the Responses
+    API `input_tokens_details.cached_tokens` and DeepSeek `prompt_cache_hit_tokens`.
+    """
+    if not usage:
+        return usage
+    cached = 0
+    for details_key in ("prompt_tokens_details", "input_tokens_details"):
+        details = usage.get(details_key)
+        if isinstance(details, dict) and details.get("cached_tokens"):
+            cached = details["cached_tokens"]
+            break
+    else:
+        cached = usage.get("prompt_cache_hit_tokens") or usage.get("cached_tokens") or 0
+    usage["cached_tokens"] = cached
+    return usage
+
+
+def usage_attributes(usage: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Token counts from a normalized usage payload, for span attributes."""
+    usage = usage or {}
+    return {
+        "input_tokens": usage.get("input_tokens", usage.get("prompt_tokens", 0)) or 0,
+        "output_tokens": usage.get("output_tokens", usage.get("completion_tokens", 0)) or 0,
+        "cached_tokens": usage.get("cached_tokens", 0) or 0,
+    }
+
+
 @dataclass
 class LLMResponse:
     content: str
     usage: Optional[Dict[str, Any]] = None
+    cached: bool = False
+    ttft: Optional[float] = None
+    # {"images", "bytes", "tokens"} for the images attached to the request.
+    image_stats: Optional[Dict[str, int]] = None
+    # Local estimate of the prompt size and how much of it was replayed history.
+    prompt_stats: Optional[Dict[str, int]] = None
+
+
+class LLMStream:
+    """Iterates over text deltas of a streamed completion.
+
+    `response` holds the full LLMResponse (content, usage, time to first
+    token) once iteration has finished.
+    """
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self.response: Optional[LLMResponse] = None
+        self._callbacks: List[Callable[[LLMResponse], None]] = []
+
+    def on_complete(self, callback: Callable[[LLMResponse], None]) -> None:
+        self._callbacks.append(callback)
+
+    def _complete(self, response: LLMResponse) -> None:
+        self.response = response
+        for callback in self._callbacks:
+            callback(response)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._chunks
+
+    def collect(self) -> LLMResponse:
+        for _ in self:
+            pass
+        return self.response
 
 
 class LLMClient:
@@ -20,8 +207,10 @@ class LLMClient:
         provider: str = "openai",
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
+        cache: Optional[LLMCache] = None,
     ):
         self.provider = provider
+        self.cache = cache if cache is not None else LLMCache.shared()
         if provider == "openai":
             api_key = api_key or os.getenv("OPENAI_API_KEY")
             base_url = base_url or os.getenv("OPENAI_BASE_URL")
@@ -37,11 +226,27 @@ class LLMClient:
         if not api_key:
             raise EnvironmentError("API key is not set for provider")
 
+        self._api_key = api_key
+        self._base_url = base_url
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+            weakref.WeakKeyDictionary()
+        )
         if base_url:
-            self.client = OpenAI(api_key=api_key, base_url=base_url)
+            self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=_shared_http_client())
         else:
-            self.client = OpenAI(api_key=api_key)
-    
+            self.client = OpenAI(api_key=api_key, http_client=_shared_http_client())
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            kwargs: Dict[str, Any] = {"api_key": self._api_key, "http_client": _shared_async_http_client()}
+            if self._base_url:
+                kwargs["base_url"] = self._base_url
+            client = AsyncOpenAI(**kwargs)
+            self._async_clients[loop] = client
+        return client
 
 
     @staticmethod
@@ -86,6 +291,61 @@ class LLMClient:
     
     
 
+    def _cache_lookup(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        json_mode: bool,
+        reasoning_effort: str,
+    ) -> tuple[Optional[str], Optional[LLMResponse]]:
+        if self.cache is None:
+            return None, None
+        cache_key = LLMCache.make_key(self.provider, model, temperature, json_mode, reasoning_effort, messages)
+        entry = self.cache.get(cache_key)
+        if entry is None:
+            return cache_key, None
+        return cache_key, LLMResponse(content=entry.get("content", ""), usage=None, cached=True)
+
+    def _span_attributes(self, model: str, json_mode: bool, reasoning_effort: Optional[str]) -> Dict[str, Any]:
+        reasoning = self._use_reasoning(model, reasoning_effort)
+        return {
+            "provider": self.provider,
+            "model": model,
+            "api": "responses" if reasoning else "chat",
+            "reasoning_effort": reasoning_effort if reasoning else None,
+            "json_mode": json_mode,
+        }
+
+    def _use_reasoning(self, model: str, reasoning_effort: Optional[str]) -> bool:
+        return bool(
+            reasoning_effort
+            and self.provider == "openai"
+            and model.startswith("gpt-5")
+            and hasattr(self.client, "responses")
+        )
+
+    @staticmethod
+    def _parse_responses_result(response: Any) -> LLMResponse:
+        content = getattr(response, "output_text", None) or ""
+        if not content:
+            try:
+                for item in response.output[0].content:
+                    text = getattr(item, "text", None)
+                    if text:
+                        content = text
+                        break
+            except Exception:
+                content = ""
+        usage = response.usage.model_dump() if response.usage else None
+        return LLMResponse(content=content, usage=normalize_usage(usage))
+
+    @staticmethod
+    def _parse_chat_result(response: Any) -> LLMResponse:
+        content = response.choices[0].message.content or ""
+        usage = response.usage.model_dump() if response.usage else None
+        return LLMResponse(content=content, usage=normalize_usage(usage))
+
     def chat_completion(
         self,
         messages: List[Dict[str, Any]],
@@ -96,71 +356,277 @@ class LLMClient:
         max_retries: int = 5,
         retry_delay: float = 2,
     ) -> LLMResponse:
-        last_err: Optional[Exception] = None
-        for attempt in range(1, max_retries + 1):
+        if not reasoning_effort:
+            reasoning_effort = "low"
+
+        with tracing.span("llm.call", **self._span_attributes(model, json_mode, reasoning_effort)) as call:
+            cache_key, cached = self._cache_lookup(messages, model, temperature, json_mode, reasoning_effort)
+            if cached is not None:
+                call.set(cache_hit=True, **usage_attributes(cached.usage))
+                return cached
+
+            result: Optional[LLMResponse] = None
+            last_err: Optional[Exception] = None
+            for attempt in range(1, max_retries + 1):
+                call.set(attempt=attempt)
+                try:
+                    with request_slot():
+                        result = self._request_completion(
+                            messages, model, temperature, json_mode, reasoning_effort
+                        )
+                    break
+                except _RETRYABLE_ERRORS as err:
+                    last_err = err
+                    if attempt < max_retries:
+                        time.sleep(retry_delay * attempt)
+                        continue
+                    raise
+            if result is None:
+                if last_err:
+                    raise last_err
+                raise RuntimeError("Unknown error in chat_completion")
+
+            call.set(cache_hit=False, **usage_attributes(result.usage))
+            if cache_key is not None:
+                self.cache.put(cache_key, result.content, result.usage)
+            return result
+
+    def _request_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        json_mode: bool,
+        reasoning_effort: str,
+    ) -> LLMResponse:
+        # Reasoning
+        if self._use_reasoning(model, reasoning_effort):
+            response = self.client.responses.create(
+                model=model,
+                input=self._convert_messages_for_responses(messages),
+                reasoning={"effort": reasoning_effort},
+            )
+            return self._parse_responses_result(response)
+
+        # Normal Chat Completion
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format={"type": "json_object"} if json_mode else None,
+        )
+        return self._parse_chat_result(response)
+
+    async def achat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float = 0.3,
+        json_mode: bool = False,
+        reasoning_effort: Optional[str] = None,
+        max_retries: int = 5,
+        retry_delay: float = 2,
+    ) -> LLMResponse:
+        if not reasoning_effort:
+            reasoning_effort = "low"
+
+        with tracing.span("llm.call", **self._span_attributes(model, json_mode, reasoning_effort)) as call:
+            cache_key, cached = self._cache_lookup(messages, model, temperature, json_mode, reasoning_effort)
+            if cached is not None:
+                call.set(cache_hit=True, **usage_attributes(cached.usage))
+                return cached
+
+            result: Optional[LLMResponse] = None
+            last_err: Optional[Exception] = None
+            for attempt in range(1, max_retries + 1):
+                call.set(attempt=attempt)
+                try:
+                    async with _provider_semaphore(self.provider), arequest_slot():
+                        result = await self._arequest_completion(
+                            messages, model, temperature, json_mode, reasoning_effort
+                        )
+                    break
+                except _RETRYABLE_ERRORS as err:
+                    last_err = err
+                    if attempt < max_retries:
+                        await asyncio.sleep(retry_delay * attempt)
+                        continue
+                    raise
+            if result is None:
+                if last_err:
+                    raise last_err
+                raise RuntimeError("Unknown error in achat_completion")
+
+            call.set(cache_hit=False, **usage_attributes(result.usage))
+            if cache_key is not None:
+                self.cache.put(cache_key, result.content, result.usage)
+            return result
+
+    async def _arequest_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        json_mode: bool,
+        reasoning_effort: str,
+    ) -> LLMResponse:
+        client = self.async_client
+        if self._use_reasoning(model, reasoning_effort):
+            response = await client.responses.create(
+                model=model,
+                input=self._convert_messages_for_responses(messages),
+                reasoning={"effort": reasoning_effort},
+            )
+            return self._parse_responses_result(response)
+
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format={"type": "json_object"} if json_mode else None,
+        )
+        return self._parse_chat_result(response)
+
+    def chat_completion_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float = 0.3,
+        json_mode: bool = False,
+        reasoning_effort: Optional[str] = None,
+        max_retries: int = 5,
+        retry_delay: float = 2,
+    ) -> LLMStream:
+        if not reasoning_effort:
+            reasoning_effort = "low"
+        stream = LLMStream(iter(()))
+
+        def chunks() -> Iterator[str]:
+            start = time.time()
+            # The generator runs in its consumer's context, so the span is not made current.
+            call = tracing.start_span(
+                "llm.call", activate=False, stream=True, **self._span_attributes(model, json_mode, reasoning_effort)
+            )
+            error: Optional[BaseException] = None
             try:
-                response_format = {"type": "json_object"} if json_mode else None
-                if not reasoning_effort:
-                    reasoning_effort = "low"
-
-                use_reasoning = (
-                    reasoning_effort
-                    and self.provider == "openai"
-                    and model.startswith("gpt-5")
-                    and hasattr(self.client, "responses")
-                )
+                cache_key, cached = self._cache_lookup(messages, model, temperature, json_mode, reasoning_effort)
+                if cached is not None:
+                    cached.ttft = time.time() - start
+                    call.set(cache_hit=True, ttft=cached.ttft, **usage_attributes(cached.usage))
+                    tracing.end_span(call)
+                    yield cached.content
+                    stream._complete(cached)
+                    return
 
-                # Reasoning
-                if use_reasoning:
-                    print(f"{model}: Deep Reasoning...")
-                    start_dr = time.time()
-                    input_payload = self._convert_messages_for_responses(messages)
-                    response = self.client.responses.create(
-                        model=model,
-                        input=input_payload,
-                        reasoning={"effort": reasoning_effort},
-                    )
-
-                    content = getattr(response, "output_text", None) or ""
-                    if not content:
+                # The slot is held until the stream is consumed (or the generator is closed).
+                with request_slot():
+                    events = None
+                    for attempt in range(1, max_retries + 1):
+                        call.set(attempt=attempt)
                         try:
-                            for item in response.output[0].content:
-                                text = getattr(item, "text", None)
-                                if text:
-                                    content = text
-                                    break
-                        except Exception:
-                            content = ""
-
-                    usage = response.usage.model_dump() if response.usage else None
-
-                    print(f"Deep Reasoning Time: {time.time() - start_dr:.2f}s")
-                    return LLMResponse(content=content, usage=usage)
-
-                # Normal Chat Completion
-                response = self.client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    response_format=response_format,
-                )
-                content = response.choices[0].message.content or ""
-                usage = response.usage.model_dump() if response.usage else None
-                return LLMResponse(content=content, usage=usage)
-            except (RateLimitError, APIConnectionError, APITimeoutError, APIStatusError) as err:
-                last_err = err
-                if attempt < max_retries:
-                    time.sleep(retry_delay * attempt)
-                    continue
+                            events = self._open_stream(messages, model, temperature, json_mode, reasoning_effort)
+                            break
+                        except _RETRYABLE_ERRORS as err:
+                            # Retried errors would otherwise leave no trace; the final one ends the span.
+                            call.set(retry_error=f"{type(err).__name__}: {err}"[:200])
+                            if attempt < max_retries:
+                                time.sleep(retry_delay * attempt)
+                                continue
+                            raise
+
+                    parts: List[str] = []
+                    usage: Optional[Dict[str, Any]] = None
+                    ttft: Optional[float] = None
+                    for text, event_usage in events:
+                        if event_usage is not None:
+                            usage = event_usage
+                        if text:
+                            if ttft is None:
+                                ttft = time.time() - start
+                            parts.append(text)
+                            yield text
+                    result = LLMResponse(content="".join(parts), usage=normalize_usage(usage), ttft=ttft)
+                    call.set(cache_hit=False, ttft=ttft, **usage_attributes(result.usage))
+                    tracing.end_span(call)
+                if cache_key is not None:
+                    self.cache.put(cache_key, result.content, result.usage)
+                stream._complete(result)
+            except GeneratorExit:
+                # The consumer stopped reading; the call itself did not fail.
+                call.set(closed=True)
                 raise
-        if last_err:
-            raise last_err
-        raise RuntimeError("Unknown error in chat_completion")
-    
+            except BaseException as err:
+                error = err
+                raise
+            finally:
+                # No-op when the span already ended (cache hit, completed stream).
+                tracing.end_span(call, error=error)
+
+        stream._chunks = chunks()
+        return stream
+
+    def _open_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        json_mode: bool,
+        reasoning_effort: str,
+    ) -> Iterator[tuple[str, Optional[Dict[str, Any]]]]:
+        if self._use_reasoning(model, reasoning_effort):
+            response = self.client.responses.create(
+                model=model,
+                input=self._convert_messages_for_responses(messages),
+                reasoning={"effort": reasoning_effort},
+                stream=True,
+            )
+
+            def responses_events() -> Iterator[tuple[str, Optional[Dict[str, Any]]]]:
+                for event in response:
+                    event_type = getattr(event, "type", "")
+                    if event_type == "response.output_text.delta":
+                        yield getattr(event, "delta", "") or "", None
+                    elif event_type == "response.completed":
+                        final = getattr(event, "response", None)
+                        usage = final.usage.model_dump() if final is not None and final.usage else None
+                        yield "", usage
+
+            return responses_events()
+
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format={"type": "json_object"} if json_mode else None,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        def chat_events() -> Iterator[tuple[str, Optional[Dict[str, Any]]]]:
+            for chunk in response:
+                usage = chunk.usage.model_dump() if getattr(chunk, "usage", None) else None
+                text = ""
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    text = (choice.delta.content if choice.delta else None) or ""
+                    # Moonshot reports usage on the final choice instead of the chunk.
+                    choice_usage = getattr(choice, "usage", None)
+                    if usage is None and choice_usage:
+                        usage = choice_usage if isinstance(choice_usage, dict) else choice_usage.model_dump()
+                yield text, usage
+
+        return chat_events()
+
     # Context Cost Calculation
     @staticmethod
-    def calculate_context_cost(input_tokens: int = 0, output_tokens: int = 0) -> float:
-        return input_tokens * 0.00000125 + output_tokens * 0.00001
+    def calculate_context_cost(input_tokens: int = 0, output_tokens: int = 0, cached_tokens: int = 0) -> float:
+        """`cached_tokens` is the part of `input_tokens` served from the provider's prompt cache."""
+        cached_tokens = min(cached_tokens, input_tokens)
+        return (
+            (input_tokens - cached_tokens) * 0.00000125
+            + cached_tokens * 0.000000125
+            + output_tokens * 0.00001
+        )
 
     @staticmethod
     def encode_image(image_path: str) -> str:
@@ -169,11 +635,15 @@ class LLMClient:
         return base64.b64encode(data).decode("utf-8")
 
     @staticmethod
-    def build_image_content(image_path: str) -> Dict[str, Any]:
-        b64 = LLMClient.encode_image(image_path)
+    def build_image_content(image_path: str, stats: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        prepared = ImagePreparer.shared().prepare(image_path)
+        if stats is not None:
+            stats["images"] = stats.get("images", 0) + 1
+            stats["bytes"] = stats.get("bytes", 0) + prepared.bytes
+            stats["tokens"] = stats.get("tokens", 0) + prepared.tokens
         return {
             "type": "image_url",
-            "image_url": {"url": f"data:image/png;base64,{b64}"},
+            "image_url": {"url": prepared.url},
         }
 
     @staticmethod
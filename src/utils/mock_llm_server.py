@@ -0,0 +1,424 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from utils.llm_cache import LLMCache
+from utils.tokens import estimate_tokens
+
+
+_STREAM_CHUNK_CHARS = 16
+# Providers only cache prefixes above this size, in steps of `_CACHE_STEP` tokens.
+_CACHE_MIN_TOKENS = 1024
+_CACHE_STEP = 128
+
+
+def synthetic_deck(slide_count: int, title: str = "Synthetic Benchmark Deck") -> str:
+    """A lint-clean Slidev deck with a mix of bullet, two-column and Mermaid slides."""
+    slides = [f"---\ntheme: default\ntitle: {title}\n---\n\n# {title}\n\nBenchmark fixture\n"]
+    for idx in range(2, max(slide_count, 2)):
+        if idx % 5 == 0:
+            slides.append(
+                f"---\n\n# Pipeline {idx}\n\n```mermaid\ngraph LR\n  A[Input {idx}] --> B[Process]\n"
+                "  B --> C[Output]\n```\n"
+            )
+        elif idx % 3 == 0:
+            slides.append(
+                f"---\nlayout: two-cols\n---\n\n# Comparison {idx}\n\n- Baseline latency\n- Baseline cost\n\n"
+                "::right::\n\n- Improved latency\n- Improved cost\n"
+            )
+        else:
+            slides.append(
+                f"---\n\n# Section {idx}\n\n- Key finding {idx}.1 with supporting detail\n"
+                f"- Key finding {idx}.2 with supporting detail\n- Key finding {idx}.3\n"
+            )
+    slides.append("---\nlayout: center\n---\n\n# Thank You\n\nQuestions?\n")
+    return "\n".join(slides)
+
+
+def synthetic_outline(slide_count: int) -> str:
+    lines = ["# Presentation Outline", ""]
+    for idx in range(1, slide_count + 1):
+        lines.append(f"{idx}. Slide {idx}: key points and suggested layout")
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_feedback() -> str:
+    return json.dumps(
+        {
+            "feedback": [
+                {
+                    "page_index": 2,
+                    "severity": "MINOR",
+                    "category": "Typography",
+                    "issue": "Body text could be larger",
+                    "position": "Body text",
+                    "evidence": "Synthetic review",
+                    "suggestion": "Increase the body font size.",
+                }
+            ],
+            "summary": {"overall_quality": "solid", "strengths": [], "next_focus": [], "improvement_trend": "same"},
+        }
+    )
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content or []:
+        if isinstance(part, dict) and part.get("type") in {"text", "input_text", "output_text"}:
+            parts.append(part.get("text", ""))
+    return "\n".join(parts)
+
+
+class MockLLMServer:
+    """OpenAI-compatible stand-in for `chat.completions` and `responses`.
+
+    Responses are replayed from a JSONL recordings file keyed on the request
+    (model, JSON mode and messages, with images hashed). With `upstream_url`
+    set, misses are forwarded to the real API and recorded; otherwise a
+    deterministic synthetic response is generated. `latency_ms` delays the
+    first byte and `tokens_per_second` paces the output. Prompt-prefix caching
+    is simulated so `cached_tokens` shows up in the usage payload.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        recordings: Optional[str] = None,
+        upstream_url: Optional[str] = None,
+        upstream_api_key: Optional[str] = None,
+        latency_ms: float = 0.0,
+        tokens_per_second: float = 0.0,
+        deck_slides: int = 12,
+    ):
+        self.host = host
+        self.port = port
+        self.recordings_path = Path(recordings) if recordings else None
+        self.upstream_url = upstream_url.rstrip("/") if upstream_url else None
+        self.upstream_api_key = upstream_api_key
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.deck_slides = deck_slides
+        self.recordings: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"requests": 0, "replayed": 0, "recorded": 0, "synthetic": 0}
+        self._prefixes: set = set()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._load_recordings()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _load_recordings(self) -> None:
+        if not self.recordings_path or not self.recordings_path.exists():
+            return
+        for line in self.recordings_path.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                self.recordings[entry["key"]] = entry
+
+    def start(self) -> str:
+        """Serve on a background thread and return the base URL."""
+        server = self
+        handler = type("MockLLMHandler", (_Handler,), {"mock": server})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # Request handling -------------------------------------------------
+
+    def complete(self, endpoint: str, body: Dict[str, Any]) -> Tuple[str, Dict[str, int]]:
+        if endpoint == "responses":
+            messages = body.get("input") or []
+            if isinstance(messages, str):
+                messages = [{"role": "user", "content": messages}]
+            json_mode = False
+        else:
+            messages = body.get("messages") or []
+            json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        key = LLMCache.make_key("mock", body.get("model", ""), 0.0, json_mode, None, messages)
+
+        with self._lock:
+            self.stats["requests"] += 1
+            entry = self.recordings.get(key)
+        if entry is not None:
+            content = entry["content"]
+            with self._lock:
+                self.stats["replayed"] += 1
+        elif self.upstream_url:
+            content = self._forward(endpoint, body)
+            self._record(key, endpoint, body.get("model", ""), content)
+        else:
+            content = self._synthesize(messages, json_mode)
+            with self._lock:
+                self.stats["synthetic"] += 1
+
+        prompt_tokens = sum(estimate_tokens(_message_text(message)) for message in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": estimate_tokens(content),
+            "cached_tokens": self._cached_prefix_tokens(messages),
+        }
+        return content, usage
+
+    def _cached_prefix_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        digest = hashlib.sha256()
+        cached = 0
+        running = 0
+        prefixes = []
+        with self._lock:
+            for message in messages:
+                digest.update(json.dumps(message, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+                running += estimate_tokens(_message_text(message))
+                prefix = digest.hexdigest()
+                prefixes.append(prefix)
+                if prefix in self._prefixes:
+                    cached = running
+            self._prefixes.update(prefixes)
+        if cached < _CACHE_MIN_TOKENS:
+            return 0
+        return cached - cached % _CACHE_STEP
+
+    def _forward(self, endpoint: str, body: Dict[str, Any]) -> str:
+        payload = dict(body)
+        payload.pop("stream", None)
+        payload.pop("stream_options", None)
+        response = httpx.post(
+            f"{self.upstream_url}/{'responses' if endpoint == 'responses' else 'chat/completions'}",
+            json=payload,
+            headers={"Authorization": f"Bearer {self.upstream_api_key}"} if self.upstream_api_key else {},
+            timeout=600.0,
+        )
+        response.raise_for_status()
+        data = response.json()
+        if endpoint == "responses":
+            for item in data.get("output", []):
+                for part in item.get("content", []) or []:
+                    if part.get("type") == "output_text":
+                        return part.get("text", "")
+            return ""
+        return data["choices"][0]["message"].get("content") or ""
+
+    def _record(self, key: str, endpoint: str, model: str, content: str) -> None:
+        entry = {"key": key, "endpoint": endpoint, "model": model, "content": content}
+        with self._lock:
+            self.recordings[key] = entry
+            self.stats["recorded"] += 1
+            if self.recordings_path:
+                self.recordings_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.recordings_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _synthesize(self, messages: List[Dict[str, Any]], json_mode: bool) -> str:
+        prompt = _message_text(messages[-1]) if messages else ""
+        if json_mode or "feedback in JSON" in prompt:
+            return synthetic_feedback()
+        if "presentation outline" in prompt:
+            return synthetic_outline(self.deck_slides)
+        if "revise one slide" in prompt:
+            slide = re.search(r"\nSlide (\d+):\n(.*)\Z", prompt, re.DOTALL)
+            return slide.group(2).strip() if slide else "---\n\n# Revised Slide\n"
+        current = prompt.partition("\nCurrent Slides:\n")[2]
+        if current.strip():
+            return current.strip()
+        return synthetic_deck(self.deck_slides)
+
+    def pace(self, content: str) -> Iterator[str]:
+        """Yield `content` in small chunks at the configured tokens/second."""
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        for start in range(0, len(content), _STREAM_CHUNK_CHARS):
+            chunk = content[start : start + _STREAM_CHUNK_CHARS]
+            if self.tokens_per_second:
+                time.sleep(estimate_tokens(chunk) / self.tokens_per_second)
+            yield chunk
+
+
+class _Handler(BaseHTTPRequestHandler):
+    mock: MockLLMServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") in {"/health", "/v1/models"}:
+            self._send_json(200, {"object": "list", "data": [], "stats": self.mock.stats})
+            return
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            endpoint = "chat"
+        elif path.endswith("/responses"):
+            endpoint = "responses"
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        try:
+            content, usage = self.mock.complete(endpoint, body)
+        except httpx.HTTPError as err:
+            self._send_json(502, {"error": {"message": f"Upstream request failed: {err}"}})
+            return
+        model = body.get("model", "mock")
+        if body.get("stream"):
+            self._stream(endpoint, model, content, usage, body)
+        else:
+            if self.mock.latency_ms:
+                time.sleep(self.mock.latency_ms / 1000)
+            if self.mock.tokens_per_second:
+                time.sleep(usage["completion_tokens"] / self.mock.tokens_per_second)
+            self._send_json(200, _chat_payload(model, content, usage) if endpoint == "chat" else _responses_payload(model, content, usage))
+
+    def _write_event(self, data: Dict[str, Any], event: Optional[str] = None) -> None:
+        text = (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+        encoded = text.encode("utf-8")
+        self.wfile.write(f"{len(encoded):x}\r\n".encode("ascii") + encoded + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, endpoint: str, model: str, content: str, usage: Dict[str, int], body: Dict[str, Any]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        response_id = f"mock-{uuid.uuid4().hex[:12]}"
+        if endpoint == "chat":
+            for chunk in self.mock.pace(content):
+                self._write_event(
+                    {
+                        "id": response_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}],
+                    }
+                )
+            self._write_event(
+                {
+                    "id": response_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                }
+            )
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._write_event(
+                    {
+                        "id": response_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [],
+                        "usage": _chat_usage(usage),
+                    }
+                )
+            encoded = b"data: [DONE]\n\n"
+        else:
+            for chunk in self.mock.pace(content):
+                self._write_event(
+                    {"type": "response.output_text.delta", "item_id": "msg_mock", "output_index": 0, "content_index": 0, "delta": chunk},
+                    event="response.output_text.delta",
+                )
+            self._write_event(
+                {"type": "response.completed", "response": _responses_payload(model, content, usage)},
+                event="response.completed",
+            )
+            encoded = b""
+        if encoded:
+            self.wfile.write(f"{len(encoded):x}\r\n".encode("ascii") + encoded + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def _chat_usage(usage: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+        "prompt_tokens_details": {"cached_tokens": usage["cached_tokens"]},
+    }
+
+
+def _chat_payload(model: str, content: str, usage: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "id": f"mock-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": _chat_usage(usage),
+    }
+
+
+def _responses_payload(model: str, content: str, usage: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "id": f"resp_mock{uuid.uuid4().hex[:12]}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "output": [
+            {
+                "type": "message",
+                "id": "msg_mock",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": content, "annotations": []}],
+            }
+        ],
+        "usage": {
+            "input_tokens": usage["prompt_tokens"],
+            "output_tokens": usage["completion_tokens"],
+            "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+            "input_tokens_details": {"cached_tokens": usage["cached_tokens"]},
+            "output_tokens_details": {"reasoning_tokens": 0},
+        },
+    }
@@ -0,0 +1,149 @@
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from utils.tracing import Span
+
+
+PROFILE_MODES = {"cpu", "mem"}
+# Top-level pipeline spans that are profiled. They never nest inside each
+# other, which matters because only one cProfile profiler can be active.
+PROFILED_STAGES = ("outline", "editor", "lint", "render", "review", "archive")
+# Allocations made by the profiler itself and by module imports are noise.
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def parse_profile_modes(value: str) -> Set[str]:
+    modes = {item.strip().lower() for item in (value or "").split(",") if item.strip()}
+    unknown = modes - PROFILE_MODES
+    if unknown:
+        raise ValueError(f"Unknown profile mode(s): {', '.join(sorted(unknown))}. Use cpu, mem or cpu,mem")
+    return modes
+
+
+@dataclass
+class _MemoryStage:
+    runs: int = 0
+    peak_bytes: int = 0
+    net_bytes: int = 0
+    # Largest allocation growth seen in one run of the stage, as "file:line size".
+    top: List[str] = field(default_factory=list)
+
+
+class StageProfiler:
+    """Profiles pipeline stages with cProfile ("cpu") and tracemalloc ("mem").
+
+    Registered as a tracer listener: a stage is profiled while its span is
+    open. CPU profiles accumulate per stage and are written as
+    `profile_<stamp>_<stage>.pstats`; memory profiling records each stage's
+    peak and the allocations it added, written to `memory_<stamp>_<stage>.txt`.
+    """
+
+    def __init__(self, modes: Set[str], logs_dir: str, run_stamp: str, top: int = 15):
+        self.modes = modes
+        self.logs_dir = logs_dir
+        self.run_stamp = run_stamp
+        self.top = top
+        self.cpu: Dict[str, cProfile.Profile] = {}
+        self.memory: Dict[str, _MemoryStage] = {}
+        self.files: List[str] = []
+        self._active: Dict[int, Optional[tracemalloc.Snapshot]] = {}
+        self._started_tracemalloc = False
+        if "mem" in modes and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._started_tracemalloc = True
+
+    def on_start(self, span: Span) -> None:
+        if span.name not in PROFILED_STAGES:
+            return
+        snapshot = None
+        if "mem" in self.modes:
+            tracemalloc.reset_peak()
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        self._active[span.span_id] = snapshot
+        if "cpu" in self.modes:
+            self.cpu.setdefault(span.name, cProfile.Profile()).enable()
+
+    def on_end(self, span: Span) -> None:
+        if span.span_id not in self._active:
+            return
+        before = self._active.pop(span.span_id)
+        if "cpu" in self.modes:
+            self.cpu[span.name].disable()
+        if before is not None:
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            growth = sorted(after.compare_to(before, "lineno"), key=lambda stat: stat.size_diff, reverse=True)
+            stage = self.memory.setdefault(span.name, _MemoryStage())
+            stage.runs += 1
+            stage.net_bytes += sum(stat.size_diff for stat in growth)
+            if peak >= stage.peak_bytes:
+                stage.peak_bytes = peak
+                stage.top = [
+                    f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} {stat.size_diff / 1024:+.1f} KiB "
+                    f"({stat.count_diff:+d} blocks)"
+                    for stat in growth[: self.top]
+                ]
+
+    def finish(self) -> List[str]:
+        """Write the profile files and stop tracemalloc if this profiler started it."""
+        for stage, profile in self.cpu.items():
+            path = os.path.join(self.logs_dir, f"profile_{self.run_stamp}_{stage}.pstats")
+            profile.dump_stats(path)
+            self.files.append(path)
+        for stage, memory in self.memory.items():
+            path = os.path.join(self.logs_dir, f"memory_{self.run_stamp}_{stage}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"Stage: {stage} ({memory.runs} run(s))\n")
+                f.write(f"Peak traced memory: {memory.peak_bytes / 1024 / 1024:.1f} MiB\n")
+                f.write(f"Net allocations retained: {memory.net_bytes / 1024 / 1024:+.1f} MiB\n\n")
+                f.write("Top allocations in the peak run:\n")
+                f.write("\n".join(memory.top) + "\n")
+            self.files.append(path)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return self.files
+
+    def _top_functions(self, profile: cProfile.Profile, limit: int = 3) -> List[str]:
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        entries = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        names = []
+        for (filename, lineno, function), _ in entries[:limit]:
+            location = f"{os.path.basename(filename)}:{lineno}" if lineno else "builtin"
+            names.append(f"{function} ({location})")
+        return names
+
+    def report_lines(self) -> List[str]:
+        lines = ["## Profile", ""]
+        if self.cpu:
+            lines.append("| Stage | CPU time (s) | Calls | Top functions (self time) |")
+            lines.append("| --- | --- | --- | --- |")
+            for stage, profile in self.cpu.items():
+                stats = pstats.Stats(profile, stream=io.StringIO())
+                lines.append(
+                    f"| {stage} | {stats.total_tt:.2f} | {stats.total_calls} | {'; '.join(self._top_functions(profile))} |"
+                )
+            lines.append("")
+        if self.memory:
+            lines.append("| Stage | Peak (MiB) | Retained (MiB) | Largest allocation site |")
+            lines.append("| --- | --- | --- | --- |")
+            for stage, memory in self.memory.items():
+                largest = memory.top[0] if memory.top else "-"
+                lines.append(
+                    f"| {stage} | {memory.peak_bytes / 1024 / 1024:.1f} | {memory.net_bytes / 1024 / 1024:+.1f} | {largest} |"
+                )
+            lines.append("")
+        if self.files:
+            lines.append(f"- Profile files: {', '.join(os.path.basename(path) for path in self.files)}")
+            lines.append("")
+        return lines
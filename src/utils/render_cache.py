@@ -0,0 +1,89 @@
+import hashlib
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from utils.slides import Slide
+
+
+@dataclass
+class SlideImageCache:
+    """Content-addressed PNG cache for individual rendered slides.
+
+    Entries are evicted least-recently-used first once the cache grows past
+    `max_bytes`; a hit refreshes the file's mtime.
+    """
+
+    root: str
+    max_bytes: int = 512 * 1024 * 1024
+
+    @classmethod
+    def from_env(cls, work_dir: str) -> Optional["SlideImageCache"]:
+        if os.getenv("SLIDE_CACHE", "1").strip().lower() in {"0", "false", "no", "off"}:
+            return None
+        root = os.getenv("SLIDE_CACHE_DIR") or os.path.join(work_dir, ".cache", "slide_png")
+        max_mb = int(os.getenv("SLIDE_CACHE_MAX_MB", "512"))
+        return cls(root=root, max_bytes=max_mb * 1024 * 1024)
+
+    @staticmethod
+    def slide_key(headmatter: str, slide: Slide, total: int) -> str:
+        digest = hashlib.sha256()
+        digest.update(headmatter.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(slide.raw.encode("utf-8"))
+        # Slides that print navigation state depend on their position in the deck.
+        if "$nav" in slide.raw or "$slidev" in slide.raw:
+            digest.update(f"\0{slide.index}/{total}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return Path(self.root) / key[:2] / f"{key}.png"
+
+    def fetch(self, key: str, dest: str) -> bool:
+        """Copy the cached image for `key` to `dest`; False on a miss.
+
+        The copy is taken at lookup time, so an `evict` from another runner
+        sharing the cache cannot delete the file before it is used.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+            shutil.copyfile(path, dest)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key: str, image_path: str) -> str:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Runners sharing the cache may store the same slide at the same time.
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        shutil.copyfile(image_path, tmp_path)
+        os.replace(tmp_path, path)
+        return str(path)
+
+    def evict(self) -> None:
+        entries: List[os.stat_result] = []
+        paths: List[Path] = []
+        total = 0
+        for path in Path(self.root).glob("*/*.png"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append(stat)
+            paths.append(path)
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for stat, path in sorted(zip(entries, paths), key=lambda item: item[0].st_mtime):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= stat.st_size
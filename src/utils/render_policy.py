@@ -0,0 +1,191 @@
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.repair import classify_render_error
+from utils.slides import Slide
+
+
+_MERMAID_RE = re.compile(r"^\s*(`{3,}|~{3,})\s*mermaid\b", re.MULTILINE)
+_MATH_BLOCK_RE = re.compile(r"\$\$[\s\S]+?\$\$")
+_INLINE_MATH_RE = re.compile(r"(?<![\\$])\$(?!\s)[^$\n]+?(?<!\s)\$(?!\$)")
+_FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})", re.MULTILINE)
+# Playwright errors name the page URL (`/3?print`); the render server prefixes `slide 3:`.
+_FAILED_SLIDE_RES = (re.compile(r"\bslide (\d+):"), re.compile(r"/(\d+)\?print"))
+
+# Render cost of one element relative to a plain slide.
+MERMAID_WEIGHT = 4.0
+MATH_WEIGHT = 1.0
+CODE_WEIGHT = 0.5
+
+
+@dataclass
+class DeckFeatures:
+    slides: int = 0
+    mermaid: int = 0
+    math: int = 0
+    code: int = 0
+    # Weighted cost of the deck and of its heaviest slide (see `units`).
+    units: float = 0.0
+    max_slide_units: float = 0.0
+
+
+def slide_units(raw: str) -> tuple:
+    mermaid = len(_MERMAID_RE.findall(raw))
+    math = len(_MATH_BLOCK_RE.findall(raw)) + len(_INLINE_MATH_RE.findall(_MATH_BLOCK_RE.sub("", raw)))
+    code = max(0, len(_FENCE_RE.findall(raw)) // 2 - mermaid)
+    return mermaid, math, code, 1.0 + MERMAID_WEIGHT * mermaid + MATH_WEIGHT * math + CODE_WEIGHT * code
+
+
+def deck_features(slides: List[Slide], pages: Optional[List[int]] = None) -> DeckFeatures:
+    """Features of the slides that will be rendered (all of them, or `pages`)."""
+    selected = [slide for slide in slides if pages is None or slide.index in pages]
+    features = DeckFeatures(slides=len(selected) if selected else len(pages or []))
+    for slide in selected:
+        mermaid, math, code, units = slide_units(slide.raw)
+        features.mermaid += mermaid
+        features.math += math
+        features.code += code
+        features.units += units
+        features.max_slide_units = max(features.max_slide_units, units)
+    if not selected:
+        # Slidev's numbering disagrees with ours; assume plain slides.
+        features.units = float(features.slides)
+        features.max_slide_units = 1.0
+    return features
+
+
+def failed_slides(error: str) -> List[int]:
+    found = set()
+    for pattern in _FAILED_SLIDE_RES:
+        found.update(int(match) for match in pattern.findall(error or ""))
+    return sorted(found)
+
+
+@dataclass
+class RenderBudget:
+    # Per-page timeout and settle time passed to Slidev / the render server.
+    timeout_ms: int
+    wait_ms: int
+    per_slide: bool
+    # Wall-clock limit for one CLI export, startup included.
+    deadline_seconds: float
+    expected_seconds: float
+
+
+class RenderPolicy:
+    """Render timeouts and waits from deck features and recorded render durations.
+
+    Every export records its duration per weighted slide unit (a Mermaid
+    diagram counts as several plain slides), per backend. Budgets use the
+    p90 of recent samples, so small decks fail fast and heavy decks get the
+    time they historically needed on the first attempt. Timed-out attempts
+    are recorded with the time they were given, which raises later budgets.
+    """
+
+    DEFAULT_SECONDS_PER_UNIT = 2.0
+    DEFAULT_STARTUP_SECONDS = {"cli": 15.0, "server": 0.5}
+    MIN_SAMPLES = 3
+    MAX_SAMPLES = 200
+
+    def __init__(self, history_path: Optional[str] = None, max_attempts: int = 2):
+        self.history_path = history_path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.samples: List[Dict] = []
+        if history_path and os.path.exists(history_path):
+            try:
+                with open(history_path, "r", encoding="utf-8") as f:
+                    self.samples = json.load(f).get("samples", [])
+            except (json.JSONDecodeError, OSError):
+                self.samples = []
+
+    @classmethod
+    def from_env(cls, work_dir: str) -> "RenderPolicy":
+        path = os.getenv("RENDER_HISTORY_PATH") or os.path.join(work_dir, ".cache", "render_history.json")
+        if os.getenv("RENDER_HISTORY", "1").strip().lower() in {"0", "false", "no", "off"}:
+            # Budgets still learn within this runner, but nothing is read from or written to disk.
+            path = None
+        return cls(history_path=path, max_attempts=max(1, int(os.getenv("RENDER_MAX_ATTEMPTS", "2"))))
+
+    def seconds_per_unit(self, backend: str) -> float:
+        startup = self.DEFAULT_STARTUP_SECONDS.get(backend, 0.0)
+        with self._lock:
+            rates = sorted(
+                max(0.05, (sample["seconds"] - startup) / sample["units"])
+                for sample in self.samples
+                if sample.get("backend") == backend and sample.get("units")
+            )
+        if len(rates) < self.MIN_SAMPLES:
+            return self.DEFAULT_SECONDS_PER_UNIT
+        return rates[min(len(rates) - 1, round(0.9 * (len(rates) - 1)))]
+
+    def timeout_rate(self, backend: str) -> float:
+        with self._lock:
+            recent = [sample for sample in self.samples if sample.get("backend") == backend][-20:]
+        return sum(1 for sample in recent if sample.get("timed_out")) / len(recent) if recent else 0.0
+
+    def budget(self, features: DeckFeatures, backend: str = "cli") -> RenderBudget:
+        rate = self.seconds_per_unit(backend)
+        startup = self.DEFAULT_STARTUP_SECONDS.get(backend, 0.0)
+        expected = startup + rate * features.units
+        wait_ms = 500 + (1500 if features.mermaid else 0) + (500 if features.math else 0)
+        return RenderBudget(
+            timeout_ms=int(min(300_000, max(15_000, (rate * features.max_slide_units * 4 + 10) * 1000))),
+            wait_ms=min(8000, wait_ms),
+            # Mermaid-heavy decks, or a backend that keeps timing out, go slide by slide from the start.
+            per_slide=features.mermaid >= 4 or self.timeout_rate(backend) > 0.3,
+            deadline_seconds=max(60.0, expected * 3 + 30),
+            expected_seconds=expected,
+        )
+
+    @staticmethod
+    def escalate(budget: RenderBudget) -> RenderBudget:
+        """Budget for retrying the slides that timed out."""
+        return replace(
+            budget,
+            timeout_ms=min(600_000, budget.timeout_ms * 2),
+            wait_ms=min(8000, budget.wait_ms * 2),
+            per_slide=True,
+            deadline_seconds=budget.deadline_seconds * 2,
+        )
+
+    def record(self, features: DeckFeatures, seconds: float, backend: str, timed_out: bool = False) -> None:
+        sample = {
+            "backend": backend,
+            "units": features.units,
+            "slides": features.slides,
+            "mermaid": features.mermaid,
+            "math": features.math,
+            "seconds": round(seconds, 3),
+            "timed_out": timed_out,
+            "at": time.time(),
+        }
+        with self._lock:
+            self.samples = (self.samples + [sample])[-self.MAX_SAMPLES :]
+            samples = list(self.samples)
+        if not self.history_path:
+            return
+        path = Path(self.history_path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"samples": samples}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+def classify_failure(error: str) -> Dict:
+    """Structured render failure: `kind` (see `classify_render_error`) and the slides it names."""
+    return {"kind": classify_render_error(error), "slides": failed_slides(error)}
+
+
+def budget_attributes(budget: RenderBudget) -> Dict:
+    return {key: value for key, value in asdict(budget).items() if key != "expected_seconds"}
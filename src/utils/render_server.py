@@ -0,0 +1,187 @@
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+class RenderServerError(RuntimeError):
+    def __init__(self, message: str, failures: Optional[List[Dict[str, Any]]] = None):
+        super().__init__(message)
+        # Per-slide failures reported by the server: [{"slide": 3, "error": "..."}].
+        self.failures = failures or []
+
+
+# One lock per state dir, so concurrent callers in this process start its server once.
+_START_LOCKS: Dict[str, threading.Lock] = {}
+_START_LOCKS_GUARD = threading.Lock()
+
+
+def _start_lock(state_root: Path) -> threading.Lock:
+    with _START_LOCKS_GUARD:
+        return _START_LOCKS.setdefault(str(state_root.resolve()), threading.Lock())
+
+
+def _find_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@dataclass
+class RenderServer:
+    """Client for the long-lived `scripts/render_server.mjs` process.
+
+    The node process is started detached and its port is recorded in
+    `<state_dir>/server.json`, so later iterations and later runs attach to
+    the same warm Vite server and browser instead of spawning a new one.
+    Decks are served from an entry file in their own directory, so relative
+    assets resolve as they do for the CLI export.
+    """
+
+    work_dir: str
+    state_dir: str = ".slidev-render"
+    startup_timeout: float = 180.0
+
+    @property
+    def _state_root(self) -> Path:
+        return Path(self.work_dir) / self.state_dir
+
+    @property
+    def _state_file(self) -> Path:
+        return self._state_root / "server.json"
+
+    def _read_state(self) -> Optional[Dict[str, Any]]:
+        if not self._state_file.exists():
+            return None
+        try:
+            return json.loads(self._state_file.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            return None
+
+    def _request(
+        self, port: int, method: str, route: str, payload: Optional[dict] = None, timeout: float = 5.0
+    ) -> Dict[str, Any]:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        req = urllib.request.Request(
+            f"http://127.0.0.1:{port}{route}",
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                return json.loads(resp.read().decode("utf-8") or "{}")
+        except urllib.error.HTTPError as err:
+            body = err.read().decode("utf-8", errors="replace")
+            try:
+                parsed = json.loads(body)
+                message, failures = parsed.get("error", body), parsed.get("failures", [])
+            except json.JSONDecodeError:
+                message, failures = body, []
+            raise RenderServerError(message, failures=failures) from err
+
+    def _healthy_port(self) -> Optional[int]:
+        state = self._read_state()
+        if not state:
+            return None
+        port = state.get("controlPort")
+        if not port:
+            return None
+        try:
+            health = self._request(port, "GET", "/health", timeout=2.0)
+        except (OSError, RenderServerError):
+            return None
+        return port if health.get("ok") else None
+
+    def is_running(self) -> bool:
+        return self._healthy_port() is not None
+
+    def ensure_running(self) -> int:
+        port = self._healthy_port()
+        if port:
+            return port
+        with _start_lock(self._state_root):
+            # Another thread may have started it while this one waited for the lock.
+            return self._healthy_port() or self._start()
+
+    def _start(self) -> int:
+        self._state_root.mkdir(parents=True, exist_ok=True)
+        self._state_file.unlink(missing_ok=True)
+        control_port = _find_free_port()
+        script = Path(self.work_dir) / "scripts" / "render_server.mjs"
+        env = os.environ.copy()
+        env.setdefault("PLAYWRIGHT_DISABLE_SANDBOX", "1")
+        env.setdefault("PLAYWRIGHT_SKIP_VALIDATE_HOST_REQUIREMENTS", "1")
+        log_file = open(self._state_root / "server.log", "a", encoding="utf-8")
+        popen_kwargs: Dict[str, Any] = {}
+        if os.name == "nt":
+            popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            popen_kwargs["start_new_session"] = True
+        subprocess.Popen(
+            [
+                "node",
+                str(script),
+                "--control-port",
+                str(control_port),
+                "--entry",
+                str(self._state_root / "slides.md"),
+                "--state-file",
+                str(self._state_file),
+            ],
+            cwd=self.work_dir,
+            env=env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            **popen_kwargs,
+        )
+        log_file.close()
+
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            port = self._healthy_port()
+            if port:
+                return port
+            time.sleep(0.5)
+        raise RenderServerError(
+            f"Render server did not start within {self.startup_timeout:.0f}s; "
+            f"see {self._state_root / 'server.log'}"
+        )
+
+    def render(
+        self,
+        md_file_path: str,
+        output_dir: str,
+        timeout_ms: int = 60000,
+        wait_ms: int = 500,
+        slide_range: Optional[List[int]] = None,
+        concurrency: int = 1,
+    ) -> List[str]:
+        port = self.ensure_running()
+        payload = {
+            "markdown_path": str(Path(md_file_path).resolve()),
+            "output_dir": str(Path(output_dir).resolve()),
+            "timeout": timeout_ms,
+            "wait": wait_ms,
+            "concurrency": concurrency,
+        }
+        if slide_range:
+            payload["range"] = slide_range
+        result = self._request(port, "POST", "/render", payload, timeout=None)
+        return [path for path in result.get("files", []) if path]
+
+    def shutdown(self) -> None:
+        port = self._healthy_port()
+        if not port:
+            return
+        try:
+            self._request(port, "POST", "/shutdown", payload={})
+        except (OSError, RenderServerError):
+            pass
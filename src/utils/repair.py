@@ -0,0 +1,274 @@
+import bisect
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.linter import LintIssue, lint_slides
+from utils.slides import Slide, split_slides
+
+
+_SEPARATOR_RE = re.compile(r"^---\s*$")
+_FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})")
+_FRONTMATTER_KEY_RE = re.compile(r"^[\w$.-]+\s*:")
+_TAG_RE = re.compile(r"<(/?)([A-Za-z][\w.-]*)(?:\s[^<>]*?)?(/?)>")
+_INLINE_CODE_RE = re.compile(r"`[^`\n]*`")
+_TOP_DOWN_RE = re.compile(r"^(\s*(?:graph|flowchart))\s+(TD|TB)\b")
+_OVERFLOW_WORDS = ("overflow", "out of bounds", "cut off", "clipped", "too wide", "too tall", "exceeds", "fragmented")
+
+
+@dataclass
+class RepairResult:
+    markdown: str
+    applied: List[str] = field(default_factory=list)
+    error_class: str = "unknown"
+    remaining_feedback: List[Dict] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.applied)
+
+
+def classify_render_error(render_error: str) -> str:
+    text = render_error or ""
+    lowered = text.lower()
+    if "lint errors" in lowered:
+        return "lint"
+    if "yaml" in lowered or "frontmatter" in lowered or "bad indentation" in lowered:
+        return "frontmatter"
+    if "missing end tag" in lowered or "invalid end tag" in lowered or "element is missing" in lowered:
+        return "html"
+    if "mermaid" in lowered or "parse error on line" in lowered:
+        return "mermaid"
+    if "katex" in lowered:
+        return "math"
+    if "timeout" in lowered or "locator.waitfor" in lowered:
+        return "timeout"
+    if "cannot find module" in lowered or "failed to resolve import" in lowered:
+        return "dependency"
+    return "unknown"
+
+
+def auto_repair(markdown: str, issues: Optional[List[LintIssue]] = None, render_error: str = "") -> RepairResult:
+    """Apply mechanical fixes for known lint rules and render error classes.
+
+    Fixes are applied one at a time and the deck is re-linted after each, so
+    line numbers stay valid and follow-on diagnostics disappear.
+    """
+    result = RepairResult(markdown=markdown, error_class=classify_render_error(render_error))
+    if result.error_class in {"timeout", "dependency"}:
+        return result
+    issues = lint_slides(markdown) if issues is None else issues
+    current = markdown
+    seen = set()
+    for _ in range(50):
+        candidates = [issue for issue in issues if issue.rule in _FIXES and (issue.rule, issue.line) not in seen]
+        if not candidates:
+            break
+        # Structural problems first (they cause the others), then bottom of the deck first.
+        issue = min(candidates, key=lambda item: (_FIX_ORDER.index(item.rule), -item.line))
+        seen.add((issue.rule, issue.line))
+        repaired = _FIXES[issue.rule](current, issue)
+        if repaired is None or repaired == current:
+            continue
+        current = repaired
+        result.applied.append(issue.rule)
+        issues = lint_slides(current)
+        seen = set()
+    result.markdown = current
+    return result
+
+
+def repair_feedback(markdown: str, feedback: List[Dict]) -> RepairResult:
+    """Resolve critic feedback that has a deterministic fix (currently: overflowing top-down Mermaid)."""
+    slides = split_slides(markdown)
+    lines = markdown.split("\n")
+    result = RepairResult(markdown=markdown, error_class="feedback")
+    for item in feedback:
+        page = item.get("page_index")
+        text = " ".join(str(item.get(key, "")) for key in ("issue", "evidence", "suggestion", "category")).lower()
+        is_overflow = "mermaid" in text or "diagram" in text or "flowchart" in text
+        is_overflow = is_overflow and any(word in text for word in _OVERFLOW_WORDS)
+        slide = slides[page - 1] if isinstance(page, int) and 1 <= page <= len(slides) else None
+        if slide is None or not is_overflow or not _flip_mermaid_direction(lines, slide):
+            result.remaining_feedback.append(item)
+            continue
+        result.applied.append("mermaid-direction")
+    result.markdown = "\n".join(lines)
+    return result
+
+
+def _flip_mermaid_direction(lines: List[str], slide: Slide) -> bool:
+    changed = False
+    in_mermaid = False
+    for idx in range(slide.content_line - 1, slide.end_line):
+        line = lines[idx]
+        if _FENCE_RE.match(line):
+            in_mermaid = not in_mermaid and "mermaid" in line
+            continue
+        if in_mermaid:
+            flipped = _TOP_DOWN_RE.sub(r"\1 LR", line)
+            if flipped != line:
+                lines[idx] = flipped
+                changed = True
+    return changed
+
+
+def _slide_for(markdown: str, issue: LintIssue) -> Optional[Slide]:
+    slides = split_slides(markdown)
+    if 1 <= issue.slide <= len(slides):
+        return slides[issue.slide - 1]
+    return None
+
+
+def _fix_frontmatter_blank_line(markdown: str, issue: LintIssue) -> Optional[str]:
+    lines = markdown.split("\n")
+    key_idx = issue.line - 1
+    start = key_idx - 1
+    while start >= 0 and not lines[start].strip():
+        start -= 1
+    if start < 0 or not _SEPARATOR_RE.match(lines[start]):
+        return None
+    end = key_idx
+    while end + 1 < len(lines) and _FRONTMATTER_KEY_RE.match(lines[end + 1]):
+        end += 1
+    after = end + 1
+    while after < len(lines) and not lines[after].strip():
+        after += 1
+    keys = lines[key_idx : end + 1]
+    if after < len(lines) and _SEPARATOR_RE.match(lines[after]):
+        tail = lines[after + 1 :]
+    else:
+        tail = [""] + lines[after:]
+    return "\n".join(lines[: start + 1] + keys + ["---"] + tail)
+
+
+def _fix_empty_slide(markdown: str, issue: LintIssue) -> Optional[str]:
+    slides = split_slides(markdown)
+    if len(slides) < 2 or not 1 <= issue.slide <= len(slides):
+        return None
+    slide = slides[issue.slide - 1]
+    if slide.frontmatter or slide.content.strip() or not _SEPARATOR_RE.match(slide.raw.split("\n")[0]):
+        return None
+    return "\n".join(item.raw for item in slides if item.index != slide.index)
+
+
+def _fix_unclosed_fence(markdown: str, issue: LintIssue) -> Optional[str]:
+    lines = markdown.split("\n")
+    open_idx = issue.line - 1
+    match = _FENCE_RE.match(lines[open_idx]) if 0 <= open_idx < len(lines) else None
+    if not match:
+        return None
+    marker = match.group(1)
+    for idx in range(open_idx + 1, len(lines)):
+        next_line = lines[idx + 1] if idx + 1 < len(lines) else ""
+        if _SEPARATOR_RE.match(lines[idx]) and (not next_line.strip() or _FRONTMATTER_KEY_RE.match(next_line)):
+            insert_at = idx
+            while insert_at - 1 > open_idx and not lines[insert_at - 1].strip():
+                insert_at -= 1
+            return "\n".join(lines[:insert_at] + [marker] + lines[insert_at:])
+    trailing = len(lines)
+    while trailing - 1 > open_idx and not lines[trailing - 1].strip():
+        trailing -= 1
+    return "\n".join(lines[:trailing] + [marker] + lines[trailing:])
+
+
+def _fix_unbalanced_html(markdown: str, issue: LintIssue) -> Optional[str]:
+    lines = markdown.split("\n")
+    slide = _slide_for(markdown, issue)
+    if slide is None:
+        return None
+    never_closed = re.search(r"`<([\w.-]+)>` is never closed", issue.message)
+    if never_closed:
+        name = never_closed.group(1)
+        tags = _slide_tags(lines, slide, name)
+        if sum(1 for closing, _ in tags if not closing) <= sum(1 for closing, _ in tags if closing):
+            return None
+        insert_at = slide.end_line
+        while insert_at - 1 >= slide.content_line and not lines[insert_at - 1].strip():
+            insert_at -= 1
+        return "\n".join(lines[:insert_at] + [f"</{name}>"] + lines[insert_at:])
+    stray_close = re.search(r"Closing `</([\w.-]+)>`", issue.message)
+    if stray_close:
+        name = stray_close.group(1)
+        idx = issue.line - 1
+        tags = _slide_tags(lines, slide, name)
+        # A closing tag with an opening tag earlier in the slide is not stray, whatever the linter says.
+        if (True, idx) not in tags or any(not closing and line_idx <= idx for closing, line_idx in tags):
+            return None
+        lines[idx] = lines[idx].replace(f"</{name}>", "", 1)
+        if not lines[idx].strip():
+            del lines[idx]
+        return "\n".join(lines)
+    return None
+
+
+def _slide_tags(lines: List[str], slide: Slide, name: str) -> List[Tuple[bool, int]]:
+    """(is_closing, line index) of every `name` tag in the slide's prose, including tags split across lines."""
+    prose: List[Tuple[int, str]] = []
+    fence = None
+    for idx in range(slide.content_line - 1, min(slide.end_line, len(lines))):
+        match = _FENCE_RE.match(lines[idx])
+        if fence is None and match:
+            fence = match.group(1)
+        elif fence is not None and lines[idx].strip() == fence:
+            fence = None
+        elif fence is None:
+            prose.append((idx, _INLINE_CODE_RE.sub("", lines[idx])))
+    text = "\n".join(line for _, line in prose)
+    starts = [0]
+    for _, line in prose[:-1]:
+        starts.append(starts[-1] + len(line) + 1)
+    tags: List[Tuple[bool, int]] = []
+    for match in _TAG_RE.finditer(text):
+        closing, tag, self_closing = match.groups()
+        if tag == name and not self_closing:
+            tags.append((bool(closing), prose[bisect.bisect_right(starts, match.start()) - 1][0]))
+    return tags
+
+
+def _fix_stray_slot(markdown: str, issue: LintIssue) -> Optional[str]:
+    slide = _slide_for(markdown, issue)
+    if slide is None:
+        return None
+    lines = markdown.split("\n")
+    if slide.layout:
+        del lines[issue.line - 1]
+        return "\n".join(lines)
+    if slide.frontmatter:
+        fm_idx = slide.start_line
+        return "\n".join(lines[:fm_idx] + ["layout: two-cols"] + lines[fm_idx:])
+    first = lines[slide.start_line - 1]
+    if slide.index == 1 or not _SEPARATOR_RE.match(first):
+        return None
+    body = lines[slide.start_line :]
+    while body and not body[0].strip():
+        body = body[1:]
+    return "\n".join(lines[: slide.start_line] + ["layout: two-cols", "---", ""] + body)
+
+
+def _fix_frontmatter_invalid(markdown: str, issue: LintIssue) -> Optional[str]:
+    slide = _slide_for(markdown, issue)
+    if slide is None or issue.line != slide.start_line + 1:
+        # Only the "content right after ---" shape is mechanical.
+        return None
+    lines = markdown.split("\n")
+    return "\n".join(lines[: slide.start_line] + [""] + lines[slide.start_line :])
+
+
+_FIXES: Dict[str, Callable[[str, LintIssue], Optional[str]]] = {
+    "frontmatter-blank-line": _fix_frontmatter_blank_line,
+    "empty-slide": _fix_empty_slide,
+    "unclosed-code-fence": _fix_unclosed_fence,
+    "unbalanced-html": _fix_unbalanced_html,
+    "stray-slot": _fix_stray_slot,
+    "frontmatter-invalid": _fix_frontmatter_invalid,
+}
+
+_FIX_ORDER = [
+    "frontmatter-invalid",
+    "unclosed-code-fence",
+    "frontmatter-blank-line",
+    "empty-slide",
+    "unbalanced-html",
+    "stray-slot",
+]
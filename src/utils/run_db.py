@@ -0,0 +1,396 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.benchmark import percentiles
+from utils.llm_client import LLMClient
+from utils.tracing import Span
+
+
+# One database for every run of this checkout, wherever its outputs go (batch, service, ...).
+_DEFAULT_DB_PATH = Path(__file__).resolve().parents[2] / "outputs" / "runs.sqlite3"
+
+RUNNING = "running"
+DONE = "done"
+STOPPED = "stopped"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    editor_model TEXT,
+    critic_model TEXT,
+    iterations INTEGER NOT NULL DEFAULT 0,
+    approved INTEGER NOT NULL DEFAULT 0,
+    slides INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at);
+CREATE TABLE IF NOT EXISTS iterations (
+    run_id TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    finished_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    slides INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    render_error TEXT,
+    approved INTEGER NOT NULL DEFAULT 0,
+    review_summary TEXT,
+    metrics TEXT NOT NULL,
+    PRIMARY KEY (run_id, iteration)
+);
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    iteration INTEGER,
+    stage TEXT,
+    provider TEXT,
+    model TEXT,
+    api TEXT,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    attempt INTEGER NOT NULL DEFAULT 1,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_calls_run ON llm_calls (run_id, iteration);
+CREATE INDEX IF NOT EXISTS llm_calls_model ON llm_calls (model, started_at);
+CREATE TABLE IF NOT EXISTS renders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    iteration INTEGER,
+    attempt INTEGER NOT NULL DEFAULT 1,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    slides INTEGER NOT NULL DEFAULT 0,
+    rendered INTEGER NOT NULL DEFAULT 0,
+    cached INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS renders_run ON renders (run_id, iteration);
+CREATE INDEX IF NOT EXISTS renders_started ON renders (started_at);
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    page_index INTEGER,
+    severity TEXT,
+    category TEXT,
+    issue TEXT,
+    suggestion TEXT,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS feedback_run ON feedback (run_id, iteration);
+CREATE INDEX IF NOT EXISTS feedback_severity ON feedback (severity, category);
+"""
+
+
+class RunDB:
+    """Runs, iterations, LLM calls, renders and feedback of every run in one SQLite file.
+
+    Several processes (batch jobs, the service) may write to the same file;
+    WAL mode lets readers such as the `stats` command run alongside them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def default_path() -> str:
+        return os.getenv("RUN_DB_PATH") or str(_DEFAULT_DB_PATH)
+
+    @classmethod
+    def from_env(cls) -> "RunDB":
+        path = cls.default_path()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return cls(path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # Writes ------------------------------------------------------------------
+
+    def start_run(
+        self,
+        run_id: str,
+        input_path: str,
+        output_dir: str,
+        mode: str,
+        editor_model: str,
+        critic_model: Optional[str],
+    ) -> None:
+        """Register a run; a resumed run keeps its row and is marked running again."""
+        self._execute(
+            "INSERT INTO runs (id, started_at, status, input_path, output_dir, mode, editor_model, critic_model) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET status = excluded.status",
+            (run_id, time.time(), RUNNING, input_path, output_dir, mode, editor_model, critic_model),
+        )
+
+    def finish_run(self, run_id: str, status: str = DONE, approved: bool = False, slides: int = 0) -> None:
+        """Close a run; its totals are summed from the recorded iterations."""
+        self._execute(
+            "UPDATE runs SET finished_at = ?, status = ?, approved = ?, slides = ?, "
+            "iterations = (SELECT COUNT(*) FROM iterations WHERE run_id = ?), "
+            "input_tokens = (SELECT COALESCE(SUM(input_tokens), 0) FROM iterations WHERE run_id = ?), "
+            "output_tokens = (SELECT COALESCE(SUM(output_tokens), 0) FROM iterations WHERE run_id = ?), "
+            "cached_tokens = (SELECT COALESCE(SUM(cached_tokens), 0) FROM iterations WHERE run_id = ?), "
+            "cost = (SELECT COALESCE(SUM(cost), 0) FROM iterations WHERE run_id = ?) WHERE id = ?",
+            (time.time(), status, int(approved), slides, run_id, run_id, run_id, run_id, run_id, run_id),
+        )
+
+    def record_iteration(
+        self,
+        run_id: str,
+        metric: Dict[str, Any],
+        slides: int,
+        render_error: Optional[str],
+        approved: bool,
+        feedback: List[dict],
+        review_summary: Optional[dict] = None,
+    ) -> None:
+        """Store an iteration's metrics and feedback items (replacing an earlier record of it)."""
+        iteration = metric["iteration"]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO iterations (run_id, iteration, finished_at, duration, slides, input_tokens, "
+                    "output_tokens, cached_tokens, cost, render_error, approved, review_summary, metrics) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        run_id,
+                        iteration,
+                        time.time(),
+                        metric.get("duration_seconds", 0.0),
+                        slides,
+                        metric.get("input_tokens", 0),
+                        metric.get("output_tokens", 0),
+                        metric.get("cached_tokens", 0),
+                        metric.get("cost", 0.0),
+                        render_error,
+                        int(approved),
+                        json.dumps(review_summary, ensure_ascii=False) if review_summary else None,
+                        json.dumps(metric, ensure_ascii=False, default=str),
+                    ),
+                )
+                self._conn.execute("DELETE FROM feedback WHERE run_id = ? AND iteration = ?", (run_id, iteration))
+                self._conn.executemany(
+                    "INSERT INTO feedback (run_id, iteration, page_index, severity, category, issue, suggestion, details) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            run_id,
+                            iteration,
+                            item.get("page_index") if isinstance(item.get("page_index"), int) else None,
+                            item.get("severity"),
+                            item.get("category"),
+                            item.get("issue"),
+                            item.get("suggestion"),
+                            item.get("details"),
+                        )
+                        for item in feedback
+                    ],
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def record_llm_call(self, run_id: str, iteration: Optional[int], stage: Optional[str], span: Span) -> None:
+        attrs = span.attributes
+        input_tokens = attrs.get("input_tokens", 0)
+        output_tokens = attrs.get("output_tokens", 0)
+        cached_tokens = attrs.get("cached_tokens", 0)
+        cache_hit = bool(attrs.get("cache_hit"))
+        # A response served from the local cache costs nothing.
+        cost = 0.0 if cache_hit else LLMClient.calculate_context_cost(input_tokens, output_tokens, cached_tokens)
+        self._execute(
+            "INSERT INTO llm_calls (run_id, iteration, stage, provider, model, api, started_at, duration, attempt, "
+            "cache_hit, input_tokens, output_tokens, cached_tokens, cost, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                iteration,
+                stage,
+                attrs.get("provider"),
+                attrs.get("model"),
+                attrs.get("api"),
+                _wall_time(span),
+                span.duration,
+                attrs.get("attempt", 1),
+                int(cache_hit),
+                input_tokens,
+                output_tokens,
+                cached_tokens,
+                cost,
+                span.status,
+            ),
+        )
+
+    def record_render(self, run_id: str, iteration: Optional[int], span: Span) -> None:
+        attrs = span.attributes
+        self._execute(
+            "INSERT INTO renders (run_id, iteration, attempt, started_at, duration, slides, rendered, cached, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                iteration,
+                attrs.get("attempt", 1),
+                _wall_time(span),
+                span.duration,
+                attrs.get("slides", 0),
+                attrs.get("rendered", 0),
+                attrs.get("cached", 0),
+                attrs.get("error"),
+            ),
+        )
+
+    # Queries -----------------------------------------------------------------
+
+    def run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM runs WHERE id = ?", (run_id,))
+        return dict(rows[0]) if rows else None
+
+    def iteration_metrics(self, run_id: str) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT metrics FROM iterations WHERE run_id = ? ORDER BY iteration", (run_id,))
+        return [json.loads(row["metrics"]) for row in rows]
+
+    def iteration_feedback(self, run_id: str, iteration: int) -> List[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT page_index, severity, category, issue, suggestion, details FROM feedback "
+            "WHERE run_id = ? AND iteration = ? ORDER BY id",
+            (run_id, iteration),
+        )
+        return [{key: row[key] for key in row.keys() if row[key] is not None} for row in rows]
+
+    def review_summary(self, run_id: str, iteration: int) -> Optional[dict]:
+        rows = self._query(
+            "SELECT review_summary FROM iterations WHERE run_id = ? AND iteration = ?", (run_id, iteration)
+        )
+        return json.loads(rows[0]["review_summary"]) if rows and rows[0]["review_summary"] else None
+
+    def recent_run_ids(self, last: int = 100) -> List[str]:
+        rows = self._query(
+            "SELECT id FROM runs WHERE status != ? ORDER BY started_at DESC LIMIT ?", (RUNNING, last)
+        )
+        return [row["id"] for row in rows]
+
+    def render_latency(self, run_ids: List[str]) -> Dict[str, Any]:
+        """Latency percentiles of successful renders and the render error rate."""
+        placeholders = ",".join("?" * len(run_ids))
+        rows = self._query(
+            f"SELECT duration, error FROM renders WHERE run_id IN ({placeholders})", tuple(run_ids)
+        )
+        latency = percentiles([row["duration"] for row in rows if not row["error"]])
+        latency["errors"] = sum(1 for row in rows if row["error"])
+        latency["renders"] = len(rows)
+        return latency
+
+    def llm_by_model(self, run_ids: List[str]) -> List[Dict[str, Any]]:
+        """Per model: calls, cache hits, tokens, cost, latency percentiles and cost per final slide."""
+        placeholders = ",".join("?" * len(run_ids))
+        rows = self._query(
+            f"SELECT model, COUNT(*) AS calls, SUM(cache_hit) AS cache_hits, SUM(attempt - 1) AS retries, "
+            f"SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens, SUM(cost) AS cost, "
+            f"COUNT(DISTINCT run_id) AS runs FROM llm_calls WHERE run_id IN ({placeholders}) "
+            f"GROUP BY model ORDER BY cost DESC",
+            tuple(run_ids),
+        )
+        result = []
+        for row in rows:
+            model = row["model"]
+            durations = self._query(
+                f"SELECT duration FROM llm_calls WHERE run_id IN ({placeholders}) AND model IS ? AND cache_hit = 0",
+                (*run_ids, model),
+            )
+            slides = self._query(
+                f"SELECT COALESCE(SUM(slides), 0) AS slides FROM runs WHERE id IN "
+                f"(SELECT DISTINCT run_id FROM llm_calls WHERE run_id IN ({placeholders}) AND model IS ?)",
+                (*run_ids, model),
+            )[0]["slides"]
+            entry = dict(row)
+            entry["latency"] = percentiles([item["duration"] for item in durations])
+            entry["slides"] = slides
+            entry["cost_per_slide"] = row["cost"] / slides if slides else None
+            result.append(entry)
+        return result
+
+    def run_summary(self, run_ids: List[str]) -> Dict[str, Any]:
+        """Run counts and slides, with the cost of every LLM call (outline included)."""
+        placeholders = ",".join("?" * len(run_ids))
+        row = self._query(
+            f"SELECT COUNT(*) AS runs, SUM(approved) AS approved, AVG(iterations) AS avg_iterations, "
+            f"SUM(slides) AS slides, MIN(started_at) AS first, MAX(started_at) AS last, "
+            f"(SELECT SUM(cost) FROM llm_calls WHERE run_id IN ({placeholders})) AS cost "
+            f"FROM runs WHERE id IN ({placeholders})",
+            (*run_ids, *run_ids),
+        )[0]
+        return dict(row)
+
+
+def _wall_time(span: Span) -> float:
+    return (span.tracer.wall_start if span.tracer is not None else time.time()) + span.start
+
+
+class RunRecorder:
+    """Tracer listener that records `llm.call` and `render` spans in the run database.
+
+    Each span is attributed to the iteration and pipeline stage it ran under.
+    """
+
+    STAGES = ("outline", "editor", "review")
+
+    def __init__(self, db: RunDB, run_id: str):
+        self.db = db
+        self.run_id = run_id
+        self._scope: Dict[int, tuple] = {}
+
+    def on_start(self, span: Span) -> None:
+        iteration, stage = self._scope.get(span.parent_id, (None, None)) if span.parent_id else (None, None)
+        if span.name == "iteration":
+            iteration = span.attributes.get("iteration")
+        elif span.name in self.STAGES:
+            stage = span.name
+        self._scope[span.span_id] = (iteration, stage)
+
+    def on_end(self, span: Span) -> None:
+        iteration, stage = self._scope.pop(span.span_id, (None, None))
+        if span.name == "llm.call":
+            self.db.record_llm_call(self.run_id, iteration, stage, span)
+        elif span.name == "render":
+            self.db.record_render(self.run_id, iteration, span)
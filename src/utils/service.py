@@ -0,0 +1,265 @@
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from utils.batch import RenderPool
+from utils.job_queue import FINISHED, JobQueue, new_job_id
+from utils.llm_client import set_request_limit
+
+
+# Pipeline options a client may set per job.
+JOB_OPTIONS = {
+    "max_iterations": int,
+    "mode": str,
+    "refine_mode": str,
+    "critic_batch_size": int,
+    "visual_diff": bool,
+}
+_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class PipelineService:
+    """Long-running pipeline runner behind a persistent job queue.
+
+    The process keeps the pooled LLM transport, the image and response caches
+    and the render pool (and its render server) warm between jobs. Up to
+    `llm_concurrency + render_concurrency` jobs run at once; LLM requests are
+    capped at `llm_concurrency` and renders at the pool size.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        pipeline: Callable[..., dict],
+        render_pool: RenderPool,
+        llm_concurrency: int = 4,
+        defaults: Optional[Dict[str, Any]] = None,
+    ):
+        self.root = Path(root)
+        self.jobs_dir = self.root / "jobs"
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.queue = JobQueue(str(self.root / "queue.sqlite3"))
+        self.pipeline = pipeline
+        self.render_pool = render_pool
+        self.llm_concurrency = llm_concurrency
+        self.defaults = defaults or {}
+        self._stop = threading.Event()
+        self._workers: List[threading.Thread] = []
+
+    def start(self) -> int:
+        """Start the workers; returns the number of interrupted jobs that were requeued."""
+        recovered = self.queue.recover()
+        set_request_limit(self.llm_concurrency)
+        for idx in range(max(1, self.llm_concurrency) + self.render_pool.size):
+            worker = threading.Thread(target=self._work, name=f"pipeline-worker-{idx}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return recovered
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        set_request_limit(0)
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        text = payload.get("input_text")
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("input_text is required")
+        options = {}
+        for key, kind in JOB_OPTIONS.items():
+            if payload.get(key) is not None:
+                try:
+                    options[key] = kind(payload[key])
+                except (TypeError, ValueError):
+                    raise ValueError(f"Invalid {key}: {payload[key]!r}")
+        job_id = new_job_id()
+        job_dir = self.jobs_dir / job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+        input_path = job_dir / "input.txt"
+        input_path.write_text(text, encoding="utf-8")
+        name = _NAME_RE.sub("_", str(payload.get("name") or job_id))[:80]
+        return self.queue.submit(name, str(input_path), str(job_dir), options, job_id=job_id)
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            job = self.queue.claim(timeout=1.0)
+            if job is not None:
+                self._run(job)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        options = {**self.defaults, **job["options"]}
+        try:
+            outcome = self.pipeline(
+                input_path=job["input_path"],
+                output_dir=job["output_dir"],
+                interactive=False,
+                runner=self.render_pool.renderer(),
+                on_event=lambda event_type, data: self.queue.add_event(job_id, event_type, data),
+                **options,
+            )
+        except (Exception, SystemExit) as err:
+            self.queue.finish(job_id, error=f"{type(err).__name__}: {err}")
+            return
+        result = {
+            key: outcome.get(key)
+            for key in (
+                "output_dir",
+                "slides_path",
+                "summary_report_path",
+                "approved",
+                "iterations",
+                "elapsed_seconds",
+                "total_input_tokens",
+                "total_output_tokens",
+                "total_cost",
+            )
+        }
+        self.queue.finish(job_id, result=result)
+
+    def slides_path(self, job: Dict[str, Any]) -> Optional[str]:
+        path = (job.get("result") or {}).get("slides_path")
+        return path if path and os.path.exists(path) else None
+
+    def images_dir(self, job: Dict[str, Any]) -> Optional[Path]:
+        output_dir = (job.get("result") or {}).get("output_dir")
+        if not output_dir:
+            return None
+        images = Path(output_dir) / "current" / "images"
+        return images if images.is_dir() else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: PipelineService
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        self._send(status, json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"), "application/json")
+
+    def _error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": message})
+
+    def do_POST(self) -> None:
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            self._error(404, f"Unknown path {self.path}")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        try:
+            if (self.headers.get("Content-Type") or "").startswith("text/plain"):
+                payload: Any = {"input_text": body.decode("utf-8")}
+            else:
+                payload = json.loads(body or b"{}")
+        except ValueError:
+            # JSONDecodeError and UnicodeDecodeError both derive from ValueError.
+            self._error(400, "Body must be UTF-8 JSON or text/plain")
+            return
+        if not isinstance(payload, dict):
+            self._error(400, "JSON body must be an object")
+            return
+        try:
+            job_id = self.service.submit(payload)
+        except ValueError as err:
+            self._error(400, str(err))
+            return
+        self._send_json(202, self.service.queue.get(job_id))
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["health"]:
+            self._send_json(200, {"status": "ok", "jobs": self.service.queue.counts()})
+            return
+        if parts == ["jobs"]:
+            status = (query.get("status") or [None])[0]
+            self._send_json(200, self.service.queue.list_jobs(status=status))
+            return
+        if len(parts) < 2 or parts[0] != "jobs":
+            self._error(404, f"Unknown path {self.path}")
+            return
+        job = self.service.queue.get(parts[1])
+        if job is None:
+            self._error(404, f"Unknown job {parts[1]}")
+            return
+        rest = parts[2:]
+        if not rest:
+            self._send_json(200, job)
+        elif rest == ["events"]:
+            after = int((query.get("after") or ["0"])[0] or 0)
+            if (query.get("follow") or ["1"])[0] in {"0", "false"}:
+                self._send_json(200, self.service.queue.events(job["id"], after=after))
+            else:
+                self._stream_events(job["id"], after)
+        elif rest == ["slides.md"]:
+            path = self.service.slides_path(job)
+            if path is None:
+                self._error(409 if job["status"] not in FINISHED else 404, f"No slides for job in status {job['status']}")
+                return
+            self._send(200, Path(path).read_bytes(), "text/markdown; charset=utf-8")
+        elif rest[0] == "images" and len(rest) <= 2:
+            images = self.service.images_dir(job)
+            if images is None:
+                self._error(409 if job["status"] not in FINISHED else 404, f"No images for job in status {job['status']}")
+                return
+            if len(rest) == 1:
+                self._send_json(200, sorted(path.name for path in images.glob("*.png")))
+                return
+            image = images / os.path.basename(rest[1])
+            if not image.is_file():
+                self._error(404, f"Unknown image {rest[1]}")
+                return
+            self._send(200, image.read_bytes(), "image/png")
+        else:
+            self._error(404, f"Unknown path {self.path}")
+
+    def _stream_events(self, job_id: str, after: int) -> None:
+        """Server-sent events until the job finishes (or the client goes away)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                for event in self.service.queue.events(job_id, after=after):
+                    after = event["seq"]
+                    self.wfile.write(
+                        f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n".encode(
+                            "utf-8"
+                        )
+                    )
+                self.wfile.flush()
+                job = self.service.queue.get(job_id)
+                if job is None or job["status"] in FINISHED:
+                    if not self.service.queue.events(job_id, after=after):
+                        return
+                    continue
+                time.sleep(0.5)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+
+def make_server(service: PipelineService, host: str = "127.0.0.1", port: int = 8700) -> ThreadingHTTPServer:
+    handler = type("PipelineServiceHandler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,61 @@
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from utils.linter import LintIssue, lint_slide
+from utils.slides import Slide, join_slides, split_slides
+
+
+class SlideStreamWriter:
+    """Incrementally writes a streamed deck and lints each slide once it is complete.
+
+    A slide counts as complete as soon as the next slide's separator arrives.
+    The completed prefix of the deck is rewritten to `path` every time a new
+    slide completes, so the candidate file grows while generation continues.
+    """
+
+    def __init__(self, path: str, on_slide: Optional[Callable[[Slide, List[LintIssue]], None]] = None):
+        self.path = path
+        self.on_slide = on_slide
+        self.buffer = ""
+        self.completed: List[Slide] = []
+        self.issues: List[LintIssue] = []
+
+    def _deck_text(self) -> str:
+        text = self.buffer
+        stripped = text.lstrip()
+        if stripped.startswith("```"):
+            # Models sometimes wrap the deck in a ```markdown fence.
+            _, _, text = stripped.partition("\n")
+            body = text.rstrip()
+            if body.endswith("\n```") or body == "```":
+                text = body[: -3]
+        return text
+
+    def feed(self, chunk: str) -> List[Slide]:
+        self.buffer += chunk
+        if "\n" not in chunk:
+            return []
+        slides = split_slides(self._deck_text())
+        ready = slides[:-1]
+        new_slides = ready[len(self.completed) :]
+        if not new_slides:
+            return []
+        self.completed = ready
+        for slide in new_slides:
+            issues = lint_slide(slide)
+            self.issues.extend(issues)
+            if self.on_slide:
+                self.on_slide(slide, issues)
+        Path(self.path).write_text(join_slides(self.completed) + "\n", encoding="utf-8")
+        return new_slides
+
+    def finish(self) -> List[Slide]:
+        slides = split_slides(self._deck_text())
+        remaining = slides[len(self.completed) :]
+        for slide in remaining:
+            issues = lint_slide(slide)
+            self.issues.extend(issues)
+            if self.on_slide:
+                self.on_slide(slide, issues)
+        self.completed = slides
+        return remaining
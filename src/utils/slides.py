@@ -0,0 +1,111 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+_FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})")
+
+
+@dataclass
+class Slide:
+    index: int
+    start_line: int
+    end_line: int
+    raw: str
+    frontmatter: str = ""
+    content: str = ""
+    content_line: int = 0
+    frontmatter_closed: bool = True
+
+    @property
+    def layout(self) -> Optional[str]:
+        return frontmatter_value(self.frontmatter, "layout")
+
+
+def frontmatter_value(frontmatter: str, key: str) -> Optional[str]:
+    for line in frontmatter.splitlines():
+        name, sep, value = line.partition(":")
+        if sep and name.strip() == key:
+            return value.strip().strip("'\"") or None
+    return None
+
+
+def split_slides(markdown: str) -> List[Slide]:
+    """Split a Slidev deck the same way Slidev's parser does.
+
+    A line starting with `---` begins a new slide. If the next line is not
+    blank, everything up to the following `---` line is that slide's
+    frontmatter (the first one is the deck headmatter). Separators inside
+    code fences are ignored. Joining `raw` with newlines gives back the
+    original text.
+    """
+    lines = markdown.split("\n")
+    n = len(lines)
+    slides: List[Slide] = []
+    raw_start = 0
+    content_start = 0
+    fm_range: Optional[tuple] = None
+
+    def push(end: int) -> None:
+        frontmatter = "\n".join(lines[fm_range[0] : fm_range[1]]) if fm_range else ""
+        slides.append(
+            Slide(
+                index=len(slides) + 1,
+                start_line=raw_start + 1,
+                end_line=end,
+                raw="\n".join(lines[raw_start:end]),
+                frontmatter=frontmatter,
+                content="\n".join(lines[content_start:end]),
+                content_line=content_start + 1,
+                frontmatter_closed=fm_range is None or fm_range[1] < n,
+            )
+        )
+
+    i = 0
+    while i < n:
+        line = lines[i].rstrip()
+        if line.startswith("---"):
+            if i > content_start or fm_range is not None:
+                push(i)
+                raw_start = i
+            fm_range = None
+            content_start = i + 1
+            next_line = lines[i + 1] if i + 1 < n else None
+            if line[3:4] != "-" and next_line is not None and next_line.strip():
+                j = i + 1
+                while j < n and lines[j].rstrip() != "---":
+                    j += 1
+                fm_range = (i + 1, min(j, n))
+                content_start = j + 1
+                i = j + 1
+                continue
+            i += 1
+            continue
+        fence = _FENCE_RE.match(line)
+        if fence:
+            marker = fence.group(1)
+            j = i + 1
+            while j < n and not lines[j].strip().startswith(marker):
+                j += 1
+            i = j + 1
+            continue
+        i += 1
+
+    if n > content_start or fm_range is not None or not slides:
+        push(n)
+    elif slides:
+        # Trailing separators with nothing after them belong to the last slide.
+        last = slides[-1]
+        last.raw = "\n".join(lines[last.start_line - 1 : n])
+        last.end_line = n
+    return slides
+
+
+def join_slides(slides: List[Slide]) -> str:
+    return "\n".join(slide.raw for slide in slides)
+
+
+def deck_headmatter(slides: List[Slide]) -> str:
+    if slides and slides[0].start_line == 1 and slides[0].raw.startswith("---"):
+        return slides[0].frontmatter
+    return ""
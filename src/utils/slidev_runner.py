@@ -1,20 +1,73 @@
+import contextvars
 import glob
 import json
 import os
+import re
 import shutil
+import signal
 import subprocess
-from dataclasses import dataclass
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
+
+from utils import tracing
+from utils.diagram_cache import DiagramPrerenderer
+from utils.linter import has_errors, lint_slides
+from utils.render_cache import SlideImageCache
+from utils.render_policy import RenderPolicy, budget_attributes, classify_failure, deck_features
+from utils.render_server import RenderServer, RenderServerError
+from utils.repair import classify_render_error
+from utils.slides import Slide, deck_headmatter, frontmatter_value, split_slides
 
 
 class RenderError(RuntimeError):
-    pass
+    """A failed export. `kind` is the error class (see `utils.repair.classify_render_error`)
+    and `slides` the 1-based pages that failed, when known."""
+
+    def __init__(self, message: str, kind: Optional[str] = None, slides: Optional[List[int]] = None):
+        super().__init__(message)
+        failure = classify_failure(message)
+        self.kind = kind or failure["kind"]
+        self.slides = slides if slides is not None else failure["slides"]
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _default_shards() -> int:
+    configured = os.getenv("RENDER_SHARDS")
+    if configured and configured.strip().isdigit() and int(configured) > 0:
+        return int(configured)
+    return os.cpu_count() or 1
 
 
 @dataclass
 class SlidevRunner:
     work_dir: str
+    use_server: bool = field(default_factory=lambda: _env_flag("SLIDEV_RENDER_SERVER"))
+    server: RenderServer | None = None
+    cache: SlideImageCache | None = None
+    use_cache: bool = True
+    shards: int = field(default_factory=_default_shards)
+    min_slides_per_shard: int = 8
+    last_render_stats: Dict[str, int] = field(default_factory=dict)
+    policy: RenderPolicy | None = None
+    diagrams: DiagramPrerenderer | None = None
+    use_diagrams: bool = True
+
+    def __post_init__(self) -> None:
+        if self.use_server and self.server is None:
+            self.server = RenderServer(work_dir=self.work_dir)
+        if self.use_cache and self.cache is None:
+            self.cache = SlideImageCache.from_env(self.work_dir)
+        if self.policy is None:
+            self.policy = RenderPolicy.from_env(self.work_dir)
+        if self.use_diagrams and self.diagrams is None:
+            self.diagrams = DiagramPrerenderer.from_env(self.work_dir)
 
     def _get_chromium_headless_revision(self) -> str | None:
         browsers_json = Path(self.work_dir) / "node_modules" / "playwright-core" / "browsers.json"
@@ -42,6 +95,252 @@ class SlidevRunner:
 
     def render_slides(self, md_file_path: str, output_dir: str) -> List[str]:
         Path(output_dir).mkdir(parents=True, exist_ok=True)
+        markdown = Path(md_file_path).read_text(encoding="utf-8")
+        export_path, diagram_stats = self._prerender_diagrams(md_file_path, markdown)
+        files = self._render_deck(export_path, output_dir, split_slides(markdown))
+        self.last_render_stats.update(diagram_stats)
+        return files
+
+    def _prerender_diagrams(self, md_file_path: str, markdown: str) -> Tuple[str, Dict[str, int]]:
+        """Inline cached Mermaid/math renders; returns the file to export and diagram stats."""
+        if self.diagrams is None:
+            return md_file_path, {}
+        result = self.diagrams.prerender(markdown)
+        if result.errors:
+            raise RenderError(
+                "Diagram errors (render skipped):\n" + "\n".join(str(error) for error in result.errors),
+                slides=sorted({error.slide for error in result.errors}),
+            )
+        if result.markdown == markdown:
+            return md_file_path, result.stats
+        # Next to the original, so relative assets still resolve.
+        source = Path(md_file_path)
+        export_path = source.with_name(f".{source.stem}.prerendered{source.suffix}")
+        export_path.write_text(result.markdown, encoding="utf-8")
+        return str(export_path), result.stats
+
+    def _render_deck(self, md_file_path: str, output_dir: str, slides: List[Slide]) -> List[str]:
+        # `slides` is the deck as written; `md_file_path` may hold its pre-rendered copy.
+        if not self._is_cacheable(slides):
+            files = self._export(md_file_path, output_dir)
+            self.last_render_stats = {"slides": len(files), "rendered": len(files), "cached": 0}
+            return files
+        if self.cache is None:
+            files = self._export(md_file_path, output_dir, pages=[slide.index for slide in slides])
+            self.last_render_stats = {"slides": len(files), "rendered": len(files), "cached": 0}
+            return files
+
+        headmatter = deck_headmatter(slides)
+        keys = {slide.index: SlideImageCache.slide_key(headmatter, slide, len(slides)) for slide in slides}
+        sources: Dict[int, str] = {}
+        with tempfile.TemporaryDirectory(prefix="slidev_partial_", dir=output_dir) as partial_dir:
+            # Hits are copied out of the shared cache up front; the export only collects partial_dir/*.png.
+            hits_dir = os.path.join(partial_dir, "cached")
+            os.makedirs(hits_dir)
+            for index, key in keys.items():
+                hit_path = os.path.join(hits_dir, f"{index}.png")
+                if self.cache.fetch(key, hit_path):
+                    sources[index] = hit_path
+            missing = [index for index in keys if index not in sources]
+
+            if missing:
+                slide_range = None if len(missing) == len(slides) else missing
+                files = self._export(md_file_path, partial_dir, pages=missing, partial=slide_range is not None)
+                rendered = self._match_rendered(files, missing)
+                if rendered is None:
+                    # Our slide split disagrees with Slidev's; keep its output as-is, uncached.
+                    self._clear_images(output_dir)
+                    if slide_range or len(self._split_shards(missing)) > 1:
+                        files = self._export(md_file_path, output_dir)
+                    else:
+                        files = self._move_all(files, output_dir)
+                    self.last_render_stats = {"slides": len(files), "rendered": len(files), "cached": 0}
+                    return files
+                for index, path in rendered.items():
+                    self.cache.put(keys[index], path)
+                    sources[index] = path
+
+            self._clear_images(output_dir)
+            digits = max(2, len(str(len(slides))))
+            files = []
+            for slide in slides:
+                target = os.path.join(output_dir, f"{slide.index:0{digits}d}.png")
+                shutil.copyfile(sources[slide.index], target)
+                files.append(target)
+
+        if missing:
+            self.cache.evict()
+        self.last_render_stats = {
+            "slides": len(slides),
+            "rendered": len(missing),
+            "cached": len(slides) - len(missing),
+        }
+        return files
+
+    @staticmethod
+    def _is_cacheable(slides: List[Slide]) -> bool:
+        # Imported, hidden or disabled slides shift Slidev's page numbering.
+        for slide in slides:
+            if frontmatter_value(slide.frontmatter, "src"):
+                return False
+            for key in ("hide", "hidden", "disabled"):
+                if (frontmatter_value(slide.frontmatter, key) or "").lower() == "true":
+                    return False
+        return True
+
+    @staticmethod
+    def _page_number(path: str) -> Optional[int]:
+        numbers = re.findall(r"\d+", Path(path).stem)
+        return int(numbers[-1]) if numbers else None
+
+    def _match_rendered(self, files: List[str], expected: List[int]) -> Optional[Dict[int, str]]:
+        by_number = {self._page_number(path): path for path in files}
+        if set(by_number) == set(expected):
+            return {index: by_number[index] for index in expected}
+        return None
+
+    @staticmethod
+    def _move_all(files: List[str], output_dir: str) -> List[str]:
+        moved = []
+        for path in files:
+            target = os.path.join(output_dir, os.path.basename(path))
+            shutil.move(path, target)
+            moved.append(target)
+        return moved
+
+    def _clear_images(self, output_dir: str) -> None:
+        for path in self._collect_images(output_dir):
+            os.remove(path)
+
+    def _export(
+        self,
+        md_file_path: str,
+        output_dir: str,
+        pages: Optional[List[int]] = None,
+        partial: bool = False,
+    ) -> List[str]:
+        slide_range = pages if partial else None
+        with tracing.span("render.export", pages=len(pages) if pages else None, partial=partial) as export:
+            if self.server is not None:
+                try:
+                    export.set(backend="server")
+                    return self._render_with_server(
+                        md_file_path, output_dir, slide_range, concurrency=max(1, self.shards)
+                    )
+                except (RenderServerError, OSError) as err:
+                    if self.server.is_running():
+                        # The server is healthy, so the deck itself failed to render.
+                        failures = getattr(err, "failures", [])
+                        raise RenderError(
+                            str(err), slides=sorted(failure["slide"] for failure in failures) or None
+                        ) from err
+                    # Server could not be started or died; fall back to a one-shot CLI export.
+                    export.set(server_fallback=True)
+            shards = self._split_shards(pages or [])
+            if len(shards) > 1:
+                export.set(backend="cli", shards=len(shards))
+                return self._render_cli_sharded(md_file_path, output_dir, shards)
+            export.set(backend="cli")
+            return self._render_with_cli(md_file_path, output_dir, slide_range)
+
+    def _split_shards(self, pages: List[int]) -> List[List[int]]:
+        if not pages:
+            return []
+        count = min(max(1, self.shards), -(-len(pages) // self.min_slides_per_shard))
+        size = -(-len(pages) // count)
+        return [pages[start : start + size] for start in range(0, len(pages), size)]
+
+    def _render_cli_sharded(self, md_file_path: str, output_dir: str, shards: List[List[int]]) -> List[str]:
+        digits = max(2, len(str(max(page for shard in shards for page in shard))))
+        with tempfile.TemporaryDirectory(prefix="slidev_shards_", dir=output_dir) as shards_root:
+            shard_dirs = [os.path.join(shards_root, f"shard_{idx}") for idx in range(len(shards))]
+            with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+                # Each shard runs in a copy of this context so its spans nest under the export.
+                futures = [
+                    pool.submit(contextvars.copy_context().run, self._render_shard, md_file_path, shard_dir, shard)
+                    for shard, shard_dir in zip(shards, shard_dirs)
+                ]
+                errors: List[RenderError] = []
+                messages: List[str] = []
+                results: List[List[str]] = []
+                for shard, future in zip(shards, futures):
+                    try:
+                        results.append(future.result())
+                    except RenderError as err:
+                        errors.append(err)
+                        messages.append(f"Slides {shard[0]}-{shard[-1]}:\n{err}")
+            if errors:
+                kinds = {err.kind for err in errors}
+                raise RenderError(
+                    "\n\n".join(messages),
+                    kind=kinds.pop() if len(kinds) == 1 else None,
+                    slides=sorted(page for err in errors for page in err.slides),
+                )
+
+            files: List[str] = []
+            for shard_files in results:
+                for path in shard_files:
+                    number = self._page_number(path)
+                    name = f"{number:0{digits}d}.png" if number is not None else os.path.basename(path)
+                    target = os.path.join(output_dir, name)
+                    shutil.move(path, target)
+                    files.append(target)
+        return sorted(files)
+
+    def _render_shard(self, md_file_path: str, output_dir: str, shard: List[int]) -> List[str]:
+        with tracing.span("render.shard", first=shard[0], last=shard[-1], pages=len(shard)):
+            return self._render_with_cli(md_file_path, output_dir, shard)
+
+    def _render_with_server(
+        self,
+        md_file_path: str,
+        output_dir: str,
+        slide_range: Optional[List[int]] = None,
+        concurrency: int = 1,
+    ) -> List[str]:
+        slides = split_slides(Path(md_file_path).read_text(encoding="utf-8"))
+        pages = slide_range
+        features = deck_features(slides, pages)
+        budget = self.policy.budget(features, "server")
+        for attempt in range(1, self.policy.max_attempts + 1):
+            # Pages render concurrently; record the time one page took.
+            workers = max(1, min(concurrency, features.slides))
+            with tracing.span(
+                "render.attempt", attempt=attempt, pages=features.slides, **budget_attributes(budget)
+            ) as attempt_span:
+                started = time.perf_counter()
+                try:
+                    self.server.render(
+                        md_file_path,
+                        output_dir,
+                        timeout_ms=budget.timeout_ms,
+                        wait_ms=budget.wait_ms,
+                        slide_range=pages,
+                        concurrency=concurrency,
+                    )
+                except RenderServerError as err:
+                    timed_out = sorted(
+                        failure["slide"]
+                        for failure in err.failures
+                        if classify_render_error(failure.get("error", "")) == "timeout"
+                    )
+                    attempt_span.set(kind=classify_failure(str(err))["kind"], failed_slides=len(err.failures) or None)
+                    # Only pure per-slide timeouts are retried; anything else is the deck's fault.
+                    if not timed_out or len(timed_out) < len(err.failures) or attempt == self.policy.max_attempts:
+                        raise
+                    elapsed = time.perf_counter() - started
+                    self.policy.record(features, elapsed * workers, "server", timed_out=True)
+                    pages = timed_out
+                    features = deck_features(slides, pages)
+                    budget = self.policy.escalate(budget)
+                    continue
+            self.policy.record(features, (time.perf_counter() - started) * workers, "server")
+            return self._collect_images(output_dir)
+        return self._collect_images(output_dir)
+
+    def _render_with_cli(
+        self, md_file_path: str, output_dir: str, slide_range: Optional[List[int]] = None
+    ) -> List[str]:
         env = os.environ.copy()
         env.setdefault("PLAYWRIGHT_DISABLE_SANDBOX", "1")
         env.setdefault("PLAYWRIGHT_SKIP_VALIDATE_HOST_REQUIREMENTS", "1")
@@ -64,36 +363,79 @@ class SlidevRunner:
         if chromium_path:
             base_cmd.extend(["--executable-path", chromium_path])
 
-        attempts = [
-            {"timeout": "180000", "wait": "2000", "per_slide": False},
-            {"timeout": "300000", "wait": "8000", "per_slide": True},
-        ]
-
-        last_error = ""
-        for attempt in attempts:
-            cmd = base_cmd + ["--timeout", attempt["timeout"], "--wait", attempt["wait"]]
-            if attempt["per_slide"]:
+        slides = split_slides(Path(md_file_path).read_text(encoding="utf-8"))
+        # Page numbers we can check the output against; unknown when Slidev numbers pages differently.
+        expected = slide_range or ([slide.index for slide in slides] if self._is_cacheable(slides) else None)
+        pages = slide_range
+        features = deck_features(slides, pages)
+        budget = self.policy.budget(features, "cli")
+        for attempt in range(1, self.policy.max_attempts + 1):
+            cmd = list(base_cmd)
+            if pages:
+                cmd.extend(["--range", ",".join(str(index) for index in pages)])
+            cmd.extend(["--timeout", str(budget.timeout_ms), "--wait", str(budget.wait_ms)])
+            if budget.per_slide:
                 cmd.append("--per-slide")
-            result = subprocess.run(
-                cmd,
-                cwd=self.work_dir,
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding="utf-8",
-                shell=True,
-            )
-            if result.returncode == 0:
-                last_error = ""
-                break
-            last_error = result.stderr.strip() or result.stdout.strip()
-            if "locator.waitFor" not in last_error and "Timeout" not in last_error:
-                break
+            with tracing.span(
+                "render.attempt", attempt=attempt, pages=features.slides, **budget_attributes(budget)
+            ) as attempt_span:
+                started = time.perf_counter()
+                error = self._run_cli(cmd, env, budget.deadline_seconds)
+                elapsed = time.perf_counter() - started
+                failure = classify_failure(error) if error else None
+                if failure is not None:
+                    attempt_span.set(kind=failure["kind"], failed_slides=len(failure["slides"]) or None)
+            if failure is None:
+                self.policy.record(features, elapsed, "cli")
+                return self._collect_images(output_dir)
+            if failure["kind"] != "timeout" or attempt == self.policy.max_attempts:
+                raise RenderError(error, kind=failure["kind"], slides=failure["slides"] or pages or [])
+            self.policy.record(features, elapsed, "cli", timed_out=True)
+            pages = self._pages_to_retry(output_dir, expected) or slide_range
+            features = deck_features(slides, pages)
+            budget = self.policy.escalate(budget)
+        return self._collect_images(output_dir)
 
-        if last_error:
-            raise RenderError(last_error)
+    def _pages_to_retry(self, output_dir: str, expected: Optional[List[int]]) -> Optional[List[int]]:
+        """Pages a timed-out export did not produce, or None to retry the whole range."""
+        if expected is None:
+            return None
+        present = {self._page_number(path) for path in self._collect_images(output_dir)}
+        missing = [page for page in expected if page not in present]
+        return missing if 0 < len(missing) < len(expected) else None
+
+    def _run_cli(self, cmd: List[str], env: Dict[str, str], deadline_seconds: float) -> str:
+        """Run one export; returns its error output, or "" on success."""
+        process = subprocess.Popen(
+            cmd,
+            cwd=self.work_dir,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            shell=os.name == "nt",
+            # Own process group, so a stuck export's Vite server and browser are killed with it.
+            start_new_session=os.name != "nt",
+        )
+        try:
+            stdout, stderr = process.communicate(timeout=deadline_seconds)
+        except subprocess.TimeoutExpired:
+            try:
+                if os.name != "nt":
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+            except ProcessLookupError:
+                pass
+            process.communicate()
+            return f"Timeout: slidev export did not finish within {deadline_seconds:.0f}s"
+        if process.returncode == 0:
+            return ""
+        return stderr.strip() or stdout.strip() or f"slidev export exited with code {process.returncode}"
 
+    @staticmethod
+    def _collect_images(output_dir: str) -> List[str]:
         patterns = ["*.png", "*.PNG"]
         files: List[str] = []
         for pattern in patterns:
@@ -101,10 +443,12 @@ class SlidevRunner:
         files.sort()
         return files
 
+    def shutdown_server(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+
     @staticmethod
     def check_syntax(code: str) -> bool:
         if not code.strip():
             return False
-        if "---" not in code:
-            return False
-        return True
+        return not has_errors(lint_slides(code))
@@ -0,0 +1,256 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    # Seconds since the tracer was created.
+    start: float
+    duration: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    # Track the span is drawn on: the asyncio task or thread that opened it.
+    lane: str = ""
+    status: str = "ok"
+    ended: bool = False
+    tracer: Optional["Tracer"] = field(default=None, repr=False, compare=False)
+
+    def set(self, **attributes: Any) -> "Span":
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start, 6),
+            "duration": round(self.duration, 6),
+            "lane": self.lane,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+_current_tracer: ContextVar[Optional["Tracer"]] = ContextVar("current_tracer", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _lane() -> str:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return f"task-{id(task):x}"
+    return f"thread-{threading.get_native_id()}"
+
+
+class Tracer:
+    """Collects nested timing spans for one run.
+
+    Spans nest through context variables, so concurrent asyncio tasks get the
+    right parent. Finished spans are appended to `event_log` (JSONL) as they
+    end, and `export_chrome` writes a trace viewable in Perfetto or
+    chrome://tracing.
+    """
+
+    def __init__(self, event_log: Optional[str] = None):
+        self.event_log = event_log
+        self.spans: List[Span] = []
+        self.wall_start = time.time()
+        self._origin = time.perf_counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._tokens: Dict[int, tuple] = {}
+        # Objects with on_start(span) / on_end(span), e.g. the stage profiler.
+        self.listeners: List[Any] = []
+
+    # Lifecycle ----------------------------------------------------------
+
+    def activate(self) -> Token:
+        return _current_tracer.set(self)
+
+    @staticmethod
+    def deactivate(token: Token) -> None:
+        _current_tracer.reset(token)
+
+    def start(self, name: str, activate: bool = True, **attributes: Any) -> Span:
+        """Open a span under the current one. With `activate`, spans opened
+        until `end` nest under it; pass False for spans that end in another
+        context (e.g. inside a generator)."""
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            span_id=next(self._ids),
+            parent_id=parent.span_id if parent is not None else None,
+            start=time.perf_counter() - self._origin,
+            lane=_lane(),
+            tracer=self,
+        ).set(**attributes)
+        if activate:
+            self._tokens[span.span_id] = (_current_span.set(span), _current_tracer.set(self))
+        for listener in self.listeners:
+            listener.on_start(span)
+        return span
+
+    def end(self, span: Span, error: Optional[BaseException] = None) -> Span:
+        if span.ended:
+            return span
+        span.duration = time.perf_counter() - self._origin - span.start
+        span.ended = True
+        if error is not None:
+            span.status = "error"
+            span.attributes["error"] = f"{type(error).__name__}: {error}"[:500]
+        # Listeners see the final duration and status; their own work is not timed.
+        for listener in self.listeners:
+            listener.on_end(span)
+        tokens = self._tokens.pop(span.span_id, None)
+        if tokens is not None:
+            try:
+                _current_span.reset(tokens[0])
+                _current_tracer.reset(tokens[1])
+            except ValueError:
+                # Ended from a different context; the opener's context is left as is.
+                pass
+        with self._lock:
+            self.spans.append(span)
+            if self.event_log:
+                with open(self.event_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        span = self.start(name, **attributes)
+        try:
+            yield span
+        except BaseException as err:
+            self.end(span, error=err)
+            raise
+        self.end(span)
+
+    # Queries -------------------------------------------------------------
+
+    def descendants(self, span: Span) -> List[Span]:
+        with self._lock:
+            spans = list(self.spans)
+        children: Dict[int, List[Span]] = {}
+        for item in spans:
+            if item.parent_id is not None:
+                children.setdefault(item.parent_id, []).append(item)
+        found: List[Span] = []
+        pending = list(children.get(span.span_id, []))
+        while pending:
+            item = pending.pop()
+            found.append(item)
+            pending.extend(children.get(item.span_id, []))
+        return sorted(found, key=lambda item: item.start)
+
+    def totals(self, parent: Optional[Span] = None, names: Optional[List[str]] = None) -> Dict[str, float]:
+        """Summed duration per span name (under `parent` if given)."""
+        if parent is not None:
+            spans = self.descendants(parent)
+        else:
+            with self._lock:
+                spans = list(self.spans)
+        result: Dict[str, float] = {}
+        for item in spans:
+            if names is None or item.name in names:
+                result[item.name] = result.get(item.name, 0.0) + item.duration
+        return result
+
+    def find(self, name: str, **attributes: Any) -> List[Span]:
+        with self._lock:
+            spans = list(self.spans)
+        return [
+            item
+            for item in spans
+            if item.name == name and all(item.attributes.get(key) == value for key, value in attributes.items())
+        ]
+
+    # Export ----------------------------------------------------------------
+
+    def export_jsonl(self, path: str) -> str:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda item: item.start)
+        with open(path, "w", encoding="utf-8") as f:
+            for item in spans:
+                f.write(json.dumps(item.to_dict(), ensure_ascii=False, default=str) + "\n")
+        return path
+
+    def export_chrome(self, path: str) -> str:
+        """Chrome trace event format: one complete ("X") event per span."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda item: item.start)
+        lanes: Dict[str, int] = {}
+        events: List[Dict[str, Any]] = []
+        pid = os.getpid()
+        for item in spans:
+            tid = lanes.setdefault(item.lane, len(lanes) + 1)
+            events.append(
+                {
+                    "name": item.name,
+                    "cat": item.name.split(".")[0],
+                    "ph": "X",
+                    "ts": round(item.start * 1_000_000, 3),
+                    "dur": round(item.duration * 1_000_000, 3),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {**item.attributes, "span_id": item.span_id, "parent_id": item.parent_id},
+                }
+            )
+        for lane, tid in lanes.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": lane}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+        return path
+
+
+class _NoopSpan(Span):
+    def set(self, **attributes: Any) -> "Span":
+        return self
+
+
+_NOOP = _NoopSpan(name="", span_id=0, parent_id=None, start=0.0)
+
+
+def current_tracer() -> Optional[Tracer]:
+    return _current_tracer.get()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Open a span on the active tracer; a no-op when tracing is not active."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield _NOOP
+        return
+    with tracer.span(name, **attributes) as active:
+        yield active
+
+
+def start_span(name: str, activate: bool = True, **attributes: Any) -> Span:
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return _NOOP
+    return tracer.start(name, activate=activate, **attributes)
+
+
+def end_span(active: Span, error: Optional[BaseException] = None) -> None:
+    if active.tracer is not None:
+        active.tracer.end(active, error=error)
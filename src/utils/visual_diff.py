@@ -0,0 +1,98 @@
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageChops
+
+
+@dataclass
+class SlideDiff:
+    # 1-based slide numbers in the current render that must be reviewed again.
+    changed: List[int] = field(default_factory=list)
+    # current slide number -> previous slide number for visually identical slides.
+    unchanged: Dict[int, int] = field(default_factory=dict)
+
+
+def dhash(image_path: str, hash_size: int = 16) -> int:
+    """Difference hash: compares neighbouring pixels of a downscaled grayscale image."""
+    with Image.open(image_path) as image:
+        small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def same_pixels(first_path: str, second_path: str, tolerance: int = 32) -> bool:
+    """True when no pixel differs by more than `tolerance` (ignores anti-aliasing noise)."""
+    with Image.open(first_path) as first, Image.open(second_path) as second:
+        if first.size != second.size:
+            return False
+        delta = ImageChops.difference(first.convert("L"), second.convert("L"))
+    return delta.point(lambda value: 255 if value > tolerance else 0).getbbox() is None
+
+
+def _fingerprint(image_path: str, hash_size: int) -> tuple[str, int]:
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return digest, dhash(image_path, hash_size)
+
+
+def diff_slides(
+    current: List[str],
+    previous: List[str],
+    threshold: Optional[int] = None,
+    hash_size: int = 16,
+) -> SlideDiff:
+    """Match current slide images against the previous render.
+
+    A slide is unchanged when its bytes are identical to a previous slide, or
+    when its dHash is within `threshold` bits and a pixel comparison confirms
+    it (the hash alone misses small text edits). Slides at the same position
+    are preferred, so moved slides still match after insertions or deletions.
+    """
+    if threshold is None:
+        threshold = int(os.getenv("VISUAL_DIFF_THRESHOLD", "2") or 2)
+    previous = [path for path in previous if os.path.exists(path)]
+    previous_prints = [_fingerprint(path, hash_size) for path in previous]
+    result = SlideDiff()
+    used = set()
+    for idx, path in enumerate(current, start=1):
+        digest, value = _fingerprint(path, hash_size)
+        candidates = [idx - 1] + [pos for pos in range(len(previous_prints)) if pos != idx - 1]
+        match = None
+        for pos in candidates:
+            if pos in used or not 0 <= pos < len(previous_prints):
+                continue
+            prev_digest, prev_value = previous_prints[pos]
+            if prev_digest == digest or (
+                bin(prev_value ^ value).count("1") <= threshold and same_pixels(path, previous[pos])
+            ):
+                match = pos
+                break
+        if match is None:
+            result.changed.append(idx)
+        else:
+            used.add(match)
+            result.unchanged[idx] = match + 1
+    return result
+
+
+def carry_forward_feedback(feedback: List[Dict], unchanged: Dict[int, int]) -> List[Dict]:
+    """Re-target earlier per-slide feedback at unchanged slides' current numbers."""
+    by_page: Dict[int, List[Dict]] = {}
+    for item in feedback:
+        page = item.get("page_index")
+        if isinstance(page, str) and page.strip().isdigit():
+            page = int(page)
+        if isinstance(page, int):
+            by_page.setdefault(page, []).append(item)
+    carried: List[Dict] = []
+    for current, previous in sorted(unchanged.items()):
+        for item in by_page.get(previous, []):
+            carried.append({**item, "page_index": current, "carried_forward": True})
+    return carried